@@ -0,0 +1,242 @@
+# Benchmarks that run without hardware (simulated xArm), from the repository root:
+#   python -m benchmarks.bench --output results.json
+#   python -m benchmarks.bench --baseline results.json
+
+from lib.transport import SimulatedTransport
+from lib import servo_controller
+from lib.protocol import FrameEncoder, FrameBatch, encode_positions_into, parse_positions
+from lib.cartesian import compute_ik, compute_ik_incremental, compute_fk, compute_fk_many, inverse_k
+from lib.inverse_kinematics import FREE_ANGLE
+
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+
+
+def _targets(count: int, low: tuple, high: tuple, seed=0) -> list:
+
+    generator = random.Random(seed)
+    return [tuple(generator.uniform(lo, hi) for lo, hi in zip(low, high)) for _ in range(count)]
+
+
+def _solve_all(targets: list, approach_angle: float) -> None:
+
+    for target in targets:
+        try:
+            compute_ik(target, 500, approach_angle)
+        except ValueError:
+            pass
+
+
+def bench_ik_reachable(count: int):
+
+    targets = [t for t in _targets(count * 4, (50, -150, 0), (200, 150, 200)) if _reachable(t, 0)][:count]
+    return len(targets), lambda: _solve_all(targets, 0)
+
+
+def bench_ik_unreachable(count: int):
+
+    targets = _targets(count, (400, -400, 300), (600, 400, 500))
+    return count, lambda: _solve_all(targets, FREE_ANGLE)
+
+
+def bench_ik_free_angle(count: int):
+
+    targets = _targets(count, (-250, -250, -50), (250, 250, 250), seed=1)
+
+    def run():
+        # Cold start for each run
+        inverse_k._currentPhi = -2 * math.pi
+        _solve_all(targets, FREE_ANGLE)
+
+    return count, run
+
+
+def bench_ik_incremental(count: int):
+
+    # Jog steps of a few millimeters from a known pose
+    start = compute_ik((150, 0, 100))
+    targets = [(150 + dx, dy, 100 + dz) for dx, dy, dz in _targets(count, (-3, -3, -3), (3, 3, 3), seed=2)]
+
+    return count, lambda: [compute_ik_incremental(target, start) for target in targets]
+
+
+def bench_plan(count: int):
+
+    from lib.planner import plan
+
+    targets = [t for t in _targets(count * 4, (80, -150, 0), (220, 150, 150), seed=3) if _reachable(t, FREE_ANGLE)][:count]
+    return 1, lambda: plan(targets, start=(500, 500, 500, 500, 500))
+
+
+def bench_fk(count: int):
+
+    joints = [tuple(random.Random(i).randint(200, 800) for _ in range(5)) for i in range(count)]
+    return count, lambda: [compute_fk(joint) for joint in joints]
+
+
+def bench_fk_many(count: int):
+
+    joints = [tuple(random.Random(i).randint(200, 800) for _ in range(5)) for i in range(count)]
+    return count, lambda: compute_fk_many(joints)
+
+
+def bench_encode(count: int):
+
+    encoder = FrameEncoder()
+    servos_id = (6, 5, 4, 3, 2)
+    positions = (500, 400, 300, 600, 500)
+
+    def run():
+        for _ in range(count):
+            encoder.move(servos_id, positions, 1000)
+
+    return count, run
+
+
+def bench_encode_batch(count: int):
+
+    frames = [((6, 5, 4, 3, 2), (500, 400 + i % 100, 300, 600, 500), 20) for i in range(count)]
+    return count, lambda: FrameBatch(frames)
+
+
+def bench_decode(count: int):
+
+    reply = bytearray(64)
+    servos_id = (6, 5, 4, 3, 2, 1)
+    encode_positions_into(reply, 0, servos_id, (500, 400, 300, 600, 500, 200))
+
+    def run():
+        for _ in range(count):
+            parse_positions(reply, servos_id)
+
+    return count, run
+
+
+def bench_movel(count: int):
+
+    from lib import arm
+
+    def run():
+        for _ in range(count):
+            arm.movel((100, 0, 100), 100)
+            arm.movel((150, 40, 150), 1000, waypoints=10)
+
+    return count, run
+
+
+def _reachable(target: tuple, approach_angle: float) -> bool:
+
+    try:
+        compute_ik(target, 500, approach_angle)
+    except ValueError:
+        return False
+    return True
+
+
+BENCHMARKS = {
+    "ik_reachable": (bench_ik_reachable, 2000),
+    "ik_unreachable": (bench_ik_unreachable, 200),
+    "ik_free_angle": (bench_ik_free_angle, 200),
+    "ik_incremental": (bench_ik_incremental, 2000),
+    "plan": (bench_plan, 300),
+    "fk": (bench_fk, 5000),
+    "fk_many": (bench_fk_many, 5000),
+    "frame_encode": (bench_encode, 20000),
+    "frame_encode_batch": (bench_encode_batch, 5000),
+    "frame_decode": (bench_decode, 20000),
+    "movel_planning": (bench_movel, 20),
+}
+
+
+def run(names: list, repeat: int) -> dict:
+
+    # Stand-in device, sleeps only advance the simulated clock
+    servo_controller.set_transport(SimulatedTransport(time_scale=math.inf))
+
+    results = dict()
+    for name in names:
+        setup, count = BENCHMARKS[name]
+        operations, function = setup(count)
+
+        timings = list()
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        results[name] = {
+            "operations": operations,
+            "best_s": best,
+            "median_s": statistics.median(timings),
+            "ops_per_s": operations / best,
+        }
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+
+    """Return the names of the benchmarks slower than baseline by more than tolerance"""
+
+    regressions = list()
+    for name, result in results.items():
+        if name not in baseline or not baseline[name]["ops_per_s"]:
+            continue
+
+        ratio = result["ops_per_s"] / baseline[name]["ops_per_s"]
+        result["baseline_ratio"] = ratio
+
+        if ratio < 1 - tolerance:
+            regressions.append(name)
+
+    return regressions
+
+
+def main() -> int:
+
+    parser = argparse.ArgumentParser(description="xArm benchmarks (no hardware needed)")
+    parser.add_argument("names", nargs="*", default=list(BENCHMARKS), help="benchmarks to run (default all)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="allowed slowdown compared to baseline (0.1 = 10%%)")
+
+    args = parser.parse_args()
+
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = run(args.names, args.repeat)
+
+    regressions = list()
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file)["results"], args.tolerance)
+
+    report = {
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "results": results,
+        "regressions": regressions,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    json.dump(report, sys.stdout, indent=2)
+    print()
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
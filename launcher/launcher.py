@@ -3,22 +3,24 @@ from tkinter import ttk
 from tkinter.messagebox import *
 
 from lib.cartesian import *
+from lib.servo_controller import set_transport, get_transport, open_transport
+from lib.telemetry import TelemetryPoller
+from lib.daemon import ensure_daemon
+from lib import compiler
+from lib import worker
 
 import threading
-import subprocess
 import sys
 import os
 import time
-import hid
-import struct
 
 
-FRAME_HEADER = 0x55
-CMD_SERVO_MOVE = 0x03
-CMD_MULT_SERVO_UNLOAD = 0x14
-CMD_MULT_SERVO_POS_READ = 0x15
-
 RASPBERRY_PI = sys.platform == "linux"
+
+# JOINTS view: samples per second (None for as fast as the bus answers), UI refresh period and FK trail length
+TELEMETRY_RATE = 20
+REFRESH_PERIOD = 50
+TRAIL_LENGTH = 40
 # sys.stderr = open("error_log.txt", "a")
 
 
@@ -30,14 +32,24 @@ class Launcher(Tk):
 
         super(Launcher, self).__init__()
 
-        self.device = hid.device()
-
         self.process = None
         self.joints_pos = [IntVar() for _ in range(6)]
+        self.joints_vel = [StringVar() for _ in range(6)]
         self.points_pos = [IntVar() for _ in range(3)]
-        self.exit_joints_loop = False
+        self.telemetry = None
+        self.last_sample = None
         self.stop_pressed = False
 
+        # The daemon owns the xArm, the JOINTS view and the apps are its clients
+        self.daemon = ensure_daemon()
+
+        # Imports and device already done when START is pressed
+        self.worker = worker.spawn()
+
+        # Apps that opted in are compiled in the background, one at a time (source hash tried for each app)
+        self.compiling = None
+        self.compiled = dict()
+
         self.title("xArm Launcher")
 
         if RASPBERRY_PI:
@@ -95,7 +107,26 @@ class Launcher(Tk):
         self.rowconfigure(1, weight=1)
         self.rowconfigure(2, weight=1)
 
-        self.mainloop()
+        try:
+            self.mainloop()
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+
+        """Stop the processes started by the launcher"""
+
+        if self.compiling is not None:
+            self.compiling.terminate()
+            self.compiling.wait()
+
+        worker.dismiss(self.worker)
+
+        # A daemon that was already running belongs to someone else
+        if self.daemon is not None:
+            self.daemon.terminate()
+            self.daemon.wait()
+            self.daemon = None
 
     def update_apps_list(self):
 
@@ -106,14 +137,48 @@ class Launcher(Tk):
         # Clear all items
         self.listbox.delete(0, END)
 
-        for app in os.listdir("xArm/apps" if RASPBERRY_PI else "../apps"):
+        apps = os.listdir("xArm/apps" if RASPBERRY_PI else "../apps")
+        for app in apps:
             self.listbox.insert(END, app)
 
         self.listbox.select_set(selected[0])
 
+        self.precompile(apps)
+
         # Refresh every 5 seconds
         self.listbox.after(5000, self.update_apps_list)
 
+    @staticmethod
+    def app_path(app):
+        return f"xArm/apps/{app}/main.py" if RASPBERRY_PI else f"../apps/{app}/main.py"
+
+    def precompile(self, apps):
+
+        # Never while compiling or while an app runs
+        if self.compiling is not None and self.compiling.poll() is None:
+            return
+        if self.process is not None and self.process.poll() is None:
+            return
+
+        for app in apps:
+            path = self.app_path(app)
+
+            try:
+                if not compiler.compile_enabled(path):
+                    continue
+
+                # Tried once per version of the sources, even if it failed
+                source = compiler.source_hash(path)
+                if self.compiled.get(path) == source:
+                    continue
+                self.compiled[path] = source
+
+                if not compiler.is_compiled(path):
+                    self.compiling = worker.precompile(path)
+                    return
+            except OSError:
+                continue
+
     def main_menu(self):
 
         self.listbox.grid(column=0, row=1, rowspan=3, padx=10, pady=10, sticky=N+S+E+W)
@@ -133,7 +198,8 @@ class Launcher(Tk):
             f = Frame(self.joints_frame)
             Label(f, text=f"Joint {joint + 1}: ", font="Arial 12").grid(column=0, row=0, sticky=N+S+E+W)
             Label(f, textvariable=self.joints_pos[joint], font="Arial 15", relief=GROOVE, padx=5, pady=5).grid(column=1, row=0, sticky=N+S+E+W)
-            f.grid(column=joint % 3, row=joint // 3, padx=10, pady=10)
+            Label(f, textvariable=self.joints_vel[joint], font="Arial 9", fg="grey").grid(column=1, row=1)
+            f.grid(column=joint % 3, row=joint // 3, padx=10, pady=5)
 
             self.joints_frame.columnconfigure(joint % 3, weight=1)
             self.joints_frame.rowconfigure(joint // 3, weight=1)
@@ -150,76 +216,90 @@ class Launcher(Tk):
             self.points_frame.columnconfigure(point, weight=1)
             self.points_frame.rowconfigure(0, weight=1)
 
-        self.points_frame.grid(column=0, row=2, padx=80, pady=(10, 0), sticky=N+S+E+W)
+        # End effector trail seen from above
+        self.trail = Canvas(self.points_frame, width=80, height=50, highlightthickness=0)
+        self.trail.grid(column=3, row=0, padx=5)
+
+        self.points_frame.grid(column=0, row=2, padx=40, pady=(5, 0), sticky=N+S+E+W)
 
-        self.back_button.grid(column=0, row=3, pady=15)
+        self.back_button.grid(column=0, row=3, pady=10)
 
         # Connect to xArm
         try:
-            self.device.open(0x0483, 0x5750)  # LOBOT VendorID/ProductID
+            set_transport(open_transport())
         except OSError:
             showerror("Error", "Unable to connect to xArm (open failed)")
         else:
-            print(f"Manufacturer: {self.device.get_manufacturer_string()}")
-            print(f"Product: {self.device.get_product_string()}")
-            print(f"Serial No: {self.device.get_serial_number_string()}")
-
-            self.exit_joints_loop = False
-            threading.Thread(target=self.get_joints_pos, daemon=True).start()
+            # Polled on its own thread, the UI only reads the last samples
+            self.last_sample = None
+            self.telemetry = TelemetryPoller(rate=TELEMETRY_RATE, size=max(TRAIL_LENGTH * 2, 64))
+            self.telemetry.start()
+            self.after(REFRESH_PERIOD, self.refresh_joints)
 
     def exit_joints_menu(self):
 
-        self.exit_joints_loop = True
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
 
-        self.device.close()
+            get_transport().close()
+            set_transport(None)
 
         self.joints_frame.grid_forget()
         self.points_frame.grid_forget()
         self.back_button.grid_forget()
+        self.state_label.config(text="IDLE", fg="grey")
 
         self.main_menu()
 
-    def get_joints_pos(self):
+    def refresh_joints(self):
 
-        while not self.exit_joints_loop:
-            buf = bytearray(12)
+        # Left the JOINTS view
+        if self.telemetry is None:
+            return
 
-            buf[0] = 0x00  # Hid id
-            buf[1] = FRAME_HEADER
-            buf[2] = FRAME_HEADER
-            buf[3] = 9
-            buf[4] = CMD_MULT_SERVO_POS_READ
-            buf[5] = 6
+        sample = self.telemetry.buffer.latest()
 
-            for index, servo in enumerate((6, 5, 4, 3, 2, 1)):
-                buf[6 + index] = servo
+        if sample is not None and sample is not self.last_sample:
+            if self.last_sample is None or sample.positions != self.last_sample.positions:
+                for joint, pos in zip(self.joints_pos, sample.positions):
+                    joint.set(pos)
 
-            self.device.write(buf)
-            time.sleep(0.2)
+                for point, pos in zip(self.points_pos, compute_fk(sample.positions)):
+                    point.set(pos)
 
-            data = bytearray(self.device.read(64))
-            if data[:2] != b"\x55\x55" or data is None:
-                raise ValueError("data don't match with what excepted")
+                self.draw_trail()
 
-            positions = list()
-            for i in range(6):
-                pos = data[5 + (i * 3):8 + (i * 3)]
-                pos = struct.unpack("<H", pos[1:])
+            velocities = sample.velocities or (0, ) * len(sample.positions)
+            for joint, velocity in zip(self.joints_vel, velocities):
+                text = f"{velocity:+.0f}/s"
+                if joint.get() != text:
+                    joint.set(text)
 
-                positions.append(pos[0])
+            self.last_sample = sample
 
-            for joint, pos in zip(self.joints_pos, positions):
-                joint.set(pos)
-                self.update()
-                if not 0 <= pos <= 1000:
-                    showerror("Error", f"Unexpected value {pos}")
+        state = f"{self.telemetry.errors} ERR" if self.telemetry.errors else "IDLE"
+        if self.state_label.cget("text") != state:
+            self.state_label.config(text=state, fg="red" if self.telemetry.errors else "grey")
 
-            points = compute_fk(tuple(positions))
-            for point, pos in zip(self.points_pos, points):
-                point.set(pos)
+        self.after(REFRESH_PERIOD, self.refresh_joints)
 
-            # Refresh rate
-            time.sleep(1)
+    def draw_trail(self):
+
+        points = [compute_fk(sample.positions) for sample in self.telemetry.buffer.last(TRAIL_LENGTH)]
+
+        # Top view, the base is at the bottom center of the canvas
+        width, height = int(self.trail.cget("width")), int(self.trail.cget("height"))
+        scale = height / 350
+        coords = list()
+        for x, y, _ in points:
+            coords += (width / 2 - y * scale, height - x * scale)
+
+        self.trail.delete("all")
+        if len(coords) >= 4:
+            self.trail.create_line(*coords, fill="blue")
+        if coords:
+            self.trail.create_oval(coords[-2] - 2, coords[-1] - 2, coords[-2] + 2, coords[-1] + 2, fill="red", outline="")
 
     def start(self):
         if RASPBERRY_PI:
@@ -245,8 +325,18 @@ class Launcher(Tk):
 
     def running(self):
 
-        selected_app = self.listbox.get(self.listbox.curselection())
-        self.process = subprocess.Popen([sys.executable, f"xArm/apps/{selected_app}/main.py" if RASPBERRY_PI else f"../apps/{selected_app}/main.py"])
+        app = self.app_path(self.listbox.get(self.listbox.curselection()))
+
+        if self.worker.poll() is not None:
+            self.worker = worker.spawn()
+
+        # Apps that opted in stream the frames compiled in the background (see precompile)
+        self.process = self.worker
+        worker.submit(self.process, app)
+
+        # The next worker warms up while the app runs
+        self.worker = worker.spawn()
+
         self.process.wait()
 
         self.stop_button.config(state=DISABLED)
@@ -1,6 +1,10 @@
 from lib.servo_controller import *
 from lib.cartesian import compute_ik, compute_fk
 from lib.inverse_kinematics import FREE_ANGLE
+from lib import instrumentation
+from lib.streaming import stream
+from lib import paths
+from lib.trajectory import Trajectory, MAX_VELOCITY, MAX_ACCELERATION
 
 import math
 
@@ -42,18 +46,19 @@ def grip_close(value=650) -> None:
     move_servo(1, value, int(1000 / speed))
 
 
-def movej(joint: tuple, time: int) -> None:
+def movej(joint: tuple, time: int, wait=True) -> None:
     """
     Move each servomotors to joint position within time.
 
     :param joint: tuple(j1, j2, j3, j4, j5) | jx: 0-1000
     :param time: 0-65535 milliseconds
+    :param wait: True, False or "feedback" to return as soon as the arm reached joint (see move_servos)
     """
 
-    move_servos((2, 3, 4, 5, 6), joint[::-1], int(time / speed))
+    move_servos((2, 3, 4, 5, 6), joint[::-1], int(time / speed), wait)
 
 
-def movel(point: tuple, time: int, hand_orientation=500, approach_angle=FREE_ANGLE, waypoints=1) -> None:
+def movel(point: tuple, time: int, hand_orientation=500, approach_angle=FREE_ANGLE, waypoints=1, tolerance=None) -> None:
     """
     Move arm to point position within time.
 
@@ -62,24 +67,110 @@ def movel(point: tuple, time: int, hand_orientation=500, approach_angle=FREE_ANG
     :param hand_orientation: orientation of the hand
     :param approach_angle: calculates the angles considering a specific approach angle (degrees)
     :param waypoints: number of points through which the arm will pass (Allows a more linear movement)
+    :param tolerance: max distance (mm) between the tool and the line, the waypoints are then chosen automatically
+    """
+
+    instrumented = instrumentation.enabled
+    if instrumented:
+        start = instrumentation.clock()
+
+    if tolerance is not None:
+        current = get_position(source="auto")
+        report = _stream_path(paths.line(compute_fk(current, rounded=False), point), current, time, hand_orientation, approach_angle, tolerance)
+    else:
+        current = get_position(cartesian=True, source="auto") if waypoints > 1 else None
+
+        # Waypoints IK are computed while the previous segment is in flight
+        report = stream(movel_targets(point, current, hand_orientation, approach_angle, waypoints), int(time / waypoints / speed))
+
+    if instrumented:
+        instrumentation.span("movel", start)
+        instrumentation.record("movel.max_lateness", report.max_lateness * 1e6)
+
+
+def movec(via: tuple, point: tuple, time: int, hand_orientation=500, approach_angle=FREE_ANGLE, tolerance=1.0):
+    """
+    Move arm along the circular arc that starts at its position, passes through via and ends at point.
+
+    :param via: tuple(x, y, z)
+    :param point: tuple(x, y, z)
+    :param time: 0-65535 milliseconds
+    :param hand_orientation: orientation of the hand
+    :param approach_angle: calculates the angles considering a specific approach angle (degrees)
+    :param tolerance: max distance (mm) between the tool and the arc
+    :return: StreamReport
+    """
+
+    current = get_position(source="auto")
+    path = paths.arc(compute_fk(current, rounded=False), via, point)
+
+    return _stream_path(path, current, time, hand_orientation, approach_angle, tolerance)
+
+
+def _stream_path(path, current: tuple, time: int, hand_orientation: int, approach_angle: float, tolerance: float):
+
+    # Fewest segments within tolerance, at constant speed along the path
+    if approach_angle != FREE_ANGLE:
+        approach_angle = math.radians(approach_angle)
+
+    segments = paths.segment(path, current, tolerance, hand_orientation, approach_angle)
+    joints, durations = paths.timed(segments, time / speed)
+
+    return stream(joints, durations)
+
+
+def movel_targets(point: tuple, current, hand_orientation=500, approach_angle=FREE_ANGLE, waypoints=1):
+    """
+    Yield the servos positions of each waypoint of a linear move.
+
+    :param point: tuple(x, y, z)
+    :param current: tuple(x, y, z) start of the move (only needed if waypoints > 1)
+    :param hand_orientation: orientation of the hand
+    :param approach_angle: approach angle (degrees)
+    :param waypoints: number of points through which the arm will pass
+    :return: generator of tuple(j1, j2, j3, j4, j5) | jx: 0-1000
     """
 
     if approach_angle != FREE_ANGLE:
         approach_angle = math.radians(approach_angle)
 
     if waypoints > 1:
-        current = get_position(cartesian=True)
-        step_values = [abs(p - c) / waypoints for p, c in zip(point, current)]
+        step_values = [(p - c) / waypoints for p, c in zip(point, current)]
 
-        iks = list()
         for i in range(1, waypoints + 1):
             way = (current[0] + (i * step_values[0]), current[1] + (i * step_values[1]), current[2] + (i * step_values[2]))
-            iks.append(compute_ik(way, hand_orientation, approach_angle))
-
-        for ik in iks:
-            move_servos((6, 5, 4, 3, 2), ik, int(time / waypoints / speed))
+            yield compute_ik(way, hand_orientation, approach_angle)
     else:
-        move_servos((6, 5, 4, 3, 2), compute_ik(point, hand_orientation, approach_angle), int(time / speed))
+        yield compute_ik(point, hand_orientation, approach_angle)
+
+
+def movep(targets: list, max_velocity=MAX_VELOCITY, max_acceleration=MAX_ACCELERATION, hand_orientation=500, approach_angle=FREE_ANGLE, period=40):
+    """
+    Move arm through targets without stopping, as fast as the velocity and acceleration limits allow.
+
+    :param targets: list of tuple(x, y, z) or tuple(j1, j2, j3, j4, j5)
+    :param max_velocity: servo units per second, scalar or tuple(j1, j2, j3, j4, j5)
+    :param max_acceleration: servo units per second², scalar or tuple(j1, j2, j3, j4, j5)
+    :param hand_orientation: orientation of the hand (cartesian targets)
+    :param approach_angle: calculates the angles considering a specific approach angle (degrees)
+    :param period: duration of each segment sent to the servos (milliseconds)
+    :return: StreamReport
+    """
+
+    points = [get_position(source="auto")]
+    for target in targets:
+        if len(target) == 3:
+            target = next(movel_targets(target, None, hand_orientation, approach_angle))
+        points.append(tuple(target))
+
+    # Speed scales velocities, accelerations scale with its square
+    def scaled(value, factor):
+        return tuple(v * factor for v in value) if isinstance(value, (tuple, list)) else value * factor
+
+    trajectory = Trajectory(points, scaled(max_velocity, speed), scaled(max_acceleration, speed * speed))
+    samples, time = trajectory.sample(period / 1000)
+
+    return stream(samples, time)
 
 
 def appro(point: tuple, offset: tuple) -> tuple:
@@ -98,15 +189,58 @@ def appro(point: tuple, offset: tuple) -> tuple:
     return tuple(new_point)
 
 
-def get_position(cartesian=False) -> tuple:
+def get_position(cartesian=False, source="hardware") -> tuple:
     """
     Return each servos position or return position in cartesian referential.
 
     :param cartesian: cartesian position ?
+    :param source: "hardware" reads the servos, "estimate" interpolates the commanded moves,
+                   "auto" estimates unless a servo is unknown or the last read is older than shadow.reconcile_interval
     :return: tuple(x, y, z) or tuple(j1, j2, j3, j4, j5) | jx: 0-1000
     """
 
-    position = get_servos_position((6, 5, 4, 3, 2))
+    position = estimated_position(source)
+
+    if position is None:
+        position = get_servos_position((6, 5, 4, 3, 2))
+
+    return check_position(position, cartesian)
+
+
+def estimated_position(source="auto"):
+    """
+    Return the position predicted from the commanded moves, None when the hardware must be read.
+
+    :param source: "hardware", "estimate" or "auto" (see get_position)
+    :return: tuple(j1, j2, j3, j4, j5) or None
+    """
+
+    if source not in ("hardware", "estimate", "auto"):
+        raise ValueError("source must be 'hardware', 'estimate' or 'auto'")
+
+    if source == "hardware":
+        return None
+
+    now = get_transport().now()
+    state = get_shadow()
+    position = state.estimate((6, 5, 4, 3, 2), now)
+
+    if source == "estimate":
+        if position is None:
+            raise ValueError("position unknown, servos were never read or commanded since unloaded")
+        return position
+
+    return None if state.needs_reconcile(now) else position
+
+
+def check_position(position: tuple, cartesian=False) -> tuple:
+    """
+    Validate servos positions read from the xArm.
+
+    :param position: tuple(j1, j2, j3, j4, j5) | jx: 0-1000
+    :param cartesian: cartesian position ?
+    :return: tuple(x, y, z) or tuple(j1, j2, j3, j4, j5)
+    """
 
     for pos in position:
         if not 0 <= pos <= 1000:
@@ -124,7 +258,7 @@ def motors_on() -> None:
 
     sleep(0.1)
 
-    position = get_position()
+    position = get_position(source="auto")
     movej(position, 100)
 
 
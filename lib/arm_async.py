@@ -0,0 +1,143 @@
+from lib import arm
+from lib.arm import set_speed, appro, movel_targets, check_position, estimated_position
+from lib.inverse_kinematics import FREE_ANGLE
+from lib import servo_controller
+
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
+
+# A single thread owns the HID device so frames are written in order
+hid_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="xArm-hid")
+
+# IK runs off the event loop, on one thread since the solver keeps its warm start between calls
+ik_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="xArm-ik")
+
+
+def _scaled(seconds: float) -> float:
+
+    # Simulated transports may run faster than real time
+    return seconds / servo_controller.get_transport().time_scale
+
+
+async def _run_hid(function, *args, **kwargs):
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(hid_executor, partial(function, *args, **kwargs))
+
+
+async def _run_ik(function, *args, **kwargs):
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(ik_executor, partial(function, *args, **kwargs))
+
+
+async def move_servos(servos_id: tuple, positions: tuple, time: int) -> None:
+    """
+    Write the move frame and wait until the motion is due to finish.
+
+    :param servos_id: tuple of servo ids
+    :param positions: tuple of positions | 0-1000
+    :param time: 0-65535 milliseconds
+    """
+
+    loop = asyncio.get_running_loop()
+    await _run_hid(servo_controller.move_servos, servos_id, positions, time, wait=False)
+
+    # Deadline taken after the write so HID latency doesn't shorten the wait
+    deadline = loop.time() + _scaled((time + 50) / 1000)
+    await asyncio.sleep(deadline - loop.time())
+
+
+async def grip_open() -> None:
+
+    """Open the grip."""
+
+    await move_servos((1, ), (200, ), int(1000 / arm.speed))
+
+
+async def grip_close(value=650) -> None:
+    """
+    Close the grip with the given value.
+
+    :param value: 0-1000
+    """
+
+    if not 0 <= value <= 1000:
+        raise ValueError("value must be between 0 and 1000")
+
+    await move_servos((1, ), (value, ), int(1000 / arm.speed))
+
+
+async def movej(joint: tuple, time: int) -> None:
+    """
+    Move each servomotors to joint position within time.
+
+    :param joint: tuple(j1, j2, j3, j4, j5) | jx: 0-1000
+    :param time: 0-65535 milliseconds
+    """
+
+    await move_servos((2, 3, 4, 5, 6), joint[::-1], int(time / arm.speed))
+
+
+async def movel(point: tuple, time: int, hand_orientation=500, approach_angle=FREE_ANGLE, waypoints=1) -> None:
+    """
+    Move arm to point position within time.
+
+    :param point: tuple(x, y, z)
+    :param time: 0-65535 milliseconds
+    :param hand_orientation: orientation of the hand
+    :param approach_angle: calculates the angles considering a specific approach angle (degrees)
+    :param waypoints: number of points through which the arm will pass (Allows a more linear movement)
+    """
+
+    current = await get_position(cartesian=True, source="auto") if waypoints > 1 else None
+    iks = movel_targets(point, current, hand_orientation, approach_angle, waypoints)
+
+    ik = await _run_ik(next, iks, None)
+    while ik is not None:
+        # The next waypoint is solved while this one is in flight
+        following = asyncio.ensure_future(_run_ik(next, iks, None))
+
+        try:
+            await move_servos((6, 5, 4, 3, 2), ik, int(time / waypoints / arm.speed))
+        except BaseException:
+            following.cancel()
+            raise
+
+        ik = await following
+
+
+async def get_position(cartesian=False, source="hardware") -> tuple:
+    """
+    Return each servos position or return position in cartesian referential.
+
+    :param cartesian: cartesian position ?
+    :param source: "hardware", "estimate" or "auto" (see lib.arm.get_position)
+    :return: tuple(x, y, z) or tuple(j1, j2, j3, j4, j5) | jx: 0-1000
+    """
+
+    position = estimated_position(source)
+
+    if position is None:
+        position = await _run_hid(servo_controller.get_servos_position, (6, 5, 4, 3, 2))
+
+    return check_position(position, cartesian)
+
+
+async def motors_on() -> None:
+
+    """Power on each servos motor"""
+
+    await asyncio.sleep(_scaled(0.1))
+
+    position = await get_position(source="auto")
+    await movej(position, 100)
+
+
+async def motors_off() -> None:
+
+    """Power off each servos motor"""
+
+    await asyncio.sleep(_scaled(0.1))
+    await _run_hid(servo_controller.unload_servos, (1, 2, 3, 4, 5, 6))
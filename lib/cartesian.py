@@ -1,4 +1,6 @@
 from lib.inverse_kinematics import *
+from lib import instrumentation
+from collections import OrderedDict
 import math
 
 
@@ -9,11 +11,184 @@ hand = Link(150, -2, 2)
 
 inverse_k = InverseK(base, upperarm, forearm, hand)
 
+# Precomputed IK table (see use_ik_table)
+ik_table = None
+
+# Reachable workspace map (see use_workspace_map)
+workspace_map = None
+
+# Memoization of compute_ik and compute_fk (see use_cache)
+ik_cache = None
+fk_cache = None
+
+
+class LRUCache:
+
+    def __init__(self, max_size: int, resolution=0.5) -> None:
+
+        """
+        Bounded cache that evicts the least recently used entry.
+
+        :param max_size: number of entries
+        :param resolution: targets are quantized to this resolution (mm) before lookup
+        """
+
+        if max_size < 1:
+            raise ValueError("max_size must be greater than 0")
+
+        self.max_size = max_size
+        self.resolution = resolution
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = OrderedDict()
+
+    def quantize(self, point: tuple) -> tuple:
+        return tuple(round(p / self.resolution) * self.resolution for p in point)
+
+    def get(self, key):
+
+        """Return the cached value or raise KeyError"""
+
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def put(self, key, value) -> None:
+
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def use_cache(max_size=256, resolution=0.5) -> None:
+
+    """
+    Memoize compute_ik and compute_fk, None to disable.
+
+    In free angle mode the cached solution is the one found on the first call.
+
+    :param max_size: number of entries of each cache
+    :param resolution: IK targets are quantized to this resolution (mm)
+    """
+
+    global ik_cache, fk_cache
+
+    if max_size is None:
+        ik_cache = None
+        fk_cache = None
+    else:
+        ik_cache = LRUCache(max_size, resolution)
+        fk_cache = LRUCache(max_size)
+
+
+def use_ik_table(path=None, **kwargs) -> None:
+
+    """
+    Answer compute_ik from a precomputed IK table when possible, None to disable.
+
+    :param path: table built with lib.ik_table
+    """
+
+    global ik_table
+
+    if ik_table is not None:
+        ik_table.close()
+
+    if path is None:
+        ik_table = None
+    else:
+        from lib.ik_table import IKTable
+        ik_table = IKTable(path, **kwargs)
+
+
+def use_workspace_map(path=None) -> None:
+
+    """
+    Reject the targets outside of a precomputed workspace map before solving them, None to disable.
+
+    :param path: map built with lib.workspace
+    """
+
+    global workspace_map
+
+    if workspace_map is not None:
+        workspace_map.close()
+
+    if path is None:
+        workspace_map = None
+    else:
+        from lib.workspace import WorkspaceMap
+        workspace_map = WorkspaceMap(path)
+
 
 def compute_ik(target: tuple, hand_orientation=500, approach_angle=FREE_ANGLE) -> tuple:
 
     """Computes the inverse kinematics on a full 3D referencial"""
 
+    if instrumentation.enabled:
+        start = instrumentation.clock()
+        try:
+            return _cached_compute_ik(target, hand_orientation, approach_angle)
+        finally:
+            instrumentation.span("compute_ik", start)
+
+    return _cached_compute_ik(target, hand_orientation, approach_angle)
+
+
+def _cached_compute_ik(target: tuple, hand_orientation: int, approach_angle: float) -> tuple:
+
+    if ik_cache is None:
+        return _compute_ik(target, hand_orientation, approach_angle)
+
+    target = ik_cache.quantize(target)
+    key = (target, hand_orientation, approach_angle)
+
+    try:
+        pos = ik_cache.get(key)
+    except KeyError:
+        try:
+            pos = _compute_ik(target, hand_orientation, approach_angle)
+        except ValueError as error:
+            # Unreachable goals are cached too
+            pos = error
+        ik_cache.put(key, pos)
+
+    if isinstance(pos, ValueError):
+        raise ValueError(*pos.args)
+
+    return pos
+
+
+def _compute_ik(target: tuple, hand_orientation=500, approach_angle=FREE_ANGLE) -> tuple:
+
+    if workspace_map is not None and not workspace_map.reachable(target, approach_angle):
+        raise ValueError("Unreachable goal")
+
+    if ik_table is not None:
+        pos = ik_table.lookup(target, hand_orientation, approach_angle)
+        if pos is not None:
+            return pos
+
     ik = inverse_k.solve(target[0], target[1], target[2], approach_angle)
 
     # Convert radian angles to servo position
@@ -44,9 +219,102 @@ def compute_ik(target: tuple, hand_orientation=500, approach_angle=FREE_ANGLE) -
     return tuple(pos)
 
 
-def compute_fk(joint: tuple) -> tuple:
+def compute_ik_incremental(target: tuple, current: tuple, hand_orientation=500, approach_angle=FREE_ANGLE, max_error=1.0) -> tuple:
+    """
+    Inverse kinematics of a target close to current, a few differential steps instead of a full solve (jogging).
+
+    :param target: tuple(x, y, z)
+    :param current: tuple(j1, j2, j3, j4, j5) servo positions near the solution
+    :param hand_orientation: orientation of the hand
+    :param approach_angle: radians or FREE_ANGLE
+    :param max_error: max distance (mm) between target and the result, raises ValueError above
+    :return: tuple(j1, j2, j3, j4, j5)
+    """
+
+    instrumented = instrumentation.enabled
+    if instrumented:
+        start = instrumentation.clock()
+
+    # Servo positions to radian angles (see _compute_ik for the offsets)
+    angles = [math.radians((pos - 500) * 0.24) for pos in current[:4]]
+    angles[2] = -angles[2]
+
+    ik = inverse_k.solve_incremental(target[0], target[1], target[2], angles, approach_angle)
+
+    if inverse_k.residual > max_error:
+        raise ValueError("Unreachable goal")
+
+    pos = [round(math.degrees(elem) / 0.24) for elem in ik]
+
+    # Offsets
+    for i in (0, 1, 3):
+        pos[i] += 500
+    pos[2] = 500 - pos[2]
+
+    if approach_angle != FREE_ANGLE:
+        # Keep joint 5 align with joint 1 (base)
+        pos.append(pos[0] + (500 - hand_orientation))
+    else:
+        pos.append(hand_orientation)
+
+    if instrumented:
+        instrumentation.span("compute_ik_incremental", start)
+
+    return tuple(pos)
+
+
+def compute_ik_many(targets, hand_orientation=500, approach_angle=FREE_ANGLE) -> tuple:
+
+    """
+    Computes the inverse kinematics of a batch of targets.
+
+    :param targets: array of shape (N, 3) | rows of (x, y, z)
+    :param hand_orientation: orientation of the hand, scalar or array of shape (N,)
+    :param approach_angle: radians or FREE_ANGLE, scalar or array of shape (N,)
+    :return: (positions, reachable) | positions: (N, 5) servo positions (0 where unreachable)
+    """
 
-    """Computes forward kinematics"""
+    ik, reachable = inverse_k.solve_many(targets, approach_angle)
+
+    # Convert radian angles to servo position
+    pos = np.zeros((len(ik), 5), dtype=int)
+    pos[reachable, :4] = np.round(np.degrees(ik[reachable]) / 0.24)
+
+    # Offsets
+    pos[:, (0, 1, 3)] += 500
+    pos[:, 2] = 500 - pos[:, 2]
+
+    # Keep joint 5 align with joint 1 (base) when the approach angle is given
+    hand_orientation = np.broadcast_to(hand_orientation, len(pos))
+    free = np.broadcast_to(np.asarray(approach_angle) == FREE_ANGLE, len(pos))
+    pos[:, 4] = np.where(free, hand_orientation, pos[:, 0] + (500 - hand_orientation))
+
+    pos[~reachable] = 0
+
+    return pos, reachable
+
+
+def compute_fk(joint: tuple, rounded=True) -> tuple:
+
+    """Computes forward kinematics, rounded to the millimeter unless rounded is False"""
+
+    if not rounded:
+        return _compute_fk(joint, False)
+
+    if fk_cache is None:
+        return _compute_fk(joint)
+
+    key = tuple(joint[:4])
+
+    try:
+        return fk_cache.get(key)
+    except KeyError:
+        fk = _compute_fk(joint)
+        fk_cache.put(key, fk)
+        return fk
+
+
+def _compute_fk(joint: tuple, rounded=True) -> tuple:
 
     joint = list(joint)
 
@@ -75,4 +343,36 @@ def compute_fk(joint: tuple) -> tuple:
     # Fix X
     fk[0] = math.cos(ik[0]) * fk[0]
 
+    if not rounded:
+        return tuple(fk)
+
     return tuple([round(f) for f in fk])
+
+
+def compute_fk_many(joints):
+
+    """
+    Computes forward kinematics of a batch of joint positions.
+
+    :param joints: array of shape (N, 5) | servo positions (j1, j2, j3, j4, j5), j5 is ignored
+    :return: array of shape (N, 3) | rows of (x, y, z), not rounded
+    """
+
+    if np is None:
+        raise ImportError("numpy is required to compute a batch of joint positions")
+
+    joints = np.asarray(joints, dtype=float).reshape(-1, 5)
+
+    # Offsets
+    ik = np.radians((joints[:, :4] - 500) * 0.24)
+    ik[:, 2] = -ik[:, 2]
+
+    # Angles from the vertical, get the radius and Z pos in the arm plane
+    shoulder = ik[:, 1]
+    elbow = shoulder + ik[:, 2]
+    wrist = elbow + ik[:, 3]
+
+    r = -(np.sin(shoulder) * UPPERARM_LENGTH + np.sin(elbow) * FOREARM_LENGTH + np.sin(wrist) * HAND_LENGTH)
+    z = np.cos(shoulder) * UPPERARM_LENGTH + np.cos(elbow) * FOREARM_LENGTH + np.cos(wrist) * HAND_LENGTH
+
+    return np.stack((np.cos(ik[:, 0]) * r, np.sin(ik[:, 0]) * r, z), axis=1)
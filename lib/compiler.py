@@ -0,0 +1,350 @@
+# Motion program compiler: runs an app against a simulated xArm (virtual clock, so instantly) and keeps the frames it
+# writes with their timestamps. The executor then only streams the precompiled frames on schedule.
+#   python -m lib.compiler ../apps/demo/main.py          compile (or reuse the cache)
+#   python -m lib.compiler ../apps/demo/main.py --run    compile then execute on the xArm
+#
+# Compiling runs the app, so the launcher only compiles apps that opt in with a `# xarm: compile` line in their main.py
+# (apps that end on their own and have no side effect other than moving the arm). Positions read during the trace are
+# the simulated ones, so --run executes apps that read positions from source, in a fresh process.
+#
+# File: header, then one index entry per frame (timestamp, offset, size) and the frames back to back.
+
+from lib import servo_controller
+from lib import instrumentation
+from lib.protocol import *
+from lib.transport import SimulatedTransport
+
+from contextlib import contextmanager, redirect_stdout
+import argparse
+import hashlib
+import math
+import os
+import runpy
+import struct
+import subprocess
+import sys
+import time
+
+
+MAGIC = b"XPRG"
+VERSION = 1
+
+# magic, version, frame count, duration (seconds), position reads during the trace
+HEADER = struct.Struct("<4sHIdI")
+# timestamp (seconds), offset in the frames, size
+ENTRY = struct.Struct("<dIH")
+
+# An app that doesn't end within this simulated time is considered stuck
+MAX_DURATION = 3600
+
+# Line of main.py that opts an app in to compilation
+MARKER = "# xarm: compile"
+
+LIB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class CompileError(Exception):
+    pass
+
+
+class TracingTransport(SimulatedTransport):
+
+    def __init__(self, max_duration=MAX_DURATION) -> None:
+
+        """Simulated xArm on a virtual clock that keeps the frames written to it."""
+
+        super(TracingTransport, self).__init__(math.inf)
+
+        self.max_duration = max_duration
+        self.trace = list()
+        self.reads = 0
+
+    def sleep(self, seconds: float) -> None:
+
+        super(TracingTransport, self).sleep(seconds)
+
+        if self.now() > self.max_duration:
+            raise CompileError(f"program still running after {self.max_duration} s")
+
+    def write(self, buf) -> int:
+
+        frame = bytes(buf)
+        _validate(frame)
+
+        size = super(TracingTransport, self).write(frame)
+
+        if frame[4] == CMD_MULT_SERVO_POS_READ:
+            self.reads += 1
+        else:
+            self.trace.append((self.now(), frame))
+
+        return size
+
+
+def _validate(frame: bytes) -> None:
+
+    command, params = decode_frame(frame)
+
+    if command == CMD_SERVO_MOVE:
+        servos_id, positions, duration = decode_move(params)
+        if not 0 <= min(positions) <= max(positions) <= 1000:
+            raise CompileError(f"servo position out of range: {dict(zip(servos_id, positions))}")
+    elif command in (CMD_MULT_SERVO_UNLOAD, CMD_MULT_SERVO_POS_READ):
+        servos_id = decode_servos(params)
+    else:
+        raise CompileError(f"unknown command {command:#04x}")
+
+    if not set(servos_id) <= {1, 2, 3, 4, 5, 6}:
+        raise CompileError(f"unknown servo in {servos_id}")
+
+
+class Program:
+
+    def __init__(self, frames: list, duration: float, reads=0) -> None:
+
+        """
+        Compiled motion program.
+
+        :param frames: list of (timestamp in seconds, frame)
+        :param duration: time until the last move is finished (seconds)
+        :param reads: position reads done by the app during the trace
+        """
+
+        self.frames = frames
+        self.duration = duration
+        self.reads = reads
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def save(self, path: str) -> None:
+
+        entries = bytearray()
+        data = bytearray()
+        for timestamp, frame in self.frames:
+            entries += ENTRY.pack(timestamp, len(data), len(frame))
+            data += frame
+
+        # Written next to its final name so a concurrent run never reads a partial file
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(HEADER.pack(MAGIC, VERSION, len(self.frames), self.duration, self.reads))
+            file.write(entries)
+            file.write(data)
+
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str):
+
+        with open(path, "rb") as file:
+            content = file.read()
+
+        magic, version, count, duration, reads = HEADER.unpack_from(content, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} compiled program")
+
+        view = memoryview(content)
+        data = HEADER.size + count * ENTRY.size
+
+        frames = list()
+        for timestamp, offset, size in ENTRY.iter_unpack(view[HEADER.size:data]):
+            frames.append((timestamp, view[data + offset:data + offset + size]))
+
+        return cls(frames, duration, reads)
+
+
+def compile_enabled(path: str) -> bool:
+
+    """Whether the app at path opted in to compilation (see MARKER)"""
+
+    with open(path, encoding="utf-8") as file:
+        return any(line.strip() == MARKER for line in file)
+
+
+def source_hash(path: str) -> str:
+
+    """Hash of the app (every .py file of its directory) and of lib, any change invalidates the cache"""
+
+    digest = hashlib.sha256(struct.pack("<H", VERSION))
+
+    for directory in (os.path.dirname(os.path.abspath(path)), LIB_DIR):
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".py"):
+                digest.update(name.encode())
+                with open(os.path.join(directory, name), "rb") as file:
+                    digest.update(file.read())
+
+    return digest.hexdigest()
+
+
+@contextmanager
+def _traced(transport: TracingTransport):
+
+    # time.sleep in the app must follow the virtual clock too
+    previous = servo_controller.transport
+    sleep = time.sleep
+
+    servo_controller.set_transport(transport)
+    time.sleep = transport.sleep
+
+    try:
+        yield
+    finally:
+        time.sleep = sleep
+        servo_controller.set_transport(previous)
+
+
+def trace(path: str, max_duration=MAX_DURATION) -> Program:
+
+    """
+    Run the app at path against a simulated xArm and return its frames.
+
+    :param path: app main.py
+    :param max_duration: max simulated duration (seconds)
+    """
+
+    # Same imports as when the app runs from source
+    directory = os.path.dirname(os.path.abspath(path))
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+
+    transport = TracingTransport(max_duration)
+
+    # What the app prints is not part of the program
+    with _traced(transport), open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        try:
+            runpy.run_path(path, run_name="__main__")
+        except SystemExit as error:
+            if error.code not in (None, 0):
+                raise CompileError(f"program exited with {error.code}")
+
+    if not transport.trace:
+        return Program(list(), 0.0, transport.reads)
+
+    # The program starts with its first frame
+    origin = transport.trace[0][0]
+    frames = [(timestamp - origin, frame) for timestamp, frame in transport.trace]
+
+    return Program(frames, transport.now() - origin, transport.reads)
+
+
+def compile_program(path: str, cache_dir=None, force=False) -> Program:
+
+    """
+    Compiled form of the app at path, from the cache when the sources didn't change.
+
+    :param path: app main.py
+    :param cache_dir: default __xarm_cache__ next to the app
+    :param force: compile even if cached
+    """
+
+    cache = _cache_path(path, cache_dir)
+
+    if not force and os.path.exists(cache):
+        return Program.load(cache)
+
+    program = trace(path)
+
+    os.makedirs(os.path.dirname(cache), exist_ok=True)
+    program.save(cache)
+
+    return program
+
+
+def cached(path: str, cache_dir=None):
+
+    """Compiled form of the app at path if it is in the cache and up to date, None otherwise (never traces)"""
+
+    cache = _cache_path(path, cache_dir)
+
+    return Program.load(cache) if os.path.exists(cache) else None
+
+
+def is_compiled(path: str, cache_dir=None) -> bool:
+
+    """Whether the cache holds the compiled form of the current sources of the app at path"""
+
+    return os.path.exists(_cache_path(path, cache_dir))
+
+
+def _cache_path(path: str, cache_dir=None) -> str:
+
+    # Default __xarm_cache__ next to the app
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), "__xarm_cache__")
+
+    return os.path.join(cache_dir, f"{source_hash(path)}.xprg")
+
+
+def execute(program: Program) -> float:
+
+    """
+    Stream the frames of program on schedule.
+
+    :return: max lateness of a frame (seconds)
+    """
+
+    device = servo_controller.get_transport()
+    write = device.write
+    now = device.now
+    sleep = device.sleep
+
+    lateness = 0.0
+    start = now()
+
+    for timestamp, frame in program.frames:
+        deadline = start + timestamp
+        sleep(max(deadline - now(), 0))
+
+        late = now() - deadline
+        write(frame)
+
+        if late > lateness:
+            lateness = late
+
+    # Let the last move finish
+    sleep(max(start + program.duration - now(), 0))
+
+    if instrumentation.enabled:
+        instrumentation.record("execute.max_lateness", lateness * 1e6)
+
+    return lateness
+
+
+def run(path: str, force=False) -> int:
+
+    """
+    Compile the app at path and execute it. Apps that read positions run from source in a fresh process, the trace
+    left the state of lib (shadow state, speed, IK warm start and caches) on the virtual clock.
+
+    :return: exit status of the app
+    """
+
+    compiled = compile_program(path, force=force)
+
+    if compiled.reads:
+        return subprocess.call([sys.executable, path])
+
+    execute(compiled)
+
+    return 0
+
+
+def _summary(program: Program) -> str:
+    return f"{len(program)} frames, {program.duration:.1f} s, {program.reads} position reads"
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compile an xArm app into precomputed frames")
+    parser.add_argument("path", help="app main.py")
+    parser.add_argument("--run", action="store_true", help="execute the compiled program (the source if it reads positions)")
+    parser.add_argument("--force", action="store_true", help="ignore the cache")
+
+    args = parser.parse_args()
+
+    print(_summary(compile_program(args.path, force=args.force)))
+
+    if args.run:
+        sys.exit(run(args.path))
@@ -0,0 +1,288 @@
+# Device owner daemon: keeps the xArm open and serializes the frames of every client (apps, launcher) received over a
+# Unix domain socket. Run it with `python -m lib.daemon`, clients connect to it transparently (see get_transport).
+#
+# Requests: type (1 byte), length (1 byte), payload
+#   REQUEST_WRITE           payload: frame as written to the controller (with hid id), no reply
+#   REQUEST_READ_POSITIONS  payload: servo ids, reply: status (1 byte), count (1 byte), positions (uint16 each)
+
+from lib import servo_controller
+from lib.protocol import CMD_MULT_SERVO_POS_READ, encode_positions_into
+
+from collections import deque
+import argparse
+import os
+import signal
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+
+SOCKET_PATH = os.environ.get("XARM_SOCKET", "/tmp/xarm.sock")
+
+REQUEST = struct.Struct("<BB")
+REPLY = struct.Struct("<BB")
+
+REQUEST_WRITE = 0x01
+REQUEST_READ_POSITIONS = 0x02
+
+STATUS_OK = 0x00
+STATUS_ERROR = 0x01
+
+ALL_SERVOS = (1, 2, 3, 4, 5, 6)
+
+
+def _receive(connection: socket.socket, size: int) -> bytes:
+
+    data = bytearray()
+    while len(data) < size:
+        chunk = connection.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        data += chunk
+
+    return bytes(data)
+
+
+class CoalescedReader:
+
+    def __init__(self, device_lock: threading.Lock) -> None:
+
+        """
+        Clients asking for positions while a read is in flight share its result, if that read started after their
+        last write (so they always see their own moves).
+        """
+
+        self._device_lock = device_lock
+        self._condition = threading.Condition()
+        self._reading = False
+        self._started = 0
+        self._generation = 0
+        self._positions = None
+
+        self.reads = 0
+        self.requests = 0
+        self.writes = 0
+
+    def written(self) -> int:
+
+        """Count a frame written to the device (call it once written), return its sequence number for read"""
+
+        with self._condition:
+            self.writes += 1
+            return self.writes
+
+    def read(self, servos_id: tuple, after=0):
+
+        """
+        Return the positions of servos_id or None if the controller didn't answer.
+
+        :param after: sequence number of the last write of the client (see written)
+        """
+
+        with self._condition:
+            self.requests += 1
+
+            while self._reading:
+                if self._started >= after:
+                    generation = self._generation
+                    while self._generation == generation:
+                        self._condition.wait()
+                    return self._select(servos_id)
+
+                # Started before the last write of the client, wait for it to end and read again
+                self._condition.wait()
+
+            self._reading = True
+            self._started = self.writes
+
+        # One read of every servo serves all pending clients
+        try:
+            with self._device_lock:
+                positions = dict(zip(ALL_SERVOS, servo_controller.get_servos_position(ALL_SERVOS)))
+        except (TimeoutError, OSError, ValueError):
+            positions = None
+
+        with self._condition:
+            self.reads += 1
+            self._positions = positions
+            self._reading = False
+            self._generation += 1
+            self._condition.notify_all()
+
+            return self._select(servos_id)
+
+    def _select(self, servos_id: tuple):
+
+        if self._positions is None or not all(servo_id in self._positions for servo_id in servos_id):
+            return None
+
+        return tuple(self._positions[servo_id] for servo_id in servos_id)
+
+
+class ArmDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+    def __init__(self, path=SOCKET_PATH, transport=None) -> None:
+
+        """
+        :param path: Unix socket path
+        :param transport: device transport (default HIDTransport)
+        """
+
+        # Only the socket of a daemon that didn't exit cleanly is removed
+        if os.path.exists(path):
+            if is_running(path):
+                raise OSError(f"a daemon is already running on {path}")
+            os.unlink(path)
+
+        servo_controller.set_transport(transport if transport is not None else servo_controller.HIDTransport())
+
+        self.device_lock = threading.Lock()
+        self.reader = CoalescedReader(self.device_lock)
+
+        super(ArmDaemon, self).__init__(path, DaemonHandler)
+
+    def server_bind(self) -> None:
+
+        # The socket is created 0600, only the user running the daemon can drive the arm
+        umask = os.umask(0o177)
+        try:
+            super(ArmDaemon, self).server_bind()
+        finally:
+            os.umask(umask)
+
+
+class DaemonHandler(socketserver.BaseRequestHandler):
+
+    def handle(self) -> None:
+
+        server = self.server
+        last_write = 0
+
+        while True:
+            try:
+                kind, length = REQUEST.unpack(_receive(self.request, REQUEST.size))
+                payload = _receive(self.request, length)
+            except ConnectionError:
+                return
+
+            if kind == REQUEST_WRITE:
+                with server.device_lock:
+                    servo_controller.get_transport().write(payload)
+                    last_write = server.reader.written()
+
+            elif kind == REQUEST_READ_POSITIONS:
+                positions = server.reader.read(tuple(payload), last_write)
+
+                if positions is None:
+                    self.request.sendall(REPLY.pack(STATUS_ERROR, 0))
+                else:
+                    self.request.sendall(REPLY.pack(STATUS_OK, len(positions)) + struct.pack(f"<{len(positions)}H", *positions))
+
+            else:
+                return
+
+
+class DaemonTransport:
+
+    """Client side of the daemon, used like any other transport by servo_controller."""
+
+    time_scale = 1.0
+
+    def __init__(self, path=SOCKET_PATH) -> None:
+
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._socket.connect(path)
+
+        self._replies = deque()
+
+    def write(self, buf) -> int:
+
+        frame = bytes(buf)
+
+        if frame[4] == CMD_MULT_SERVO_POS_READ:
+            servos_id = frame[6:6 + frame[5]]
+            self._socket.sendall(REQUEST.pack(REQUEST_READ_POSITIONS, len(servos_id)) + servos_id)
+
+            status, count = REPLY.unpack(_receive(self._socket, REPLY.size))
+            positions = struct.unpack(f"<{count}H", _receive(self._socket, count * 2))
+
+            # Rebuild the controller reply for get_servos_position
+            if status == STATUS_OK:
+                reply = bytearray(64)
+                encode_positions_into(reply, 0, tuple(servos_id), positions)
+                self._replies.append(reply)
+        else:
+            self._socket.sendall(REQUEST.pack(REQUEST_WRITE, len(frame)) + frame)
+
+        return len(frame)
+
+    def read(self, size: int, timeout_ms=0) -> list:
+
+        if not self._replies:
+            return list()
+
+        return list(self._replies.popleft()[:size])
+
+    def close(self) -> None:
+        self._socket.close()
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+    @staticmethod
+    def sleep(seconds: float) -> None:
+        time.sleep(max(seconds, 0))
+
+
+def is_running(path=SOCKET_PATH) -> bool:
+
+    try:
+        DaemonTransport(path).close()
+    except OSError:
+        return False
+
+    return True
+
+
+def ensure_daemon(path=SOCKET_PATH, timeout=3.0):
+
+    """Start the daemon in the background if it isn't running, return the process (None if already running)."""
+
+    if is_running(path):
+        return None
+
+    process = subprocess.Popen([sys.executable, "-m", "lib.daemon", "--socket", path])
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and process.poll() is None:
+        if is_running(path):
+            break
+        time.sleep(0.05)
+
+    return process
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="xArm device owner daemon")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--sim", action="store_true", help="own a simulated xArm instead of the HID device")
+
+    args = parser.parse_args()
+
+    server = ArmDaemon(args.socket, servo_controller.SimulatedTransport() if args.sim else None)
+
+    # Remove the socket when stopped
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    try:
+        server.serve_forever()
+    finally:
+        os.unlink(args.socket)
@@ -0,0 +1,186 @@
+from lib.cartesian import compute_ik_many, compute_fk
+from lib.inverse_kinematics import FREE_ANGLE
+
+import argparse
+import math
+import mmap
+import struct
+
+
+MAGIC = b"XIKT"
+VERSION = 1
+
+# magic, version, angles count, nx, ny, nz, origin x, origin y, origin z, step
+HEADER = struct.Struct("<4sHHHHHdddd")
+# Two consecutive cells on the z axis, 4 joints each
+CELL_PAIR = struct.Struct("<8h")
+UNREACHABLE = -1
+
+
+class IKTable:
+
+    def __init__(self, path: str, tolerance=2, max_spread=150) -> None:
+
+        """
+        Precomputed IK table, memory-mapped so only the cells that are used are read from disk.
+
+        :param path: table built with build_table
+        :param tolerance: max distance (mm) between the target and the FK of an interpolated result
+        :param max_spread: max difference (servo units) between the corners of a cell
+        """
+
+        with open(path, "rb") as file:
+            header = HEADER.unpack(file.read(HEADER.size))
+            magic, version, count, nx, ny, nz = header[:6]
+
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} IK table")
+
+            self.angles = struct.unpack(f"<{count}d", file.read(8 * count))
+
+        self.origin = header[6:9]
+        self.step = header[9]
+        self.shape = (nx, ny, nz)
+
+        self.tolerance = tolerance
+        self.max_spread = max_spread
+
+        self.hits = 0
+        self.misses = 0
+
+        # Pages are only read from disk when a lookup touches them
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self._offset = HEADER.size + 8 * count
+        self._strides = (nx * ny * nz * 8, ny * nz * 8, nz * 8, 8)
+
+    def close(self) -> None:
+        self._map.close()
+
+    def lookup(self, target: tuple, hand_orientation=500, approach_angle=FREE_ANGLE):
+
+        """Interpolate servo positions for target, return None if the exact solver must be used"""
+
+        pos = self._interpolate(target, approach_angle)
+
+        if pos is None:
+            self.misses += 1
+            return None
+
+        if approach_angle != FREE_ANGLE:
+            # Keep joint 5 align with joint 1 (base)
+            pos.append(pos[0] + (500 - hand_orientation))
+        else:
+            pos.append(hand_orientation)
+
+        self.hits += 1
+
+        return tuple(pos)
+
+    def _interpolate(self, target: tuple, approach_angle: float):
+
+        try:
+            index = self._angle_index(approach_angle)
+        except ValueError:
+            return None
+
+        cell = list()
+        fraction = list()
+        for t, o, size in zip(target, self.origin, self.shape):
+            g = (t - o) / self.step
+            i = math.floor(g)
+
+            # Outside of the grid
+            if not 0 <= i < size - 1:
+                return None
+
+            cell.append(i)
+            fraction.append(g - i)
+
+        i, j, k = cell
+        s_angle, s_x, s_y, s_z = self._strides
+        base = self._offset + index * s_angle + i * s_x + j * s_y + k * s_z
+
+        pairs = [CELL_PAIR.unpack_from(self._map, base + di * s_x + dj * s_y) for di in (0, 1) for dj in (0, 1)]
+
+        # Near joint limits or across two solution branches
+        for n in range(4):
+            values = [pair[n + dk] for pair in pairs for dk in (0, 4)]
+            if UNREACHABLE in values or max(values) - min(values) > self.max_spread:
+                return None
+
+        # Trilinear interpolation
+        fx, fy, fz = fraction
+        weights = ((1 - fx) * (1 - fy), (1 - fx) * fy, fx * (1 - fy), fx * fy)
+
+        joints = [0.0] * 4
+        for pair, w in zip(pairs, weights):
+            for n in range(4):
+                joints[n] += w * ((1 - fz) * pair[n] + fz * pair[n + 4])
+
+        pos = [round(j) for j in joints]
+
+        # Check if arm is on target
+        fk = compute_fk(pos + [500])
+        if any(abs(f - t) > self.tolerance for f, t in zip(fk, target)):
+            return None
+
+        return pos
+
+    def _angle_index(self, approach_angle: float) -> int:
+
+        for index, angle in enumerate(self.angles):
+            if angle == approach_angle or (angle != FREE_ANGLE and abs(angle - approach_angle) < 1e-6):
+                return index
+
+        raise ValueError("approach angle not in table")
+
+
+def build_table(path: str, low: tuple, high: tuple, step: float, approach_angles=(FREE_ANGLE, )) -> None:
+
+    """
+    Precompute compute_ik on a 3D grid for each approach angle and save it to path.
+
+    :param low: tuple(x, y, z) first corner of the grid
+    :param high: tuple(x, y, z) opposite corner of the grid
+    :param step: grid spacing (mm)
+    :param approach_angles: radians or FREE_ANGLE
+    """
+
+    # Only needed to build the table, lookups don't import numpy
+    import numpy as np
+
+    axes = [np.arange(lo, hi + step / 2, step) for lo, hi in zip(low, high)]
+    shape = tuple(len(axis) for axis in axes)
+
+    if min(shape) < 2:
+        raise ValueError("grid must have at least 2 points on each axis")
+
+    grid = np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(approach_angles), *shape, *low, step))
+        file.write(struct.pack(f"<{len(approach_angles)}d", *approach_angles))
+
+        for angle in approach_angles:
+            pos, reachable = compute_ik_many(grid, approach_angle=angle)
+
+            joints = pos[:, :4].astype("<i2")
+            joints[~reachable] = UNREACHABLE
+            joints.tofile(file)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Precompute an IK table")
+    parser.add_argument("path")
+    parser.add_argument("--low", type=float, nargs=3, default=(-300, -300, -100), metavar=("X", "Y", "Z"))
+    parser.add_argument("--high", type=float, nargs=3, default=(300, 300, 300), metavar=("X", "Y", "Z"))
+    parser.add_argument("--step", type=float, default=10)
+    parser.add_argument("--angles", nargs="+", default=["free"], help="approach angles in degrees or 'free'")
+
+    args = parser.parse_args()
+
+    angles = tuple(FREE_ANGLE if a == "free" else math.radians(float(a)) for a in args.angles)
+    build_table(args.path, tuple(args.low), tuple(args.high), args.step, angles)
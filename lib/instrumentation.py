@@ -0,0 +1,159 @@
+# Hot path instrumentation, disabled by default.
+# Instrumented code checks `instrumentation.enabled` before taking any timestamp so the disabled cost is one
+# attribute lookup. The flag is read once per call, so toggling it mid-call never leaves start unset:
+#
+#     instrumented = instrumentation.enabled
+#     if instrumented:
+#         start = instrumentation.clock()
+#     ...
+#     if instrumented:
+#         instrumentation.span("compute_ik", start)
+
+from collections import deque
+import json
+import threading
+import time
+
+BUCKETS = 32
+
+enabled = False
+clock = time.perf_counter
+
+histograms = dict()
+callbacks = list()
+
+# Last spans for the Chrome trace (name, start, duration, thread id)
+trace = deque(maxlen=10000)
+
+_lock = threading.Lock()
+_origin = clock()
+
+
+class Histogram:
+
+    def __init__(self) -> None:
+
+        """Fixed size histogram, bucket i counts values in [2^(i-1), 2^i)."""
+
+        self.buckets = [0] * BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value: float) -> None:
+
+        self.buckets[min(int(value).bit_length(), BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def percentile(self, fraction: float) -> float:
+
+        """Upper bound of the bucket that contains the given fraction of values"""
+
+        threshold = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= threshold:
+                return float(2 ** index)
+
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(0.5),
+            "p99": self.percentile(0.99),
+            "buckets": self.buckets,
+        }
+
+
+def enable(trace_size=10000) -> None:
+
+    """Start recording, the Chrome trace keeps the last trace_size spans."""
+
+    global enabled, trace
+
+    trace = deque(trace, maxlen=trace_size)
+    enabled = True
+
+
+def disable() -> None:
+
+    global enabled
+    enabled = False
+
+
+def reset() -> None:
+
+    with _lock:
+        histograms.clear()
+        trace.clear()
+
+
+def add_callback(callback) -> None:
+
+    """callback(name, value, start) is called for each record, start is None for plain values."""
+
+    callbacks.append(callback)
+
+
+def remove_callback(callback) -> None:
+    callbacks.remove(callback)
+
+
+def record(name: str, value: float, start=None) -> None:
+
+    with _lock:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = Histogram()
+        histogram.add(value)
+
+        if start is not None:
+            trace.append((name, start, value, threading.get_ident()))
+
+    for callback in callbacks:
+        callback(name, value, start)
+
+
+def span(name: str, start: float) -> None:
+
+    """Record the time elapsed since start (from clock()) in microseconds."""
+
+    record(name, (clock() - start) * 1e6, start)
+
+
+def to_json(path=None) -> dict:
+
+    """Histograms as a dict, also written to path if given. Spans are in microseconds."""
+
+    with _lock:
+        data = {name: histogram.to_dict() for name, histogram in histograms.items()}
+
+    if path is not None:
+        with open(path, "w") as file:
+            json.dump(data, file, indent=2)
+
+    return data
+
+
+def to_chrome_trace(path: str) -> None:
+
+    """Write the recorded spans in Chrome trace format (chrome://tracing, Perfetto)."""
+
+    with _lock:
+        events = [{"name": name, "ph": "X", "ts": (start - _origin) * 1e6, "dur": duration, "pid": 0, "tid": tid}
+                  for name, start, duration, tid in trace]
+
+    with open(path, "w") as file:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file)
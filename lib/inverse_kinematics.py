@@ -1,12 +1,20 @@
 # Based on the CGx-InverseK distribution (https://github.com/cgxeiji/CGx-InverseK).
 # Copyright (c) 2017 Eiji Onchi.
 
+from lib import instrumentation
+
 import math
 
+try:
+    import numpy as np
+except ImportError:  # Only needed by the batch solver
+    np = None
+
 PI = math.pi
 HALF_PI = math.pi / 2
 DOUBLE_PI = math.pi * 2
 DEGREE_STEP = 0.01745329251
+COARSE_STEP = DEGREE_STEP * 8
 
 BASE_LENGTH = 0
 UPPERARM_LENGTH = 97
@@ -29,10 +37,16 @@ class Link:
     def in_range(self, angle: float) -> bool:
         return self._angleLow <= angle <= self._angleHigh
 
+    def in_range_many(self, angles):
+        return (angles >= self._angleLow) & (angles <= self._angleHigh)
+
+    def clamp(self, angle: float) -> float:
+        return min(max(angle, self._angleLow), self._angleHigh)
+
 
 class InverseK:
 
-    def __init__(self, shoulder: Link, upperarm: Link, forearm: Link, hand: Link) -> None:
+    def __init__(self, shoulder: Link, upperarm: Link, forearm: Link, hand: Link, closest_phi=False) -> None:
 
         self._L0 = shoulder  # Link 0: Shoulder
         self._L1 = upperarm  # Link 1: Upperarm
@@ -41,10 +55,16 @@ class InverseK:
 
         self._currentPhi = -DOUBLE_PI
 
+        # With a free angle, prefer the phi closest to the previous solution instead of the lowest one
+        self.closest_phi = closest_phi
+
         self._shoulder = float()
         self._elbow = float()
         self._wrist = float()
 
+        # Position error of the last solve_incremental (mm)
+        self.residual = 0.0
+
     def solve(self, x: float, y: float, z: float, phi=FREE_ANGLE):
 
         # Solve the angle of the base
@@ -71,6 +91,165 @@ class InverseK:
         # If there is a solution, return the angles
         return _base, self._shoulder, self._elbow, self._wrist
 
+    def solve_incremental(self, x: float, y: float, z: float, angles: tuple, phi=FREE_ANGLE, iterations=5, damping=5.0, tolerance=0.1):
+        """
+        Move from angles toward a nearby target with damped least squares steps on the analytic Jacobian.
+
+        Meant for small moves (jogging, corrections), far targets may not be reached within the iterations.
+
+        :param angles: current (base, shoulder, elbow, wrist) radians
+        :param phi: approach angle (radians or FREE_ANGLE)
+        :param iterations: max number of steps
+        :param damping: damping factor (mm), trades accuracy near singularities for smaller steps
+        :param tolerance: stop when the position error is below (mm)
+        :return: (base, shoulder, elbow, wrist), the remaining error is in self.residual (mm)
+        """
+
+        links = (self._L0, self._L1, self._L2, self._L3)
+        q = [link.clamp(angle) for link, angle in zip(links, angles)]
+        target = (x, y, z)
+
+        if phi != FREE_ANGLE and self._planar(q)[0] < 0:
+            # Reaching behind the base, same flip as solve
+            phi = PI - phi
+
+        for iteration in range(iterations + 1):
+            position, jacobian = self._jacobian(q)
+            error = [t - p for t, p in zip(target, position)]
+            self.residual = math.sqrt(sum(e * e for e in error))
+
+            if phi != FREE_ANGLE:
+                # Hand angle in mm scale so both constraints weigh alike
+                error.append((phi - HALF_PI - q[1] - q[2] - q[3]) * self._L3.length)
+                jacobian.append([0.0, self._L3.length, self._L3.length, self._L3.length])
+
+            if iteration == iterations or self.residual <= tolerance and (phi == FREE_ANGLE or abs(error[3]) <= tolerance):
+                break
+
+            # dq = J^T (J J^T + lambda^2 I)^-1 e
+            rows = len(error)
+            jjt = [[sum(jacobian[i][k] * jacobian[j][k] for k in range(4)) + (damping * damping if i == j else 0.0)
+                    for j in range(rows)] for i in range(rows)]
+            weights = self._linear_solve(jjt, error)
+
+            q = [link.clamp(angle + sum(jacobian[i][k] * weights[i] for i in range(rows)))
+                 for k, (link, angle) in enumerate(zip(links, q))]
+
+        return tuple(q)
+
+    def _planar(self, q: list) -> tuple:
+
+        # Radius and height in the arm plane, angles are measured from the vertical
+        shoulder = q[1]
+        elbow = shoulder + q[2]
+        wrist = elbow + q[3]
+
+        r = -(self._L1.length * math.sin(shoulder) + self._L2.length * math.sin(elbow) + self._L3.length * math.sin(wrist))
+        z = self._L0.length + self._L1.length * math.cos(shoulder) + self._L2.length * math.cos(elbow) + self._L3.length * math.cos(wrist)
+
+        return r, z
+
+    def _jacobian(self, q: list) -> tuple:
+
+        # Returns ((x, y, z), 3x4 Jacobian)
+        base, shoulder = q[0], q[1]
+        elbow = shoulder + q[2]
+        wrist = elbow + q[3]
+
+        l1, l2, l3 = self._L1.length, self._L2.length, self._L3.length
+        r, z = self._planar(q)
+
+        # d(r)/d(shoulder, elbow, wrist) and d(z)/d(shoulder, elbow, wrist)
+        dr3 = -l3 * math.cos(wrist)
+        dr2 = dr3 - l2 * math.cos(elbow)
+        dr1 = dr2 - l1 * math.cos(shoulder)
+
+        dz3 = -l3 * math.sin(wrist)
+        dz2 = dz3 - l2 * math.sin(elbow)
+        dz1 = dz2 - l1 * math.sin(shoulder)
+
+        cos, sin = math.cos(base), math.sin(base)
+
+        jacobian = [
+            [-sin * r, cos * dr1, cos * dr2, cos * dr3],
+            [cos * r, sin * dr1, sin * dr2, sin * dr3],
+            [0.0, dz1, dz2, dz3],
+        ]
+
+        return (cos * r, sin * r, z), jacobian
+
+    @staticmethod
+    def _linear_solve(a: list, b: list) -> list:
+
+        # Gaussian elimination with partial pivoting, a is symmetric positive definite here
+        n = len(b)
+        m = [row[:] + [value] for row, value in zip(a, b)]
+
+        for col in range(n):
+            pivot = max(range(col, n), key=lambda i: abs(m[i][col]))
+            m[col], m[pivot] = m[pivot], m[col]
+
+            for row in range(col + 1, n):
+                factor = m[row][col] / m[col][col]
+                for k in range(col, n + 1):
+                    m[row][k] -= factor * m[col][k]
+
+        result = [0.0] * n
+        for row in range(n - 1, -1, -1):
+            result[row] = (m[row][n] - sum(m[row][k] * result[k] for k in range(row + 1, n))) / m[row][row]
+
+        return result
+
+    def solve_many(self, targets, phi=FREE_ANGLE):
+
+        """
+        Solve a batch of targets at once.
+
+        :param targets: array of shape (N, 3) | rows of (x, y, z)
+        :param phi: approach angle (radians or FREE_ANGLE), scalar or array of shape (N,)
+        :return: (angles, reachable) | angles: (N, 4) base, shoulder, elbow, wrist (nan if unreachable)
+        """
+
+        if np is None:
+            raise ImportError("numpy is required to solve a batch of targets")
+
+        targets = np.asarray(targets, dtype=float).reshape(-1, 3)
+        x, y, z = targets[:, 0], targets[:, 1], targets[:, 2]
+        phi = np.broadcast_to(np.asarray(phi, dtype=float), x.shape).copy()
+        free = phi == FREE_ANGLE
+
+        # Solve the angle of the base
+        _r = np.sqrt(x * x + y * y)
+        _base = np.arctan2(y, x)
+
+        # If not in range, flip the angle
+        flip = ~self._L0.in_range_many(_base)
+        _base = np.where(flip, _base + np.where(_base < 0, PI, -PI), _base)
+        _r = np.where(flip, -_r, _r)
+        phi = np.where(flip & ~free, PI - phi, phi)
+
+        _y = z - self._L0.length
+
+        angles = np.full((len(x), 4), np.nan)
+        angles[:, 0] = _base
+        reachable = np.zeros(len(x), dtype=bool)
+
+        # Solve XY(RZ) for the arm plane
+        fixed = ~free
+        if fixed.any():
+            shoulder, elbow, wrist, ok = self._solve_many(_r[fixed], _y[fixed], phi[fixed])
+            angles[fixed, 1:] = np.stack((shoulder, elbow, wrist), axis=1)
+            reachable[fixed] = ok
+
+        if free.any():
+            shoulder, elbow, wrist, ok = self._solve_free_angle_many(_r[free], _y[free])
+            angles[free, 1:] = np.stack((shoulder, elbow, wrist), axis=1)
+            reachable[free] = ok
+
+        angles[~reachable] = np.nan
+
+        return angles, reachable
+
     @staticmethod
     def _cosrule(opposite: float, adjacent1: float, adjacent2: float, angle: list) -> bool:
 
@@ -138,18 +317,216 @@ class InverseK:
 
         return True
 
+    def _solve_many(self, x, y, phi) -> tuple:
+
+        # Same as _solve on broadcastable arrays, returns (shoulder, elbow, wrist, ok)
+        _r = np.sqrt(x * x + y * y)
+        _theta = np.arctan2(y, x)
+        _x = _r * np.cos(_theta - HALF_PI)
+        _y = _r * np.sin(_theta - HALF_PI)
+        _phi = phi - HALF_PI
+
+        # Find the coordinate for the wrist
+        xw = _x - self._L3.length * np.cos(_phi)
+        yw = _y - self._L3.length * np.sin(_phi)
+
+        # Get polar system
+        alpha = np.arctan2(yw, xw)
+        r = np.sqrt(xw * xw + yw * yw)
+
+        # Inner angles of the shoulder and the elbow (cosine rule)
+        l1, l2 = self._L1.length, self._L2.length
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cos_beta = (r * r + l1 * l1 - l2 * l2) / (2 * r * l1)
+        cos_gamma = (l1 * l1 + l2 * l2 - r * r) / (2 * l1 * l2)
+
+        ok = (r != 0) & (np.abs(cos_beta) <= 1) & (np.abs(cos_gamma) <= 1)
+        beta = np.arccos(np.where(ok, cos_beta, 0))
+        gamma = np.arccos(np.where(ok, cos_gamma, 0))
+
+        # Solve the angles of the arm
+        _shoulder = alpha - beta
+        _elbow = PI - gamma
+        _wrist = _phi - _shoulder - _elbow
+
+        first = self._L1.in_range_many(_shoulder) & self._L2.in_range_many(_elbow) & self._L3.in_range_many(_wrist)
+
+        # Second solution
+        shoulder2 = _shoulder + 2 * beta
+        elbow2 = -_elbow
+        wrist2 = _phi - shoulder2 - elbow2
+
+        second = self._L1.in_range_many(shoulder2) & self._L2.in_range_many(elbow2) & self._L3.in_range_many(wrist2)
+
+        shoulder = np.where(first, _shoulder, shoulder2)
+        elbow = np.where(first, _elbow, elbow2)
+        wrist = np.where(first, _wrist, wrist2)
+
+        return shoulder, elbow, wrist, ok & (first | second)
+
+    def _solve_free_angle_many(self, x, y, chunk=256) -> tuple:
+
+        # Same sweep as _solve_free_angle, keeps the first phi that has a solution
+        phis = np.arange(-DOUBLE_PI, DOUBLE_PI, DEGREE_STEP)
+
+        shoulder = np.full(len(x), np.nan)
+        elbow = np.full(len(x), np.nan)
+        wrist = np.full(len(x), np.nan)
+        ok = np.zeros(len(x), dtype=bool)
+
+        for start in range(0, len(x), chunk):
+            rows = slice(start, start + chunk)
+            s, e, w, o = self._solve_many(x[rows, None], y[rows, None], phis[None, :])
+
+            first = o.argmax(axis=1)
+            index = np.arange(len(first))
+
+            shoulder[rows] = s[index, first]
+            elbow[rows] = e[index, first]
+            wrist[rows] = w[index, first]
+            ok[rows] = o.any(axis=1)
+
+        return shoulder, elbow, wrist, ok
+
+    def _phi_intervals(self, x: float, y: float) -> list:
+
+        # Approach angles for which the wrist is within reach of the upperarm and the forearm:
+        # |target - hand(phi)|² = d² + L3² - 2 * L3 * d * cos(phi - theta)
+        d = math.sqrt(x * x + y * y)
+        r_min = abs(self._L1.length - self._L2.length)
+        r_max = self._L1.length + self._L2.length
+        hand = self._L3.length
+
+        # phi - HALF_PI is the sum of the three hinge angles
+        phi_low = max(HALF_PI + self._L1._angleLow + self._L2._angleLow + self._L3._angleLow, -DOUBLE_PI)
+        phi_high = min(HALF_PI + self._L1._angleHigh + self._L2._angleHigh + self._L3._angleHigh, DOUBLE_PI)
+
+        if d == 0:
+            return [(phi_low, phi_high)] if r_min <= hand <= r_max else []
+
+        cos_low = (d * d + hand * hand - r_max * r_max) / (2 * hand * d)
+        cos_high = (d * d + hand * hand - r_min * r_min) / (2 * hand * d)
+
+        if cos_low > 1 or cos_high < -1:
+            return []
+
+        # Pad by one step, _solve does the exact check
+        a_low = max(math.acos(min(cos_high, 1)) - DEGREE_STEP, 0)
+        a_high = min(math.acos(max(cos_low, -1)) + DEGREE_STEP, PI)
+        theta = math.atan2(y, x)
+
+        arcs = list()
+        for turn in range(-2, 3):
+            center = theta + turn * DOUBLE_PI
+            for low, high in ((center + a_low, center + a_high), (center - a_high, center - a_low)):
+                low, high = max(low, phi_low), min(high, phi_high)
+                if low <= high:
+                    arcs.append((low, high))
+
+        # Merge overlapping arcs
+        intervals = list()
+        for low, high in sorted(arcs):
+            if intervals and low <= intervals[-1][1]:
+                intervals[-1] = (intervals[-1][0], max(intervals[-1][1], high))
+            else:
+                intervals.append((low, high))
+
+        return intervals
+
+    def _phi_candidates(self, intervals: list, step: float):
+
+        # Points every step in each interval, with the neighbour to bisect toward on success (the one toward the
+        # previous phi with closest_phi, the lower one otherwise)
+        if self.closest_phi:
+            distance = self._phi_distance
+
+            candidates = list()
+            for low, high in intervals:
+                count = max(math.ceil((high - low) / step), 1)
+                points = [low + (high - low) * i / count for i in range(count + 1)]
+
+                for i, phi in enumerate(points):
+                    below = points[i - 1] if i > 0 else None
+                    above = points[i + 1] if i < count else None
+
+                    if below is None or (above is not None and distance(above) < distance(below)):
+                        candidates.append((distance(phi), phi, above))
+                    else:
+                        candidates.append((distance(phi), phi, below))
+
+            candidates.sort()
+            for _, phi, neighbour in candidates:
+                yield phi, neighbour
+            return
+
+        # Lowest first, generated lazily since the first hit ends the search
+        for low, high in intervals:
+            count = max(math.ceil((high - low) / step), 1)
+            width = (high - low) / count
+            neighbour = None
+
+            for i in range(count + 1):
+                phi = low + width * i
+                yield phi, neighbour
+                neighbour = phi
+
     def _solve_free_angle(self, x: float, y: float) -> bool:
-        if self._solve(x, y, self._currentPhi):
-            return True
 
-        phi = -DOUBLE_PI
-        while phi < DOUBLE_PI:
-            if self._solve(x, y, phi):
-                _currentPhi = phi
-                return True
-            phi += DEGREE_STEP
+        solved, iterations = self._search_free_angle(x, y)
+
+        if instrumentation.enabled:
+            instrumentation.record("solve_free_angle.iterations", iterations)
 
-        return False
+        return solved
+
+    def _search_free_angle(self, x: float, y: float) -> tuple:
+
+        # Returns (solved, number of _solve calls)
+        if self._solve(x, y, self._currentPhi):
+            return True, 1
+
+        intervals = self._phi_intervals(x, y)
+        iterations = 1
+
+        # Coarse to fine: a window narrower than COARSE_STEP is only found by the fine pass. With closest_phi, the fine
+        # pass also looks for a narrow window closer than the coarse hit.
+        found = None
+        for step in (COARSE_STEP, DEGREE_STEP):
+            if found is not None and not (self.closest_phi and self._phi_distance(found) > step):
+                break
+
+            for phi, neighbour in self._phi_candidates(intervals, step):
+                if found is not None and self._phi_distance(phi) >= self._phi_distance(found):
+                    break
+
+                iterations += 1
+                if not self._solve(x, y, phi):
+                    continue
+
+                # Bisect toward the neighbour (which has no solution) down to DEGREE_STEP
+                if neighbour is not None:
+                    while abs(phi - neighbour) > DEGREE_STEP:
+                        middle = (phi + neighbour) / 2
+                        iterations += 1
+                        if self._solve(x, y, middle):
+                            phi = middle
+                        else:
+                            neighbour = middle
+
+                found = phi
+                break
+
+        if found is None:
+            return False, iterations
+
+        # _solve only stores successful solutions, so the stored angles are the ones for found
+        self._currentPhi = found
+        return True, iterations
+
+    def _phi_distance(self, phi: float) -> float:
+
+        # phi and phi + 2π are the same hand orientation
+        return abs((phi - self._currentPhi + PI) % DOUBLE_PI - PI)
 
 
 _base = Link(BASE_LENGTH, -1.57, 1.57)
@@ -0,0 +1,163 @@
+# Several xArms in one process. Each Arm owns its transport and a dispatch thread that runs the lib.arm functions
+# bound to it (see servo_controller.bind_thread), so the module level API keeps driving the default arm.
+#
+#     arms = [Arm(serial=serial) for serial, _ in list_devices()]
+#     move_all(arms, [(500, 500, 500, 500, 500)] * len(arms), 1000)
+
+from lib import arm
+from lib import servo_controller
+from lib.inverse_kinematics import FREE_ANGLE
+from lib.shadow_state import ShadowState
+from lib.transport import HIDTransport, list_devices
+
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+import threading
+
+
+class Arm:
+
+    def __init__(self, serial=None, path=None, transport=None) -> None:
+
+        """
+        One xArm with its own command queue and dispatch thread, commands run in the order they are submitted.
+
+        :param serial: HID serial number (see list_devices)
+        :param path: HID path (see list_devices)
+        :param transport: any transport instead of a HID device (SimulatedTransport...)
+        """
+
+        self.transport = transport if transport is not None else HIDTransport(serial=serial, path=path)
+        self.shadow = ShadowState()
+
+        name = serial or (path.decode() if isinstance(path, bytes) else path) or "xArm"
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"xArm-{name}",
+                                           initializer=servo_controller.bind_thread, initargs=(self.transport, self.shadow))
+
+    def submit(self, function, *args, **kwargs):
+
+        """Queue function(*args, **kwargs) on the arm, return a concurrent.futures.Future"""
+
+        return self.executor.submit(function, *args, **kwargs)
+
+    def call(self, function, *args, **kwargs):
+
+        """Run function(*args, **kwargs) on the arm and return its result"""
+
+        return self.submit(function, *args, **kwargs).result()
+
+    def close(self) -> None:
+
+        self.executor.shutdown(wait=True)
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def move_servos(self, servos_id: tuple, positions: tuple, time: int, wait=True) -> None:
+        self.call(servo_controller.move_servos, servos_id, positions, time, wait)
+
+    def unload_servos(self, servos_id: tuple) -> None:
+        self.call(servo_controller.unload_servos, servos_id)
+
+    def get_servos_position(self, servos_id: tuple, timeout=0.5) -> tuple:
+        return self.call(servo_controller.get_servos_position, servos_id, timeout)
+
+    def grip_open(self) -> None:
+        self.call(arm.grip_open)
+
+    def grip_close(self, value=650) -> None:
+        self.call(arm.grip_close, value)
+
+    def movej(self, joint: tuple, time: int, wait=True) -> None:
+        self.call(arm.movej, joint, time, wait)
+
+    def movel(self, point: tuple, time: int, hand_orientation=500, approach_angle=FREE_ANGLE, waypoints=1, tolerance=None) -> None:
+        self.call(arm.movel, point, time, hand_orientation, approach_angle, waypoints, tolerance)
+
+    def movec(self, via: tuple, point: tuple, time: int, hand_orientation=500, approach_angle=FREE_ANGLE, tolerance=1.0):
+        return self.call(arm.movec, via, point, time, hand_orientation, approach_angle, tolerance)
+
+    def movep(self, targets: list, **kwargs):
+        return self.call(arm.movep, targets, **kwargs)
+
+    def get_position(self, cartesian=False, source="hardware") -> tuple:
+        return self.call(arm.get_position, cartesian, source)
+
+    def motors_on(self) -> None:
+        self.call(arm.motors_on)
+
+    def motors_off(self) -> None:
+        self.call(arm.motors_off)
+
+
+def _synchronized_move(barrier: threading.Barrier, joint: tuple, time: int, wait: bool, timeout: float) -> float:
+
+    # Converted before the barrier so the write follows the release immediately, a failure releases the other arms
+    try:
+        servos_id = (2, 3, 4, 5, 6)
+        positions = tuple(joint[::-1])
+        duration = int(time / arm.speed)
+    except BaseException:
+        barrier.abort()
+        raise
+
+    barrier.wait(timeout)
+    servo_controller.move_servos(servos_id, positions, duration, wait=False)
+    written = perf_counter()
+
+    # The arm stays busy until its move is due to finish
+    if wait:
+        servo_controller.sleep((duration + 50) / 1000)
+
+    return written
+
+
+def move_all(arms: list, joints: list, time: int, wait=True, timeout=30.0) -> float:
+    """
+    Start a movej on every arm at the same time.
+
+    :param arms: list of Arm
+    :param joints: one tuple(j1, j2, j3, j4, j5) per arm
+    :param time: 0-65535 milliseconds
+    :param wait: wait until the moves are due to finish
+    :param timeout: max wait for every arm to be ready (seconds), commands queued before run first
+    :return: skew between the first and the last write (seconds)
+    """
+
+    if len(arms) != len(joints):
+        raise ValueError("one joint position per arm is required")
+
+    # Every dispatch thread waits for the others, an arm that fails breaks the barrier instead of leaving them waiting
+    barrier = threading.Barrier(len(arms))
+    futures = list()
+    try:
+        for a, joint in zip(arms, joints):
+            futures.append(a.submit(_synchronized_move, barrier, joint, time, wait, timeout))
+    except BaseException:
+        barrier.abort()
+        raise
+
+    # The error of the failing arm rather than the broken barrier of the others
+    errors = [future.exception() for future in futures]
+    for error in sorted((e for e in errors if e is not None), key=lambda e: isinstance(e, threading.BrokenBarrierError)):
+        raise error
+
+    written = [future.result() for future in futures]
+
+    return max(written) - min(written)
+
+
+def read_all(arms: list, servos_id=(6, 5, 4, 3, 2, 1), timeout=0.5) -> list:
+    """
+    Read the servos positions of every arm in parallel.
+
+    :return: one tuple of positions per arm, in the order of arms
+    """
+
+    futures = [a.submit(servo_controller.get_servos_position, servos_id, timeout) for a in arms]
+
+    return [future.result() for future in futures]
@@ -0,0 +1,140 @@
+from lib.cartesian import compute_ik, compute_fk
+from lib.inverse_kinematics import FREE_ANGLE
+
+import math
+
+# Each level doubles the number of segments
+MAX_DEPTH = 10
+
+
+def line(start: tuple, end: tuple):
+
+    """Straight line from start to end, as a function of t in [0, 1]"""
+
+    def point(t: float) -> tuple:
+        return tuple(s + (e - s) * t for s, e in zip(start, end))
+
+    return point
+
+
+def arc(start: tuple, via: tuple, end: tuple):
+
+    """Circular arc from start to end passing through via, as a function of t in [0, 1]"""
+
+    a = _sub(via, start)
+    b = _sub(end, start)
+    normal = _cross(a, b)
+    area = _dot(normal, normal)
+
+    if area < 1e-9:
+        raise ValueError("start, via and end are aligned")
+
+    # Circumcenter of the triangle (start, via, end)
+    offset = _add(_scale(_cross(normal, a), _dot(b, b)), _scale(_cross(b, normal), _dot(a, a)))
+    center = _add(start, _scale(offset, 1 / (2 * area)))
+
+    radius = math.sqrt(_dot(_sub(start, center), _sub(start, center)))
+    u = _scale(_sub(start, center), 1 / radius)
+    v = _cross(_scale(normal, 1 / math.sqrt(area)), u)
+
+    def angle(p: tuple) -> float:
+        d = _sub(p, center)
+        return math.atan2(_dot(d, v), _dot(d, u)) % (2 * math.pi)
+
+    # v is oriented so the arc turns in the positive direction through via
+    sweep = angle(end)
+
+    def point(t: float) -> tuple:
+        theta = sweep * t
+        return _add(center, _add(_scale(u, radius * math.cos(theta)), _scale(v, radius * math.sin(theta))))
+
+    return point
+
+
+def segment(path, start_joint: tuple, tolerance=1.0, hand_orientation=500, approach_angle=FREE_ANGLE, max_depth=MAX_DEPTH) -> list:
+    """
+    Split path into the fewest joint moves that keep the tool within tolerance of it.
+
+    Servos move linearly in joint space, a segment is bisected until the FK of its joint midpoint is within tolerance
+    of the point halfway along the path.
+
+    :param path: function of t in [0, 1] returning tuple(x, y, z), see line and arc
+    :param start_joint: tuple(j1, j2, j3, j4, j5) position of the arm at path(0)
+    :param tolerance: max distance (mm)
+    :param hand_orientation: orientation of the hand
+    :param approach_angle: radians or FREE_ANGLE
+    :param max_depth: max number of bisections of a segment
+    :return: list of (t, tuple(j1, j2, j3, j4, j5)) at the end of each segment
+    """
+
+    if not tolerance > 0:
+        raise ValueError("tolerance must be greater than 0")
+
+    end_joint = compute_ik(path(1.0), hand_orientation, approach_angle)
+
+    segments = list()
+
+    # Depth first from the start so segments are found in order
+    stack = [(0.0, tuple(start_joint), 1.0, end_joint, 0)]
+    while stack:
+        t0, j0, t1, j1, depth = stack.pop()
+
+        middle = (t0 + t1) / 2
+        interpolated = tuple((a + b) / 2 for a, b in zip(j0, j1))
+
+        if depth >= max_depth or _distance(compute_fk(interpolated, rounded=False), path(middle)) <= tolerance:
+            segments.append((t1, j1))
+            continue
+
+        joint = compute_ik(path(middle), hand_orientation, approach_angle)
+        stack.append((middle, joint, t1, j1, depth + 1))
+        stack.append((t0, j0, middle, joint, depth + 1))
+
+    return segments
+
+
+def timed(segments: list, time: int) -> tuple:
+    """
+    Durations of the segments for a constant speed along the path.
+
+    :param segments: list of (t, joint) from segment
+    :param time: duration of the whole path (milliseconds)
+    :return: (list of joints, list of durations in milliseconds)
+    """
+
+    joints = list()
+    durations = list()
+
+    # Rounded on the cumulated time so the total stays exact
+    previous = 0
+    for t, joint in segments:
+        end = round(t * time)
+        joints.append(joint)
+        durations.append(max(end - previous, 1))
+        previous = end
+
+    return joints, durations
+
+
+def _add(a: tuple, b: tuple) -> tuple:
+    return tuple(x + y for x, y in zip(a, b))
+
+
+def _sub(a: tuple, b: tuple) -> tuple:
+    return tuple(x - y for x, y in zip(a, b))
+
+
+def _scale(a: tuple, k: float) -> tuple:
+    return tuple(x * k for x in a)
+
+
+def _dot(a: tuple, b: tuple) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+def _cross(a: tuple, b: tuple) -> tuple:
+    return a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0]
+
+
+def _distance(a: tuple, b: tuple) -> float:
+    return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
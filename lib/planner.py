@@ -0,0 +1,170 @@
+from lib.cartesian import compute_ik_many, compute_fk_many
+from lib.inverse_kinematics import FREE_ANGLE
+from lib.trajectory import MAX_VELOCITY, MAX_ACCELERATION
+
+from collections import namedtuple
+import math
+import time
+
+import numpy as np
+
+# Max distance (mm) between a target and the FK of its IK solution
+FK_TOLERANCE = 3
+
+# order: indices of the targets in visiting order, duration: estimated travel time (seconds),
+# joints: (N, 5) servo positions of each target (approach point if an offset is given), in the order of the targets
+Plan = namedtuple("Plan", ("order", "duration", "joints"))
+
+
+def travel_times(joints, max_velocity=MAX_VELOCITY, max_acceleration=MAX_ACCELERATION):
+    """
+    Time of a rest to rest move between every pair of joint positions, set by the slowest joint.
+
+    :param joints: array of shape (N, 5) servo positions
+    :param max_velocity: units/s, scalar or one value per joint
+    :param max_acceleration: units/s², scalar or one value per joint
+    :return: array of shape (N, N) seconds
+    """
+
+    joints = np.asarray(joints, dtype=float)
+    v = np.broadcast_to(np.asarray(max_velocity, dtype=float), joints.shape[1:])
+    a = np.broadcast_to(np.asarray(max_acceleration, dtype=float), joints.shape[1:])
+
+    distance = np.abs(joints[:, None, :] - joints[None, :, :])
+
+    # Trapezoid when the max velocity is reached, triangle otherwise (see Trajectory._min_time)
+    times = np.where(distance >= v * v / a, distance / v + v / a, 2 * np.sqrt(distance / a))
+
+    return times.max(axis=2)
+
+
+def plan(targets: list, precedence=(), start=None, offset=None, hand_orientation=500, approach_angle=FREE_ANGLE,
+         max_velocity=MAX_VELOCITY, max_acceleration=MAX_ACCELERATION, time_limit=0.5) -> Plan:
+    """
+    Order targets to minimize the joint travel time, nearest neighbour then 2-opt.
+
+    :param targets: list of tuple(x, y, z)
+    :param precedence: list of (a, b) target indices, a is visited before b
+    :param start: tuple(j1, j2, j3, j4, j5) position of the arm, None to start at any target
+    :param offset: tuple(x, y, z) approach offset (see appro), travel is computed between approach points
+    :param hand_orientation: orientation of the hand
+    :param approach_angle: approach angle (degrees)
+    :param max_velocity: units/s, scalar or one value per joint
+    :param max_acceleration: units/s², scalar or one value per joint
+    :param time_limit: max time spent improving the order (seconds)
+    :return: Plan
+    """
+
+    deadline = time.perf_counter() + time_limit
+
+    points = np.asarray(targets, dtype=float).reshape(-1, 3)
+    if offset is not None:
+        points = points + np.asarray(offset, dtype=float)
+
+    count = len(points)
+    if count == 0:
+        return Plan(list(), 0.0, np.zeros((0, 5), dtype=int))
+
+    if approach_angle != FREE_ANGLE:
+        approach_angle = math.radians(approach_angle)
+
+    joints, reachable = compute_ik_many(points, hand_orientation, approach_angle)
+
+    # Check the batch IK against the batch FK
+    reachable &= np.linalg.norm(compute_fk_many(joints) - points, axis=1) <= FK_TOLERANCE
+    if not reachable.all():
+        raise ValueError(f"unreachable targets: {np.flatnonzero(~reachable).tolist()}")
+
+    # Node 0 is the start, costs nothing to leave when not given
+    nodes = np.vstack((joints[:1] if start is None else np.asarray(start, dtype=float).reshape(1, 5), joints))
+    cost = travel_times(nodes, max_velocity, max_acceleration)
+    if start is None:
+        cost[0] = 0.0
+
+    before = [set() for _ in range(count + 1)]
+    for a, b in precedence:
+        before[b + 1].add(a + 1)
+
+    tour = _nearest_neighbour(cost, before)
+    tour = _two_opt(tour, cost, [(a + 1, b + 1) for a, b in precedence], deadline)
+
+    duration = float(cost[tour[:-1], tour[1:]].sum())
+
+    return Plan([node - 1 for node in tour[1:]], duration, joints)
+
+
+def _nearest_neighbour(cost, before: list) -> np.ndarray:
+
+    count = len(cost)
+    visited = np.zeros(count, dtype=bool)
+    visited[0] = True
+
+    # Number of predecessors not visited yet
+    waiting = np.array([len(b) for b in before])
+    after = [list() for _ in range(count)]
+    for node, predecessors in enumerate(before):
+        for predecessor in predecessors:
+            after[predecessor].append(node)
+
+    tour = [0]
+    for _ in range(count - 1):
+        available = ~visited & (waiting == 0)
+        if not available.any():
+            raise ValueError("precedence constraints contain a cycle")
+
+        costs = np.where(available, cost[tour[-1]], np.inf)
+        node = int(costs.argmin())
+
+        tour.append(node)
+        visited[node] = True
+        for following in after[node]:
+            waiting[following] -= 1
+
+    return np.array(tour)
+
+
+def _two_opt(tour: np.ndarray, cost, precedence: list, deadline: float) -> np.ndarray:
+
+    # Open path, the start (tour[0]) stays first. Reversing tour[i:k + 1] is only allowed if no constraint has
+    # both ends in it.
+    count = len(tour)
+    if count < 4:
+        return tour
+
+    constraints = np.array(precedence, dtype=int).reshape(-1, 2)
+
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+
+        for i in range(1, count - 1):
+            k = np.arange(i + 1, count)
+            a, b = tour[i - 1], tour[i]
+            c = tour[k]
+
+            # The last node has no successor
+            following = np.append(tour[k[:-1] + 1], -1)
+            d_next = np.where(following >= 0, cost[b, following] - cost[c, following.clip(0)], 0.0)
+            delta = cost[a, c] - cost[a, b] + d_next
+
+            if constraints.size:
+                position = np.empty(len(tour), dtype=int)
+                position[tour] = np.arange(len(tour))
+                first, second = position[constraints[:, 0]], position[constraints[:, 1]]
+
+                # Only constraints starting in the segment can be broken
+                inside = first >= i
+                if inside.any():
+                    end = second[inside].min()
+                    delta[end - i - 1:] = np.maximum(delta[end - i - 1:], 0.0)
+
+            best = int(delta.argmin())
+            if delta[best] < -1e-9:
+                end = i + 1 + best
+                tour[i:end + 1] = tour[i:end + 1][::-1].copy()
+                improved = True
+
+            if time.perf_counter() > deadline:
+                break
+
+    return tour
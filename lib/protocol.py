@@ -0,0 +1,202 @@
+# LOBOT servo controller protocol.
+# Frames are written into preallocated buffers with struct.pack_into, the memoryviews returned by FrameEncoder are
+# only valid until the next frame is encoded with the same encoder.
+
+import struct
+
+
+FRAME_HEADER = 0x55
+CMD_SERVO_MOVE = 0x03
+CMD_MULT_SERVO_UNLOAD = 0x14
+CMD_MULT_SERVO_POS_READ = 0x15
+
+# A HID report is 64 bytes
+MAX_SERVOS = 18
+
+# Hid id, header, header, length, command
+HEADER = struct.Struct("<BBBBB")
+# Number of servo, time
+MOVE = struct.Struct("<BH")
+# Servo id, position
+SERVO_POSITION = struct.Struct("<BH")
+
+
+def move_size(count: int) -> int:
+    return HEADER.size + MOVE.size + count * SERVO_POSITION.size
+
+
+def servos_size(count: int) -> int:
+    return HEADER.size + 1 + count
+
+
+def encode_move_into(buf, offset: int, servos_id: tuple, positions: tuple, time: int) -> int:
+
+    """Encode a CMD_SERVO_MOVE frame at offset, return its size"""
+
+    count = len(servos_id)
+
+    HEADER.pack_into(buf, offset, 0x00, FRAME_HEADER, FRAME_HEADER, count * 3 + 5, CMD_SERVO_MOVE)
+    MOVE.pack_into(buf, offset + HEADER.size, count, time)
+
+    index = offset + HEADER.size + MOVE.size
+    for servo_id, position in zip(servos_id, positions):
+        SERVO_POSITION.pack_into(buf, index, servo_id, position)
+        index += SERVO_POSITION.size
+
+    return index - offset
+
+
+def encode_servos_into(buf, offset: int, command: int, servos_id: tuple) -> int:
+
+    """Encode a frame that takes a list of servos (CMD_MULT_SERVO_UNLOAD, CMD_MULT_SERVO_POS_READ), return its size"""
+
+    count = len(servos_id)
+
+    HEADER.pack_into(buf, offset, 0x00, FRAME_HEADER, FRAME_HEADER, count + 3, command)
+    buf[offset + HEADER.size] = count
+
+    for index, servo_id in enumerate(servos_id, offset + HEADER.size + 1):
+        buf[index] = servo_id
+
+    return HEADER.size + 1 + count
+
+
+def encode_positions_into(buf, offset: int, servos_id: tuple, positions: tuple) -> int:
+
+    """Encode a CMD_MULT_SERVO_POS_READ reply (as sent by the controller, without hid id), return its size"""
+
+    count = len(servos_id)
+
+    struct.pack_into("<BBBBB", buf, offset, FRAME_HEADER, FRAME_HEADER, count * 3 + 3, CMD_MULT_SERVO_POS_READ, count)
+
+    index = offset + 5
+    for servo_id, position in zip(servos_id, positions):
+        SERVO_POSITION.pack_into(buf, index, servo_id, position)
+        index += SERVO_POSITION.size
+
+    return index - offset
+
+
+class FrameEncoder:
+
+    def __init__(self, max_servos=MAX_SERVOS) -> None:
+
+        """Encode frames into one reusable buffer."""
+
+        self._buf = bytearray(move_size(max_servos))
+        self._view = memoryview(self._buf)
+
+    def move(self, servos_id: tuple, positions: tuple, time: int) -> memoryview:
+        return self._view[:encode_move_into(self._buf, 0, servos_id, positions, time)]
+
+    def unload(self, servos_id: tuple) -> memoryview:
+        return self._view[:encode_servos_into(self._buf, 0, CMD_MULT_SERVO_UNLOAD, servos_id)]
+
+    def read_positions(self, servos_id: tuple) -> memoryview:
+        return self._view[:encode_servos_into(self._buf, 0, CMD_MULT_SERVO_POS_READ, servos_id)]
+
+
+class FrameBatch:
+
+    def __init__(self, frames) -> None:
+
+        """
+        Encode a whole trajectory into one contiguous buffer.
+
+        :param frames: iterable of (servos_id, positions, time)
+        """
+
+        frames = list(frames)
+
+        self.buffer = bytearray(sum(move_size(len(servos_id)) for servos_id, _, _ in frames))
+        self.offsets = list()
+
+        offset = 0
+        for servos_id, positions, time in frames:
+            size = encode_move_into(self.buffer, offset, servos_id, positions, time)
+            self.offsets.append((offset, size))
+            offset += size
+
+        self._view = memoryview(self.buffer)
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __getitem__(self, index: int) -> memoryview:
+        offset, size = self.offsets[index]
+        return self._view[offset:offset + size]
+
+    def __iter__(self):
+        for offset, size in self.offsets:
+            yield self._view[offset:offset + size]
+
+
+def decode_frame(data):
+
+    """
+    Split a frame written to the controller (with hid id).
+
+    :return: (command, params) | params: memoryview
+    """
+
+    view = memoryview(data)
+
+    if len(view) < HEADER.size or view[1] != FRAME_HEADER or view[2] != FRAME_HEADER:
+        raise ValueError(f"malformed frame {bytes(view).hex()}")
+
+    return view[4], view[HEADER.size:]
+
+
+def decode_move(params) -> tuple:
+
+    """Return (servos_id, positions, time) from the params of a CMD_SERVO_MOVE frame"""
+
+    count, time = MOVE.unpack_from(params, 0)
+
+    servos_id = list()
+    positions = list()
+    for index in range(MOVE.size, MOVE.size + count * SERVO_POSITION.size, SERVO_POSITION.size):
+        servo_id, position = SERVO_POSITION.unpack_from(params, index)
+        servos_id.append(servo_id)
+        positions.append(position)
+
+    return tuple(servos_id), tuple(positions), time
+
+
+def decode_servos(params) -> tuple:
+
+    """Return servos_id from the params of a CMD_MULT_SERVO_UNLOAD or CMD_MULT_SERVO_POS_READ frame"""
+
+    return tuple(params[1:1 + params[0]])
+
+
+def parse_positions(data, servos_id: tuple):
+    """
+    Find a position reply for servos_id in data without copying it.
+
+    :param data: bytes, bytearray or memoryview
+    :return: tuple of positions or None if data doesn't contain a valid reply (stale or garbage)
+    """
+
+    view = memoryview(data)
+    count = len(servos_id)
+    size = 5 + count * 3
+
+    # Resynchronise on the next frame header
+    for start in range(len(view) - size + 1):
+        if view[start] != FRAME_HEADER or view[start + 1] != FRAME_HEADER:
+            continue
+
+        if view[start + 2] != count * 3 + 3 or view[start + 3] != CMD_MULT_SERVO_POS_READ or view[start + 4] != count:
+            continue
+
+        positions = list()
+        for index, servo in enumerate(servos_id):
+            servo_id, position = SERVO_POSITION.unpack_from(view, start + 5 + index * 3)
+            if servo_id != servo:
+                break
+            positions.append(position)
+        else:
+            return tuple(positions)
+
+    return None
@@ -1,123 +1,534 @@
-from time import sleep
+from lib.transport import *
+from lib.protocol import *
+from lib.shadow_state import ShadowState
+from lib import instrumentation
 
-import struct
-import hid
+import atexit
+import math
+import threading
+import os
 
 
-FRAME_HEADER = 0x55
-CMD_SERVO_MOVE = 0x03
-CMD_MULT_SERVO_UNLOAD = 0x14
-CMD_MULT_SERVO_POS_READ = 0x15
+# Opened on first use (see get_transport)
+transport = None
 
+# Per thread frame encoder, transport and shadow state bound by bind_thread
+_frames = threading.local()
 
-device = hid.device()
-device.open(0x0483, 0x5750)  # LOBOT VendorID/ProductID
+# Commanded positions, allows to estimate positions without reading the bus
+shadow = ShadowState()
 
-print(f"Manufacturer: {device.get_manufacturer_string()}")
-print(f"Product: {device.get_product_string()}")
-print(f"Serial No: {device.get_serial_number_string()}")
+# Moves are coalesced before being written when enabled (see use_queue)
+command_queue = None
 
+# wait="feedback": max distance (servo units) to the target, extra time allowed after the expected arrival (seconds),
+# polling starts this long before the expected arrival (seconds) then repeats every period (seconds)
+FEEDBACK_TOLERANCE = 10
+FEEDBACK_TIMEOUT = 0.5
+FEEDBACK_LEAD = 0.03
+FEEDBACK_PERIOD = 0.02
 
-def move_servo(servo_id: int, position: int, time: int) -> None:
+# Replies that are not the expected one (stale or garbage) skipped by a position read before it gives up
+MAX_STALE_REPLIES = 16
 
-    if not time > 0:
-        raise ValueError("time must be greater than 0")
 
-    position = struct.pack("<H", position)
-    _time = struct.pack("<H", time)
+class MotionTimeoutError(TimeoutError):
+
+    def __init__(self, residuals: dict) -> None:
+
+        """
+        Servos still away from their target when a feedback wait gives up.
+
+        :param residuals: dict {servo_id: target - position}, None for a servo that was never read
+        """
+
+        self.residuals = residuals
+
+        late = {servo_id: residual for servo_id, residual in residuals.items() if residual is None or residual != 0}
+        super().__init__(f"servos did not reach their target, residuals: {late}")
+
+
+def set_transport(new_transport) -> None:
+
+    """Use the given transport (HIDTransport, SimulatedTransport, RecordingTransport...)."""
+
+    global transport
+    transport = new_transport
+
+
+def open_transport():
+
+    """
+    Open a new transport according to XARM_TRANSPORT:
+    "auto" (default) the daemon if it is running else the HID device, "hid", "daemon" or "sim" (XARM_TIME_SCALE).
+    """
+
+    kind = os.environ.get("XARM_TRANSPORT", "auto")
+
+    if kind == "sim":
+        return SimulatedTransport(float(os.environ.get("XARM_TIME_SCALE", 1)))
+
+    if kind in ("auto", "daemon"):
+        from lib.daemon import DaemonTransport
+
+        try:
+            return DaemonTransport()
+        except OSError:
+            if kind == "daemon":
+                raise
+
+    return HIDTransport()
+
+
+def bind_thread(bound_transport, bound_shadow=None) -> None:
+
+    """
+    Make the calling thread use its own transport and shadow state instead of the module ones (see lib.multi_arm).
+
+    :param bound_transport: transport, None to unbind
+    :param bound_shadow: ShadowState (default a new one)
+    """
+
+    _frames.transport = bound_transport
+    if bound_transport is None:
+        bound_shadow = None
+    elif bound_shadow is None:
+        bound_shadow = ShadowState()
+
+    _frames.shadow = bound_shadow
+
+
+def get_shadow() -> ShadowState:
+
+    """Return the shadow state of the current transport."""
+
+    bound = getattr(_frames, "shadow", None)
+    return shadow if bound is None else bound
+
+
+def get_transport():
+
+    """Return the current transport, opened on first use (see open_transport)."""
+
+    global transport
+
+    bound = getattr(_frames, "transport", None)
+    if bound is not None:
+        return bound
+
+    if transport is None:
+        transport = open_transport()
+
+    return transport
+
+
+def sleep(seconds: float) -> None:
+
+    """Sleep on the transport clock (faster than real time with a scaled simulation)."""
+
+    get_transport().sleep(seconds)
+
+
+class CommandQueue:
+
+    def __init__(self, device, state: ShadowState, min_gap=0.01, hold=0.005) -> None:
+
+        """
+        Moves that don't wait are held for a short time and written by a scheduler thread. Pending moves with the same
+        duration start together so they share a deadline and go in one frame, a new target for a pending servo replaces
+        the previous one.
+
+        :param device: transport
+        :param state: shadow state of the transport
+        :param min_gap: min time between two frames (seconds)
+        :param hold: how long a move waits for others to join its frame (seconds)
+        """
+
+        self.device = device
+        self.state = state
+        self.min_gap = min_gap
+        self.hold = hold
+
+        # Moves queued, frames written, targets replaced before being written
+        self.moves = 0
+        self.frames = 0
+        self.superseded = 0
+
+        self._pending = dict()
+        self._pending_time = None
+        self._opened = None
+        self._last_write = -math.inf
+        self._busy_until = -math.inf
+
+        self._encoder = FrameEncoder()
+        self._condition = threading.Condition()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="xArm-queue", daemon=True)
+        self._thread.start()
+
+    @property
+    def saved(self) -> int:
+
+        """Frames saved by coalescing (pending moves are not counted yet)"""
+
+        with self._condition:
+            pending = 1 if self._pending else 0
+            return self.moves - self.frames - pending
+
+    def put(self, servos_id: tuple, positions: tuple, time: int) -> None:
+
+        with self._condition:
+            # Only moves of the same duration share a deadline
+            if self._pending and time != self._pending_time:
+                self._flush()
+
+            if not self._pending:
+                self._pending_time = time
+                self._opened = self.device.now()
+
+            for servo_id, position in zip(servos_id, positions):
+                if servo_id in self._pending:
+                    self.superseded += 1
+                self._pending[servo_id] = position
+
+            self.moves += 1
+            self._condition.notify_all()
+
+    def flush(self) -> float:
+
+        """Write the pending moves now, return when the last written move is due to finish (transport clock)"""
+
+        with self._condition:
+            self._flush()
+            return self._busy_until
+
+    def wait_idle(self, settle=0.05) -> None:
+
+        """Write the pending moves and wait until every move is finished"""
+
+        busy_until = self.flush()
+
+        # Nothing was ever written
+        if busy_until == -math.inf:
+            return
+
+        self.device.sleep(max(busy_until + settle - self.device.now(), 0))
 
-    buf = bytearray(11)
+    def close(self) -> None:
 
-    buf[0] = 0x00  # Hid id
-    buf[1] = FRAME_HEADER
-    buf[2] = FRAME_HEADER
-    buf[3] = 8  # Length
-    buf[4] = CMD_SERVO_MOVE
-    buf[5] = 1  # Number of servo
-    buf[6] = _time[0]
-    buf[7] = _time[1]
-    buf[8] = servo_id
-    buf[9] = position[0]
-    buf[10] = position[1]
+        with self._condition:
+            self._flush()
+            self._closed = True
+            self._condition.notify_all()
 
-    device.write(buf)
-    sleep((time + 50) / 1000)
+        self._thread.join()
 
+    def _flush(self) -> None:
 
-def move_servos(servos_id: tuple, positions: tuple, time: int) -> None:
+        # Called with the condition held
+        if not self._pending:
+            return
+
+        # The controller is never sent two frames closer than min_gap
+        gap = self._last_write + self.min_gap - self.device.now()
+        if gap > 0:
+            self.device.sleep(gap)
+
+        servos_id = tuple(self._pending)
+        positions = tuple(self._pending.values())
+        time = self._pending_time
+
+        self.device.write(self._encoder.move(servos_id, positions, time))
+
+        now = self.device.now()
+        self.state.commanded(servos_id, positions, time, now)
+
+        self._last_write = now
+        self._busy_until = max(self._busy_until, now + time / 1000)
+        self.frames += 1
+        self._pending.clear()
+
+    def _run(self) -> None:
+
+        with self._condition:
+            while not self._closed:
+                if not self._pending:
+                    self._condition.wait()
+                    continue
+
+                # Real time wait, scaled like the transport clock
+                remaining = (self._opened + self.hold - self.device.now()) / self.device.time_scale
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                else:
+                    self._flush()
+
+
+def use_queue(min_gap=0.01, hold=0.005) -> CommandQueue:
+
+    """
+    Coalesce the moves of the current transport (see CommandQueue), None to disable.
+
+    move_servos(wait=True) still writes at once and blocks until the move is finished.
+
+    :param min_gap: min time between two frames (seconds)
+    :param hold: how long a move waits for others to join its frame (seconds)
+    """
+
+    global command_queue
+
+    if command_queue is not None:
+        command_queue.close()
+        atexit.unregister(command_queue.wait_idle)
+        command_queue = None
+
+    if min_gap is not None:
+        command_queue = CommandQueue(get_transport(), get_shadow(), min_gap, hold)
+
+        # Pending moves are written before the program exits
+        atexit.register(command_queue.wait_idle)
+
+    return command_queue
+
+
+def _queue():
+
+    # The queue only applies to the transport it was created for (not to threads bound to another one)
+    if command_queue is not None and command_queue.device is get_transport():
+        return command_queue
+
+    return None
+
+
+def flush() -> None:
+
+    """Write the moves held by the command queue now."""
+
+    queue = _queue()
+    if queue is not None:
+        queue.flush()
+
+
+def wait_idle() -> None:
+
+    """Write the moves held by the command queue and wait until they are finished."""
+
+    queue = _queue()
+    if queue is not None:
+        queue.wait_idle()
+
+
+def _encoder() -> FrameEncoder:
+
+    # One reusable frame buffer per thread
+    try:
+        return _frames.encoder
+    except AttributeError:
+        _frames.encoder = FrameEncoder()
+        return _frames.encoder
+
+
+def move_servo(servo_id: int, position: int, time: int, wait=True) -> None:
+
+    move_servos((servo_id, ), (position, ), time, wait)
+
+
+def move_servos(servos_id: tuple, positions: tuple, time: int, wait=True) -> None:
+    """
+    Move servos to positions within time.
+
+    :param servos_id: tuple of servo ids
+    :param positions: tuple of positions 0-1000, in the same order as servos_id
+    :param time: 0-65535 milliseconds
+    :param wait: True sleeps for the whole move, False returns once written,
+                 "feedback" returns as soon as the servos read back within FEEDBACK_TOLERANCE (see wait_arrival)
+    """
 
     if not time > 0:
         raise ValueError("time must be greater than 0")
 
-    length = (len(servos_id) * 3) + 6
-    _time = struct.pack("<H", time)
+    if wait not in (True, False, "feedback"):
+        raise ValueError("wait must be True, False or 'feedback'")
+
+    instrumented = instrumentation.enabled
+    if instrumented:
+        start = instrumentation.clock()
+
+    queue = _queue()
+
+    if queue is not None:
+        queue.put(servos_id, positions, time)
+
+        if wait == "feedback":
+            wait_arrival(servos_id, positions, queue.flush())
+            return
+        elif wait:
+            # Written at once, the wait ends with the last move written
+            sleep(max(queue.flush() + 0.05 - get_transport().now(), 0))
+            return
+    else:
+        get_transport().write(_encoder().move(servos_id, positions, time))
+        get_shadow().commanded(servos_id, positions, time, get_transport().now())
+
+    if instrumented:
+        instrumentation.span("move_servos.write", start)
+
+    if wait == "feedback":
+        wait_arrival(servos_id, positions, get_transport().now() + time / 1000)
+    elif wait:
+        if instrumented:
+            start = instrumentation.clock()
+            sleep((time + 50) / 1000)
+            instrumentation.record("move_servos.sleep_overshoot", max((instrumentation.clock() - start) * 1e6 - (time + 50) * 1000, 0))
+        else:
+            sleep((time + 50) / 1000)
+
+
+def wait_arrival(servos_id: tuple, positions: tuple, arrival: float, tolerance=FEEDBACK_TOLERANCE, timeout=FEEDBACK_TIMEOUT) -> None:
+    """
+    Wait until the servos read back within tolerance of positions.
+
+    Nothing is read before the expected arrival minus FEEDBACK_LEAD, so the bus stays free during the move.
+
+    :param servos_id: tuple of servo ids
+    :param positions: tuple of target positions, in the same order as servos_id
+    :param arrival: time the move is due to finish (transport clock, see now)
+    :param tolerance: max distance to the target (servo units)
+    :param timeout: max wait after arrival (seconds), MotionTimeoutError is raised after it
+    """
 
-    buf = bytearray(length + 2)  # HEADER doesn't count for length
+    instrumented = instrumentation.enabled
+    if instrumented:
+        start = instrumentation.clock()
 
-    buf[0] = 0x00  # Hid id
-    buf[1] = FRAME_HEADER
-    buf[2] = FRAME_HEADER
-    buf[3] = length
-    buf[4] = CMD_SERVO_MOVE
-    buf[5] = len(servos_id)  # Number of servo
-    buf[6] = _time[0]
-    buf[7] = _time[1]
+    device = get_transport()
+    deadline = arrival + timeout
+    residuals = dict.fromkeys(servos_id)
 
-    for pos, index in enumerate(range(0, len(servos_id) * 3, 3)):
+    # A move shorter than FEEDBACK_LEAD is polled at once
+    sleep(max(arrival - FEEDBACK_LEAD - device.now(), 0))
 
-        position = struct.pack("<H", positions[pos])
+    while True:
+        poll = device.now()
 
-        buf[8 + index] = servos_id[pos]
-        buf[9 + index] = position[0]
-        buf[10 + index] = position[1]
+        try:
+            read = get_servos_position(servos_id, max(deadline - poll, FEEDBACK_PERIOD))
+        except TimeoutError:
+            pass
+        else:
+            residuals = {servo_id: target - position for servo_id, target, position in zip(servos_id, positions, read)}
+            if all(abs(residual) <= tolerance for residual in residuals.values()):
+                break
 
-    device.write(buf)
-    sleep((time + 50) / 1000)
+        if device.now() >= deadline:
+            raise MotionTimeoutError(residuals)
+
+        # A read slower than FEEDBACK_PERIOD is followed by the next one at once
+        sleep(max(min(poll + FEEDBACK_PERIOD, deadline) - device.now(), 0))
+
+    if instrumented:
+        instrumentation.span("wait_arrival", start)
+        # Time saved on the fixed wait (time + 50 ms)
+        instrumentation.record("wait_arrival.saved", max((arrival + 0.05 - device.now()) * 1e6, 0))
+
+
+def write_batch(batch: FrameBatch) -> None:
+    """
+    Write the frames of a precompiled trajectory, each one for its own duration (encoded in the frame).
+
+    :param batch: FrameBatch
+    """
+
+    flush()
+
+    device = get_transport()
+    deadline = device.now()
+
+    for frame in batch:
+        device.write(frame)
+
+        servos_id, positions, time = decode_move(frame[HEADER.size:])
+        get_shadow().commanded(servos_id, positions, time, device.now())
+
+        # Deadlines don't drift with sleep overshoot
+        deadline += time / 1000
+        sleep(max(deadline - device.now(), 0))
 
 
 def unload_servos(servos_id: tuple) -> None:
 
-    buf = bytearray(6 + len(servos_id))
+    flush()
+    get_transport().write(_encoder().unload(servos_id))
+    get_shadow().unloaded(servos_id)
+
+
+def get_servos_position(servos_id: tuple, timeout=0.5) -> tuple:
+    """
+    Read servos positions, returns as soon as the controller answers.
+
+    :param servos_id: tuple of servo ids
+    :param timeout: max wait for the reply (seconds)
+    :return: tuple of positions in the same order as servos_id
+    """
+
+    flush()
+
+    instrumented = instrumentation.enabled
+    if instrumented:
+        start = instrumentation.clock()
+
+    device = get_transport()
+    device.write(_encoder().read_positions(servos_id))
 
-    buf[0] = 0x00  # Hid id
-    buf[1] = FRAME_HEADER
-    buf[2] = FRAME_HEADER
-    buf[3] = 3 + len(servos_id)
-    buf[4] = CMD_MULT_SERVO_UNLOAD
-    buf[5] = len(servos_id)
+    if instrumented:
+        written = instrumentation.clock()
+        instrumentation.span("get_servos_position.write", start)
 
-    for index, servo in enumerate(servos_id):
-        buf[6 + index] = servo
+    deadline = device.now() + timeout
+    for _ in range(MAX_STALE_REPLIES + 1):
+        remaining = deadline - device.now()
+        if remaining <= 0:
+            break
 
-    device.write(buf)
+        # Blocks on the input report, nothing means no reply within remaining
+        data = bytes(device.read(64, max(int(remaining * 1000), 1)))
+        if not data:
+            break
 
+        positions = parse_positions(data, servos_id)
+        if positions is not None:
+            get_shadow().reconcile(servos_id, positions, device.now())
 
-def get_servos_position(servos_id: tuple) -> tuple:
+            if instrumented:
+                instrumentation.span("get_servos_position.reply_wait", written)
+                instrumentation.span("get_servos_position", start)
 
-    buf = bytearray(6 + len(servos_id))
+            return positions
 
-    buf[0] = 0x00  # Hid id
-    buf[1] = FRAME_HEADER
-    buf[2] = FRAME_HEADER
-    buf[3] = 3 + len(servos_id)
-    buf[4] = CMD_MULT_SERVO_POS_READ
-    buf[5] = len(servos_id)
+    raise TimeoutError(f"no position reply within {timeout} s")
 
-    for index, servo in enumerate(servos_id):
-        buf[6 + index] = servo
 
-    device.write(buf)
-    sleep(0.2)
+def poll_servos_position(servos_id: tuple, rate=20, timeout=0.5):
+    """
+    Yield servos positions at rate (Hz) for closed-loop apps.
 
-    data = bytearray(device.read(64))
-    if data[:2] != b"\x55\x55" or data is None:
-        raise ValueError("data don't match with what excepted")
+    :param servos_id: tuple of servo ids
+    :param rate: samples per second
+    :param timeout: max wait for each reply (seconds)
+    :return: generator of (timestamp, positions)
+    """
 
-    positions = list()
-    for i in range(len(servos_id)):
-        pos = data[5 + (i * 3):8 + (i * 3)]
-        pos = struct.unpack("<H", pos[1:])
+    device = get_transport()
+    period = 1 / rate
+    next_sample = device.now()
 
-        positions.append(pos[0])
+    while True:
+        now = device.now()
+        yield now, get_servos_position(servos_id, timeout)
 
-    return tuple(positions)
+        # Keep the schedule, skip samples that are already late
+        next_sample += period
+        if next_sample < device.now():
+            next_sample = device.now()
+        sleep(max(next_sample - device.now(), 0))
@@ -0,0 +1,71 @@
+from lib.transport import SimulatedServo
+
+
+class ShadowState:
+
+    def __init__(self, reconcile_interval=5.0) -> None:
+
+        """
+        Last commanded move of each servo, used to predict positions without reading the bus.
+
+        :param reconcile_interval: seconds after which an estimate should be checked against the hardware
+        """
+
+        self.reconcile_interval = reconcile_interval
+
+        # Max difference (servo units) between estimate and hardware at the last reconciliation
+        self.divergence = dict()
+        self.last_reconcile = None
+
+        self._servos = dict()
+
+    def commanded(self, servos_id: tuple, positions: tuple, time: int, now: float) -> None:
+
+        """Record a move, a servo never seen before is assumed to start at its target."""
+
+        for servo_id, position in zip(servos_id, positions):
+            if servo_id not in self._servos:
+                self._servos[servo_id] = SimulatedServo(position)
+            self._servos[servo_id].move(position, time / 1000, now)
+
+    def unloaded(self, servos_id: tuple) -> None:
+
+        """Unloaded servos can be moved by hand, their position is unknown."""
+
+        for servo_id in servos_id:
+            self._servos.pop(servo_id, None)
+
+    def estimate(self, servos_id: tuple, now: float):
+
+        """Return the predicted positions or None if one of the servos is unknown"""
+
+        if not all(servo_id in self._servos for servo_id in servos_id):
+            return None
+
+        return tuple(round(self._servos[servo_id].position(now)) for servo_id in servos_id)
+
+    def reconcile(self, servos_id: tuple, positions: tuple, now: float) -> dict:
+
+        """Compare the estimate with positions read from the hardware and adopt them."""
+
+        for servo_id, position in zip(servos_id, positions):
+            servo = self._servos.get(servo_id)
+
+            if servo is not None:
+                self.divergence[servo_id] = abs(round(servo.position(now)) - position)
+
+                # Still moving: keep the commanded target, restart from the measured position
+                if now < servo.start_time + servo.duration:
+                    servo.duration -= now - servo.start_time
+                    servo.start_time = now
+                    servo.start = position
+                    continue
+
+            self._servos[servo_id] = SimulatedServo(position)
+
+        self.last_reconcile = now
+
+        return {servo_id: self.divergence[servo_id] for servo_id in servos_id if servo_id in self.divergence}
+
+    def needs_reconcile(self, now: float) -> bool:
+        return self.last_reconcile is None or now - self.last_reconcile > self.reconcile_interval
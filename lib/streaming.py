@@ -0,0 +1,104 @@
+from lib.servo_controller import move_servos, get_transport, sleep
+from lib.cartesian import compute_ik
+from lib.inverse_kinematics import FREE_ANGLE
+
+from collections import namedtuple
+import itertools
+import math
+
+# Durations in seconds, lateness is how late the frame was sent compared to its schedule
+Segment = namedtuple("Segment", ("planned", "actual", "lateness"))
+
+
+class StreamReport:
+
+    def __init__(self) -> None:
+
+        """Planned versus actual timing of each streamed segment."""
+
+        self.segments = list()
+
+    @property
+    def planned(self) -> float:
+        return sum(s.planned for s in self.segments)
+
+    @property
+    def actual(self) -> float:
+        return sum(s.actual for s in self.segments)
+
+    @property
+    def max_lateness(self) -> float:
+        return max((s.lateness for s in self.segments), default=0.0)
+
+
+def stream(targets, time: int, hand_orientation=500, approach_angle=FREE_ANGLE) -> StreamReport:
+    """
+    Send each target on a fixed schedule, the next target is computed while the current segment is in flight.
+
+    :param targets: iterable of tuple(x, y, z) or tuple(j1, j2, j3, j4, j5) | jx: 0-1000
+    :param time: duration of each segment 0-65535 milliseconds, or an iterable with one duration per target
+    :param hand_orientation: orientation of the hand (cartesian targets)
+    :param approach_angle: approach angle in degrees (cartesian targets)
+    :return: StreamReport
+    """
+
+    times = list(time) if hasattr(time, "__iter__") else [time]
+    if not min(times, default=1) > 0:
+        raise ValueError("time must be greater than 0")
+
+    # Caught before any frame is sent when targets has a length, otherwise when the durations run out
+    if hasattr(targets, "__len__") and len(times) not in (1, len(targets)):
+        raise ValueError(f"expected 1 or {len(targets)} durations, got {len(times)}")
+
+    # A single duration applies to every segment
+    durations = itertools.cycle(times) if len(times) == 1 else iter(times)
+
+    if approach_angle != FREE_ANGLE:
+        approach_angle = math.radians(approach_angle)
+
+    def to_joint(target: tuple) -> tuple:
+        if len(target) == 3:
+            return compute_ik(target, hand_orientation, approach_angle)
+        return tuple(target)
+
+    report = StreamReport()
+
+    targets = iter(targets)
+    joint = next(targets, None)
+    if joint is None:
+        return report
+    joint = to_joint(joint)
+
+    # Deadlines are derived from the start so sleep overshoot doesn't accumulate
+    monotonic = get_transport().now
+    scheduled = monotonic()
+    sent = list()
+
+    while joint is not None:
+        sleep(max(scheduled - monotonic(), 0))
+
+        segment = next(durations, None)
+        if segment is None:
+            raise ValueError(f"{len(times)} durations for more targets")
+
+        now = monotonic()
+        move_servos((6, 5, 4, 3, 2), joint, int(segment), wait=False)
+        sent.append((segment / 1000, scheduled, now))
+        scheduled += segment / 1000
+
+        # Next IK while the arm is moving
+        joint = next(targets, None)
+        if joint is not None:
+            joint = to_joint(joint)
+
+    sleep(max(scheduled - monotonic(), 0))
+    finished = monotonic()
+
+    for i, (duration, planned, now) in enumerate(sent):
+        following = sent[i + 1][2] if i + 1 < len(sent) else finished
+        report.segments.append(Segment(duration, following - now, now - planned))
+
+    # Same settling margin as move_servos
+    sleep(0.05)
+
+    return report
@@ -0,0 +1,197 @@
+# Teach and replay: record the servos positions while the arm is moved by hand, then play the path back.
+#   python -m lib.teach record path.rec --rate 20 --duration 30   (Ctrl+C to stop earlier)
+#   python -m lib.teach replay path.rec
+#
+# File: header, servo ids, then one record per sample: timestamp (ms, uint32) and one uint16 position per servo.
+
+from lib import servo_controller
+from lib.protocol import FrameBatch
+
+from array import array
+import argparse
+import mmap
+import struct
+
+
+MAGIC = b"XREC"
+VERSION = 1
+
+# magic, version, servo count, rate (Hz)
+HEADER = struct.Struct("<4sHHf")
+ALL_SERVOS = (1, 2, 3, 4, 5, 6)
+
+# Max duration of one CMD_SERVO_MOVE frame
+MAX_TIME = 65535
+
+
+def record(path: str, rate=20, duration=None, servos_id=ALL_SERVOS, stop=None) -> int:
+    """
+    Unload the servos and record their positions until duration or stop.
+
+    :param path: output file
+    :param rate: samples per second
+    :param duration: seconds, None to record until stop (or KeyboardInterrupt)
+    :param servos_id: tuple of servo ids
+    :param stop: threading.Event that ends the recording
+    :return: number of samples
+    """
+
+    samples = 0
+    record_format = struct.Struct(f"<I{len(servos_id)}H")
+
+    servo_controller.sleep(0.1)
+    servo_controller.unload_servos(servos_id)
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, len(servos_id), rate))
+        file.write(bytes(servos_id))
+
+        # Written by blocks so a long recording doesn't hold every sample in memory
+        block = array("B")
+        start = None
+
+        try:
+            for now, positions in servo_controller.poll_servos_position(servos_id, rate):
+                if start is None:
+                    start = now
+
+                elapsed = now - start
+                if (duration is not None and elapsed > duration) or (stop is not None and stop.is_set()):
+                    break
+
+                block.frombytes(record_format.pack(round(elapsed * 1000), *positions))
+                samples += 1
+
+                if len(block) >= 4096:
+                    block.tofile(file)
+                    block = array("B")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            block.tofile(file)
+
+    return samples
+
+
+class Recording:
+
+    def __init__(self, path: str) -> None:
+
+        """Recording memory-mapped from disk."""
+
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, self.rate = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} recording")
+
+        self.servos_id = tuple(self._map[HEADER.size:HEADER.size + count])
+        self._record = struct.Struct(f"<I{count}H")
+        self._offset = HEADER.size + count
+
+    def __len__(self) -> int:
+        return (len(self._map) - self._offset) // self._record.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._map.close()
+
+    def samples(self):
+
+        """Yield (timestamp ms, positions) without copying the file"""
+
+        with memoryview(self._map) as view:
+            for sample in self._record.iter_unpack(view[self._offset:self._offset + len(self) * self._record.size]):
+                yield sample[0], sample[1:]
+
+    def keyframes(self, tolerance=2) -> list:
+
+        """
+        Drop the samples that linear interpolation between their neighbours reproduces within tolerance.
+
+        :param tolerance: servo units
+        :return: list of (timestamp ms, positions)
+        """
+
+        samples = list(self.samples())
+        if len(samples) < 3:
+            return samples
+
+        keep = [False] * len(samples)
+        keep[0] = keep[-1] = True
+
+        # Ramer-Douglas-Peucker on time, with the worst joint as distance
+        stack = [(0, len(samples) - 1)]
+        while stack:
+            first, last = stack.pop()
+            t0, p0 = samples[first]
+            t1, p1 = samples[last]
+
+            worst, index = 0, None
+            for i in range(first + 1, last):
+                t, p = samples[i]
+                ratio = (t - t0) / (t1 - t0) if t1 != t0 else 0
+                error = max(abs(a + (b - a) * ratio - c) for a, b, c in zip(p0, p1, p))
+
+                if error > worst:
+                    worst, index = error, i
+
+            if index is not None and worst > tolerance:
+                keep[index] = True
+                stack.append((first, index))
+                stack.append((index, last))
+
+        return [sample for sample, kept in zip(samples, keep) if kept]
+
+
+def replay(path: str, tolerance=2, approach_time=1000) -> int:
+    """
+    Move to the first sample, then play the recording back with its timing.
+
+    :param path: recording file
+    :param tolerance: decimation tolerance (servo units)
+    :param approach_time: time to reach the first sample (milliseconds)
+    :return: number of frames sent
+    """
+
+    with Recording(path) as recording:
+        keyframes = recording.keyframes(tolerance)
+        servos_id = recording.servos_id
+
+    if not keyframes:
+        return 0
+
+    servo_controller.move_servos(servos_id, keyframes[0][1], approach_time)
+
+    frames = list()
+    for (t0, _), (t1, positions) in zip(keyframes, keyframes[1:]):
+        frames.append((servos_id, positions, min(max(t1 - t0, 1), MAX_TIME)))
+
+    # Every frame is encoded before the first one is sent
+    servo_controller.write_batch(FrameBatch(frames))
+
+    return len(frames) + 1
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Record and replay xArm paths")
+    parser.add_argument("action", choices=("record", "replay"))
+    parser.add_argument("path")
+    parser.add_argument("--rate", type=float, default=20, help="samples per second (record)")
+    parser.add_argument("--duration", type=float, help="seconds (record), Ctrl+C to stop earlier")
+    parser.add_argument("--tolerance", type=float, default=2, help="decimation tolerance in servo units (replay)")
+
+    args = parser.parse_args()
+
+    if args.action == "record":
+        print(f"{record(args.path, args.rate, args.duration)} samples recorded")
+    else:
+        print(f"{replay(args.path, args.tolerance)} frames sent")
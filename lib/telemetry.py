@@ -0,0 +1,134 @@
+# Telemetry: servos positions polled on a dedicated I/O thread, consumers (the launcher UI) read the last samples from
+# a ring buffer without blocking the poller.
+
+from lib import servo_controller
+
+from collections import deque, namedtuple
+import threading
+
+# Velocities are averaged over this window (seconds) so fast polling doesn't only see rounding steps
+VELOCITY_WINDOW = 0.1
+
+# Velocities in servo units per second, None for the first sample
+Sample = namedtuple("Sample", ("timestamp", "positions", "velocities"))
+
+
+class RingBuffer:
+
+    def __init__(self, size: int) -> None:
+
+        """
+        Last size items, written by a single thread and read by any number of threads without lock.
+
+        The slot is filled before the counter is published, so readers never see a partially written item.
+        """
+
+        if size < 1:
+            raise ValueError("size must be greater than 0")
+
+        self.size = size
+        self.count = 0
+
+        self._slots = [None] * size
+
+    def append(self, item) -> None:
+
+        self._slots[self.count % self.size] = item
+        self.count += 1
+
+    def latest(self):
+
+        """Last item or None if empty"""
+
+        count = self.count
+        return self._slots[(count - 1) % self.size] if count else None
+
+    def last(self, n: int) -> list:
+
+        """Up to n last items, oldest first"""
+
+        count = self.count
+        n = min(n, count, self.size - 1)
+
+        return [self._slots[i % self.size] for i in range(count - n, count)]
+
+
+class TelemetryPoller:
+
+    def __init__(self, servos_id=(6, 5, 4, 3, 2, 1), rate=20, size=256, timeout=0.5, transport=None) -> None:
+
+        """
+        Poll servos positions on a background thread.
+
+        :param servos_id: tuple of servo ids
+        :param rate: samples per second, None to poll as fast as the bus answers
+        :param size: samples kept in the ring buffer
+        :param timeout: max wait for each reply (seconds)
+        :param transport: poll this transport instead of the current one
+        """
+
+        self.servos_id = servos_id
+        self.rate = rate
+        self.timeout = timeout
+        self.transport = transport
+
+        self.buffer = RingBuffer(size)
+
+        # Bad or missing replies are counted, polling goes on
+        self.errors = 0
+        self.last_error = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="xArm-telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self) -> None:
+
+        if self.transport is not None:
+            servo_controller.bind_thread(self.transport)
+
+        device = servo_controller.get_transport()
+        period = 1 / self.rate if self.rate else 0
+        next_sample = device.now()
+        window = deque()
+
+        while not self._stop.is_set():
+            try:
+                positions = servo_controller.get_servos_position(self.servos_id, self.timeout)
+                if not all(0 <= pos <= 1000 for pos in positions):
+                    raise ValueError(f"unexpected value in {positions}")
+            except (TimeoutError, ValueError, OSError) as error:
+                self.errors += 1
+                self.last_error = error
+            else:
+                now = device.now()
+                while len(window) > 1 and now - window[1][0] >= VELOCITY_WINDOW:
+                    window.popleft()
+
+                velocities = None
+                if window and now > window[0][0]:
+                    then, before = window[0]
+                    velocities = tuple((p - q) / (now - then) for p, q in zip(positions, before))
+
+                window.append((now, positions))
+                self.buffer.append(Sample(now, positions, velocities))
+
+            # Keep the schedule, skip samples that are already late
+            next_sample = max(next_sample + period, device.now())
+            self._stop.wait(max((next_sample - device.now()) / device.time_scale, 0))
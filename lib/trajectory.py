@@ -0,0 +1,216 @@
+import math
+
+# Default limits in servo units per second (per second squared)
+MAX_VELOCITY = 800
+MAX_ACCELERATION = 3000
+
+
+class JointProfile:
+
+    def __init__(self, positions: list, durations: list, velocity: float, acceleration: float) -> None:
+
+        """
+        Linear segments with parabolic blends through via points for one joint (Craig, Introduction to Robotics).
+
+        :param positions: via points, starts and ends at rest
+        :param durations: time between consecutive via points (seconds)
+        :param velocity: max velocity (units/s)
+        :param acceleration: blend acceleration (units/s²)
+        """
+
+        self.start = positions[0]
+
+        # Segments that are too short to be followed with these limits
+        self.invalid = set()
+
+        # Knots (time, velocity), the velocity is linear between knots
+        self.knots = list()
+
+        n = len(positions)
+        a = acceleration
+
+        if n < 2:
+            self.knots = [(0.0, 0.0)]
+            return
+
+        if n == 2:
+            self._single(positions[1] - positions[0], durations[0], velocity, a)
+            return
+
+        # First and last segments start and end at rest
+        first = self._end_blend(positions[1] - positions[0], durations[0], a)
+        last = self._end_blend(positions[-2] - positions[-1], durations[-1], a)
+
+        if first is None:
+            self.invalid.add(0)
+        if last is None:
+            self.invalid.add(n - 2)
+        if self.invalid:
+            return
+
+        blends = [first[0]]
+        velocities = [first[1]]
+
+        for k in range(1, n - 2):
+            velocities.append((positions[k + 1] - positions[k]) / durations[k])
+        if n > 2:
+            velocities.append(-last[1])
+
+        for k in range(1, n - 1):
+            blends.append(abs(velocities[k] - velocities[k - 1]) / a)
+        blends.append(last[0])
+
+        # Each linear part must last at least 0 and respect the velocity limit
+        for k, duration in enumerate(durations):
+            before = blends[k] if k == 0 else blends[k] / 2
+            after = blends[k + 1] if k == n - 2 else blends[k + 1] / 2
+
+            if duration - before - after < -1e-9 or abs(velocities[k]) > velocity + 1e-9:
+                self.invalid.add(k)
+
+        if self.invalid:
+            return
+
+        time = 0.0
+        self.knots.append((0.0, 0.0))
+        self.knots.append((blends[0], velocities[0]))
+
+        for k in range(1, n - 1):
+            time += durations[k - 1]
+            self.knots.append((time - blends[k] / 2, velocities[k - 1]))
+            self.knots.append((time + blends[k] / 2, velocities[k]))
+
+        time += durations[-1]
+        self.knots.append((time - blends[-1], velocities[-1]))
+        self.knots.append((time, 0.0))
+
+    def _single(self, distance: float, duration: float, velocity: float, acceleration: float) -> None:
+
+        # One segment from rest to rest: symmetric trapezoid (triangle when both blends meet)
+        acc = acceleration if distance >= 0 else -acceleration
+        root = duration * duration / 4 - distance / acc
+
+        if root < 0:
+            self.invalid.add(0)
+            return
+
+        blend = duration / 2 - math.sqrt(root)
+        linear = distance / (duration - blend)
+
+        if abs(linear) > velocity + 1e-9:
+            self.invalid.add(0)
+            return
+
+        self.knots = [(0.0, 0.0), (blend, linear), (duration - blend, linear), (duration, 0.0)]
+
+    @staticmethod
+    def _end_blend(distance: float, duration: float, acceleration: float):
+
+        # Blend time and linear velocity of a segment that starts (or ends) at rest, None if too short
+        acc = acceleration if distance >= 0 else -acceleration
+        root = duration * duration - 2 * distance / acc
+
+        if root < 0:
+            return None
+
+        blend = duration - math.sqrt(root)
+        if blend >= duration:
+            return None
+
+        return blend, distance / (duration - blend / 2)
+
+    def position(self, time: float) -> float:
+
+        """Integrate the piecewise linear velocity up to time"""
+
+        position = self.start
+
+        for (t0, v0), (t1, v1) in zip(self.knots, self.knots[1:]):
+            if time <= t0:
+                break
+
+            if time < t1:
+                v = v0 + (v1 - v0) * (time - t0) / (t1 - t0)
+                position += (v0 + v) / 2 * (time - t0)
+                break
+
+            position += (v0 + v1) / 2 * (t1 - t0)
+
+        return position
+
+
+class Trajectory:
+
+    def __init__(self, points: list, max_velocity=MAX_VELOCITY, max_acceleration=MAX_ACCELERATION) -> None:
+        """
+        Time parameterized joint trajectory that blends through intermediate points.
+
+        :param points: list of tuple(j1, j2, j3, j4, j5), the first one is the start position
+        :param max_velocity: units/s, scalar or one value per joint
+        :param max_acceleration: units/s², scalar or one value per joint
+        """
+
+        if len(points) < 2:
+            raise ValueError("a trajectory needs at least 2 points")
+
+        joints = len(points[0])
+        velocities = self._per_joint(max_velocity, joints)
+        accelerations = self._per_joint(max_acceleration, joints)
+
+        if min(velocities) <= 0 or min(accelerations) <= 0:
+            raise ValueError("limits must be greater than 0")
+
+        # Start from a lower bound of each segment duration and stretch the segments that can't be followed
+        last = len(points) - 2
+        self.durations = list()
+        for i, (p0, p1) in enumerate(zip(points, points[1:])):
+            bound = max(self._min_time(abs(b - a), v, acc, (i == 0) + (i == last)) for a, b, v, acc in zip(p0, p1, velocities, accelerations))
+            self.durations.append(max(bound, 1e-3))
+
+        for _ in range(1000):
+            self.profiles = list()
+            for j in range(joints):
+                self.profiles.append(JointProfile([p[j] for p in points], self.durations, velocities[j], accelerations[j]))
+
+            invalid = set().union(*(profile.invalid for profile in self.profiles))
+            if not invalid:
+                break
+
+            for i in invalid:
+                self.durations[i] *= 1.02
+        else:
+            raise ValueError("unable to plan the trajectory with these limits")
+
+        self.duration = sum(self.durations)
+
+    @staticmethod
+    def _per_joint(value, joints: int) -> tuple:
+        return tuple(value) if isinstance(value, (tuple, list)) else (value, ) * joints
+
+    @staticmethod
+    def _min_time(distance: float, velocity: float, acceleration: float, rests: int) -> float:
+
+        # Time optimal trapezoid with 0, 1 or 2 ends at rest (triangle when max velocity is not reached)
+        if rests == 0:
+            return distance / velocity
+        if distance >= rests * velocity * velocity / (2 * acceleration):
+            return distance / velocity + rests * velocity / (2 * acceleration)
+        return rests * math.sqrt(2 * distance / (rests * acceleration))
+
+    def position(self, time: float) -> tuple:
+        return tuple(profile.position(time) for profile in self.profiles)
+
+    def sample(self, period: float) -> tuple:
+        """
+        Split the trajectory into segments of equal duration.
+
+        :param period: target segment duration (seconds)
+        :return: (list of tuple(j1, j2, j3, j4, j5), segment duration in milliseconds)
+        """
+
+        count = max(math.ceil(self.duration / period), 1)
+        step = self.duration / count
+
+        points = [tuple(round(p) for p in self.position(i * step)) for i in range(1, count + 1)]
+
+        return points, max(round(step * 1000), 1)
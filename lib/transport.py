@@ -0,0 +1,232 @@
+from lib.protocol import *
+
+from collections import deque
+import math
+import struct
+import time
+
+
+LOBOT_VENDOR_ID = 0x0483
+LOBOT_PRODUCT_ID = 0x5750
+
+
+class HIDTransport:
+
+    """xArm connected over USB HID."""
+
+    time_scale = 1.0
+
+    def __init__(self, vendor_id=LOBOT_VENDOR_ID, product_id=LOBOT_PRODUCT_ID, serial=None, path=None) -> None:
+
+        import hid
+
+        self.device = hid.device()
+
+        if path is not None:
+            self.device.open_path(path)
+        else:
+            self.device.open(vendor_id, product_id, serial)
+
+        print(f"Manufacturer: {self.device.get_manufacturer_string()}")
+        print(f"Product: {self.device.get_product_string()}")
+        print(f"Serial No: {self.device.get_serial_number_string()}")
+
+    def write(self, buf) -> int:
+        return self.device.write(buf)
+
+    def read(self, size: int, timeout_ms=0) -> list:
+        return self.device.read(size, timeout_ms)
+
+    def close(self) -> None:
+        self.device.close()
+
+    @staticmethod
+    def now() -> float:
+        return time.monotonic()
+
+    @staticmethod
+    def sleep(seconds: float) -> None:
+        time.sleep(max(seconds, 0))
+
+
+def list_devices(vendor_id=LOBOT_VENDOR_ID, product_id=LOBOT_PRODUCT_ID) -> list:
+
+    """Connected xArms as a list of (serial number, path), to open a given one with HIDTransport"""
+
+    import hid
+
+    return [(info["serial_number"], info["path"]) for info in hid.enumerate(vendor_id, product_id)]
+
+
+class SimulatedServo:
+
+    def __init__(self, position=500) -> None:
+
+        self.start = position
+        self.target = position
+        self.start_time = 0.0
+        self.duration = 0.0
+        self.loaded = False
+
+    def position(self, now: float) -> float:
+
+        if now >= self.start_time + self.duration:
+            return self.target
+
+        progress = (now - self.start_time) / self.duration
+        return self.start + (self.target - self.start) * progress
+
+    def move(self, target: int, duration: float, now: float) -> None:
+
+        self.start = self.position(now)
+        self.target = target
+        self.start_time = now
+        self.duration = duration
+        self.loaded = True
+
+    def unload(self, now: float) -> None:
+
+        # Stops where it is
+        self.start = self.target = self.position(now)
+        self.duration = 0.0
+        self.loaded = False
+
+
+class SimulatedTransport:
+
+    def __init__(self, time_scale=1.0, positions=None) -> None:
+
+        """
+        In-process xArm: parses LOBOT frames, moves servos linearly over time and answers position reads.
+
+        :param time_scale: simulated seconds per real second, math.inf to only advance time in sleep()
+        :param positions: dict {servo_id: position} initial positions (default 500)
+        """
+
+        if not time_scale > 0:
+            raise ValueError("time_scale must be greater than 0")
+
+        self.time_scale = time_scale
+        self.servos = {servo_id: SimulatedServo() for servo_id in range(1, 7)}
+
+        for servo_id, position in (positions or dict()).items():
+            self.servos[servo_id] = SimulatedServo(position)
+
+        self.frames = 0
+        self._replies = deque()
+        self._start = time.monotonic()
+        self._virtual = 0.0
+
+    def now(self) -> float:
+
+        if self.time_scale == math.inf:
+            return self._virtual
+
+        return (time.monotonic() - self._start) * self.time_scale + self._virtual
+
+    def sleep(self, seconds: float) -> None:
+
+        if self.time_scale == math.inf:
+            self._virtual += max(seconds, 0)
+        else:
+            time.sleep(max(seconds, 0) / self.time_scale)
+
+    def write(self, buf) -> int:
+
+        command, params = decode_frame(buf)
+        now = self.now()
+
+        if command == CMD_SERVO_MOVE:
+            servos_id, positions, duration = decode_move(params)
+            for servo_id, position in zip(servos_id, positions):
+                self.servos[servo_id].move(position, duration / 1000, now)
+
+        elif command == CMD_MULT_SERVO_UNLOAD:
+            for servo_id in decode_servos(params):
+                self.servos[servo_id].unload(now)
+
+        elif command == CMD_MULT_SERVO_POS_READ:
+            servos_id = decode_servos(params)
+            positions = tuple(round(self.servos[servo_id].position(now)) for servo_id in servos_id)
+
+            reply = bytearray(64)
+            encode_positions_into(reply, 0, servos_id, positions)
+            self._replies.append(reply)
+
+        else:
+            raise ValueError(f"unknown command {command:#04x}")
+
+        self.frames += 1
+
+        return len(buf)
+
+    def read(self, size: int, timeout_ms=0) -> list:
+
+        if not self._replies:
+            return list()
+
+        return list(self._replies.popleft()[:size])
+
+    def close(self) -> None:
+        pass
+
+
+class RecordingTransport:
+
+    # timestamp, direction (b"W" or b"R"), length
+    RECORD = struct.Struct("<dcH")
+
+    def __init__(self, path: str, transport=None) -> None:
+
+        """
+        Log every frame written to and read from transport into a binary file.
+
+        :param path: output file
+        :param transport: wrapped transport (default SimulatedTransport)
+        """
+
+        self.transport = transport if transport is not None else SimulatedTransport()
+        self.time_scale = self.transport.time_scale
+
+        self._file = open(path, "wb")
+        self._start = self.transport.now()
+
+    def _record(self, direction: bytes, data: bytes) -> None:
+        self._file.write(self.RECORD.pack(self.transport.now() - self._start, direction, len(data)) + data)
+
+    def write(self, buf) -> int:
+
+        self._record(b"W", bytes(buf))
+        return self.transport.write(buf)
+
+    def read(self, size: int, timeout_ms=0) -> list:
+
+        data = self.transport.read(size, timeout_ms)
+        self._record(b"R", bytes(data))
+
+        return data
+
+    def close(self) -> None:
+
+        self._file.close()
+        self.transport.close()
+
+    def now(self) -> float:
+        return self.transport.now()
+
+    def sleep(self, seconds: float) -> None:
+        self.transport.sleep(seconds)
+
+
+def read_recording(path: str):
+
+    """Yield (timestamp, direction, data) from a file written by RecordingTransport"""
+
+    with open(path, "rb") as file:
+        while True:
+            header = file.read(RecordingTransport.RECORD.size)
+            if len(header) < RecordingTransport.RECORD.size:
+                return
+
+            timestamp, direction, length = RecordingTransport.RECORD.unpack(header)
+            yield timestamp, direction, file.read(length)
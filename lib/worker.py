@@ -0,0 +1,95 @@
+# Warm app runner for the launcher: started ahead of time, it imports the motion library and opens the xArm, then waits
+# for the path of an app on stdin, runs it once and exits with the status of the app (0 DONE, 1 ERROR).
+#   python -m lib.worker
+#
+# Nothing is compiled once the app is submitted: the launcher compiles the apps that opted in ahead of time (see
+# precompile) and the worker streams the cached program, or runs the source when there is none.
+
+from lib import servo_controller
+from lib import compiler
+from lib import arm  # noqa: F401 (imported by the apps)
+
+import os
+import runpy
+import subprocess
+import sys
+import traceback
+
+
+def spawn() -> subprocess.Popen:
+
+    """Start a worker in the background, it is ready once its imports and the device are done."""
+
+    return subprocess.Popen([sys.executable, "-m", "lib.worker"], stdin=subprocess.PIPE)
+
+
+def submit(worker: subprocess.Popen, path: str) -> None:
+
+    """Hand the app at path to the worker."""
+
+    worker.stdin.write(f"{path}\n".encode())
+    worker.stdin.close()
+
+
+def dismiss(worker: subprocess.Popen, timeout=1.0) -> None:
+
+    """Stop a worker that was never given an app."""
+
+    if worker.poll() is not None:
+        return
+
+    # An empty line tells it to exit
+    if not worker.stdin.closed:
+        worker.stdin.close()
+
+    try:
+        worker.wait(timeout)
+    except subprocess.TimeoutExpired:
+        worker.terminate()
+        worker.wait()
+
+
+def precompile(path: str) -> subprocess.Popen:
+
+    """Compile the app at path in the background (see lib.compiler), the worker then uses the cached program."""
+
+    return subprocess.Popen([sys.executable, "-m", "lib.compiler", path], stdout=subprocess.DEVNULL)
+
+
+def main() -> int:
+
+    # Without a device the app fails when it first uses it, as when it runs on its own
+    try:
+        servo_controller.get_transport()
+    except OSError:
+        pass
+
+    path = sys.stdin.readline().strip()
+
+    # The launcher exited before using this worker
+    if not path:
+        return 0
+
+    sys.argv = [path]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(path)))
+
+    try:
+        # Only the cached program of an app that opted in is used, a cache miss runs the source
+        program = compiler.cached(path) if compiler.compile_enabled(path) else None
+
+        # This process never traced anything, apps that read positions run from source here
+        if program is not None and not program.reads:
+            compiler.execute(program)
+        else:
+            runpy.run_path(path, run_name="__main__")
+    except SystemExit as error:
+        return error.code if isinstance(error.code, int) else 0 if error.code is None else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
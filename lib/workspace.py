@@ -0,0 +1,178 @@
+from lib.cartesian import compute_fk_many, inverse_k
+from lib.inverse_kinematics import FREE_ANGLE, PI, DOUBLE_PI, HALF_PI
+
+import argparse
+import math
+import mmap
+import struct
+
+
+MAGIC = b"XWSM"
+VERSION = 1
+
+# magic, version, angle bins, nx, ny, nz, origin x, origin y, origin z, voxel size
+HEADER = struct.Struct("<4sHHHHHdddd")
+# One bit per approach angle bin, 0 when no pose reaches the voxel
+VOXEL = struct.Struct("<I")
+ANGLE_BINS = 32
+
+
+def _angle_bin(angle: float) -> int:
+    return int((angle + PI) % DOUBLE_PI / DOUBLE_PI * ANGLE_BINS) % ANGLE_BINS
+
+
+class WorkspaceMap:
+
+    def __init__(self, path: str) -> None:
+
+        """
+        Voxelized reachable workspace, memory-mapped.
+
+        The map is conservative: a target it rejects has no solution, a target it accepts may still be unreachable.
+
+        :param path: map built with build_map
+        """
+
+        with open(path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        header = HEADER.unpack_from(self._map, 0)
+        magic, version, bins, nx, ny, nz = header[:6]
+
+        if magic != MAGIC or version != VERSION or bins != ANGLE_BINS:
+            self._map.close()
+            raise ValueError(f"{path} is not a version {VERSION} workspace map")
+
+        self.origin = header[6:9]
+        self.voxel = header[9]
+        self.shape = (nx, ny, nz)
+
+        self._strides = (ny * nz * VOXEL.size, nz * VOXEL.size, VOXEL.size)
+
+    def close(self) -> None:
+        self._map.close()
+
+    def mask(self, target: tuple) -> int:
+
+        """Approach angle bins that reach the voxel of target, 0 if none (or outside of the map)"""
+
+        offset = HEADER.size
+        for t, o, size, stride in zip(target, self.origin, self.shape, self._strides):
+            i = math.floor((t - o) / self.voxel)
+
+            # The map covers the whole reach of the arm
+            if not 0 <= i < size:
+                return 0
+
+            offset += i * stride
+
+        return VOXEL.unpack_from(self._map, offset)[0]
+
+    def reachable(self, target: tuple, approach_angle=FREE_ANGLE) -> bool:
+
+        mask = self.mask(target)
+
+        if approach_angle == FREE_ANGLE or not mask:
+            return mask != 0
+
+        # Neighbour bins too, the angle can be near the edge of its bin
+        index = _angle_bin(approach_angle)
+        bins = (1 << index) | (1 << (index - 1) % ANGLE_BINS) | (1 << (index + 1) % ANGLE_BINS)
+
+        return mask & bins != 0
+
+
+def _servo_range(link, sign: int, step: float):
+
+    # Servo positions of the link limits (see compute_ik for the offsets)
+    import numpy as np
+
+    bounds = sorted(500 + sign * math.degrees(limit) / 0.24 for limit in (link._angleLow, link._angleHigh))
+    return np.arange(math.ceil(bounds[0]), math.floor(bounds[1]) + 1, step)
+
+
+def build_map(path: str, voxel=10, step=4) -> None:
+
+    """
+    Sweep the joint space within the Link limits of compute_ik and save the voxels it reaches, with their approach angles.
+
+    :param voxel: voxel size (mm)
+    :param step: joint sweep step (servo units)
+    """
+
+    # Only needed to build the map, lookups don't import numpy
+    import numpy as np
+
+    links = (inverse_k._L0, inverse_k._L1, inverse_k._L2, inverse_k._L3)
+    reach = sum(link.length for link in links[1:])
+
+    # The arm plane first (base at 500), each point keeps its joint positions
+    shoulder, elbow, wrist = np.meshgrid(_servo_range(links[1], 1, step), _servo_range(links[2], -1, step),
+                                         _servo_range(links[3], 1, step), indexing="ij")
+
+    joints = np.full((shoulder.size, 5), 500.0)
+    joints[:, 1], joints[:, 2], joints[:, 3] = shoulder.ravel(), elbow.ravel(), wrist.ravel()
+
+    planar = compute_fk_many(joints)
+    r, z = planar[:, 0], planar[:, 2]
+
+    # Approach angle as given to compute_ik, the solver flips it when the arm reaches behind the base
+    angles = np.radians((joints[:, 1] - 500 - (joints[:, 2] - 500) + joints[:, 3] - 500) * 0.24) + HALF_PI
+    angles = np.where(r < 0, PI - angles, angles)
+    bins = ((angles + PI) % DOUBLE_PI / DOUBLE_PI * ANGLE_BINS).astype(int) % ANGLE_BINS
+
+    # Merge the points by half voxel cells of the plane, one key per (cell, angle bin)
+    cell = voxel / 2
+    side = math.ceil(reach / cell) + 1
+    keys = (np.floor(r / cell).astype(np.int64) + side) * (2 * side) + np.floor(z / cell).astype(np.int64) + side
+    keys = np.unique(keys * ANGLE_BINS + bins)
+
+    cells, inverse = np.unique(keys // ANGLE_BINS, return_inverse=True)
+    masks = np.zeros(len(cells), dtype=np.uint32)
+    np.bitwise_or.at(masks, inverse, np.uint32(1) << (keys % ANGLE_BINS).astype(np.uint32))
+
+    keys = np.stack((cells // (2 * side) - side, cells % (2 * side) - side), axis=1)
+
+    r_cell = (keys[:, 0] + 0.5) * cell
+    z_cell = (keys[:, 1] + 0.5) * cell
+
+    # Then turn the plane with the base, at most half a voxel between two positions at full reach
+    low, high = links[0]._angleLow, links[0]._angleHigh
+    count = math.ceil((high - low) * reach / cell) + 1
+
+    origin = (-reach - voxel, -reach - voxel, -reach - voxel)
+    shape = tuple(math.ceil(2 * (reach + voxel) / voxel) for _ in range(3))
+    grid = np.zeros(shape, dtype=np.uint32)
+
+    for base in np.linspace(low, high, count):
+        ix = np.floor((math.cos(base) * r_cell - origin[0]) / voxel).astype(int)
+        iy = np.floor((math.sin(base) * r_cell - origin[1]) / voxel).astype(int)
+        iz = np.floor((z_cell - origin[2]) / voxel).astype(int)
+        np.bitwise_or.at(grid, (ix, iy, iz), masks)
+
+    # Grow by one voxel so the sampling can't reject a reachable target
+    for axis in range(3):
+        grown = grid.copy()
+        for shift in (1, -1):
+            rolled = np.roll(grid, shift, axis=axis)
+            edge = [slice(None)] * 3
+            edge[axis] = 0 if shift == 1 else -1
+            rolled[tuple(edge)] = 0
+            grown |= rolled
+        grid = grown
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION, ANGLE_BINS, *shape, *origin, voxel))
+        grid.astype("<u4").tofile(file)
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Build the reachable workspace map")
+    parser.add_argument("path")
+    parser.add_argument("--voxel", type=float, default=10, help="voxel size (mm)")
+    parser.add_argument("--step", type=float, default=4, help="joint sweep step (servo units)")
+
+    args = parser.parse_args()
+
+    build_map(args.path, args.voxel, args.step)
@@ -0,0 +1,82 @@
+import math
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lib import servo_controller
+from lib.protocol import CMD_MULT_SERVO_POS_READ
+from lib.shadow_state import ShadowState
+from lib.transport import SimulatedTransport
+
+
+class HardwareLikeTransport(SimulatedTransport):
+
+    def __init__(self, read_latency=0.0, tick=1e-6) -> None:
+
+        """
+        Virtual clock that behaves like the HID transport before its sleep was clamped: sleep raises on negative or
+        infinite lengths (as time.sleep does), every clock read lets tick pass and position replies take read_latency.
+        """
+
+        super(HardwareLikeTransport, self).__init__(math.inf)
+
+        self.read_latency = read_latency
+        self.tick = tick
+
+    def now(self) -> float:
+
+        self._virtual += self.tick
+        return self._virtual
+
+    def sleep(self, seconds: float) -> None:
+
+        if seconds < 0:
+            raise ValueError("sleep length must be non-negative")
+        if math.isinf(seconds):
+            raise OverflowError("sleep length is too large")
+
+        self._virtual += seconds
+
+    def write(self, buf) -> int:
+
+        size = super(HardwareLikeTransport, self).write(buf)
+        if buf[4] == CMD_MULT_SERVO_POS_READ:
+            self._virtual += self.read_latency
+
+        return size
+
+
+def _install(transport):
+
+    servo_controller.set_transport(transport)
+    servo_controller.shadow = ShadowState()
+
+    return transport
+
+
+def _uninstall() -> None:
+
+    servo_controller.use_queue(None)
+    servo_controller.set_transport(None)
+    servo_controller.shadow = ShadowState()
+
+
+@pytest.fixture
+def hardware_like():
+
+    """HardwareLikeTransport installed as the current transport"""
+
+    yield _install(HardwareLikeTransport())
+    _uninstall()
+
+
+@pytest.fixture
+def sim():
+
+    """Simulated xArm on a virtual clock, installed as the current transport"""
+
+    yield _install(SimulatedTransport(math.inf))
+    _uninstall()
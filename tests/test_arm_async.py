@@ -0,0 +1,27 @@
+from lib import arm
+from lib import arm_async
+
+import asyncio
+import threading
+
+
+def test_movel_solves_ik_off_the_event_loop(sim, monkeypatch):
+
+    threads = list()
+    compute_ik = arm.compute_ik
+
+    def traced(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return compute_ik(*args, **kwargs)
+
+    monkeypatch.setattr(arm, "compute_ik", traced)
+
+    async def main():
+        await arm_async.movel((200, 0, 100), 1000, waypoints=5)
+        return threading.current_thread()
+
+    loop_thread = asyncio.run(main())
+
+    assert len(threads) == 5
+    assert loop_thread not in threads
+    assert tuple(sim.servos[servo_id].target for servo_id in (6, 5, 4, 3, 2)) == compute_ik((200, 0, 100))
@@ -0,0 +1,64 @@
+from lib.cartesian import compute_ik, compute_ik_many, compute_fk_many
+from lib.inverse_kinematics import FREE_ANGLE
+
+import math
+
+import numpy as np
+import pytest
+
+
+def _targets():
+
+    rng = np.random.default_rng(0)
+    return rng.uniform((-300, -300, -100), (300, 300, 350), size=(300, 3))
+
+
+@pytest.mark.parametrize("approach_angle", [0.0, math.radians(-45)])
+def test_matches_compute_ik(approach_angle):
+
+    targets = _targets()
+    positions, reachable = compute_ik_many(targets, 500, approach_angle)
+
+    assert positions.shape == (len(targets), 5)
+    assert reachable.any()
+
+    for target, position, ok in zip(targets, positions, reachable):
+        try:
+            expected = compute_ik(tuple(target), 500, approach_angle)
+        except ValueError:
+            assert not ok
+            assert not position.any()
+        else:
+            assert ok
+            assert np.abs(position - expected).max() <= 1
+
+
+def test_free_angle_reaches_targets():
+
+    targets = _targets()
+    positions, reachable = compute_ik_many(targets)
+
+    # The free angle may differ from compute_ik, the reached point must not
+    for target, ok in zip(targets, reachable):
+        try:
+            compute_ik(tuple(target))
+        except ValueError:
+            assert not ok
+        else:
+            assert ok
+
+    errors = np.linalg.norm(compute_fk_many(positions[reachable]) - targets[reachable], axis=1)
+    assert errors.max() < 5
+
+
+def test_per_row_approach_angles():
+
+    targets = _targets()[:50]
+    angles = np.where(np.arange(50) % 2, 0.0, FREE_ANGLE)
+
+    positions, reachable = compute_ik_many(targets, 500, angles)
+
+    for target, angle, position, ok in zip(targets, angles, positions, reachable):
+        single, single_ok = compute_ik_many(target[None], 500, angle)
+        assert ok == single_ok[0]
+        assert (position == single[0]).all()
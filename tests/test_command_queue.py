@@ -0,0 +1,93 @@
+from lib import servo_controller
+from lib.protocol import CMD_SERVO_MOVE, decode_frame, decode_move
+from lib.servo_controller import move_servos, use_queue, wait_idle
+from lib.transport import SimulatedTransport
+
+import pytest
+
+
+@pytest.fixture
+def realtime(monkeypatch):
+
+    """Real time simulation (the queue holds moves on the transport clock), with the moves written"""
+
+    transport = SimulatedTransport()
+    moves = list()
+    write = transport.write
+
+    def recording(buf):
+        command, params = decode_frame(buf)
+        if command == CMD_SERVO_MOVE:
+            moves.append(decode_move(params))
+        return write(buf)
+
+    monkeypatch.setattr(transport, "write", recording)
+
+    servo_controller.set_transport(transport)
+    yield transport, moves
+
+    use_queue(None)
+    servo_controller.set_transport(None)
+
+
+def test_moves_without_wait_share_a_frame(realtime):
+
+    transport, moves = realtime
+    queue = use_queue(min_gap=0.01, hold=0.05)
+
+    move_servos((6, ), (400, ), 500, wait=False)
+    move_servos((5, ), (450, ), 500, wait=False)
+    move_servos((6, ), (420, ), 500, wait=False)
+    wait_idle()
+
+    assert moves == [((6, 5), (420, 450), 500)]
+    assert (queue.moves, queue.frames, queue.superseded, queue.saved) == (3, 1, 1, 2)
+    assert transport.servos[6].target == 420
+
+
+def test_different_durations_are_not_merged(realtime):
+
+    transport, moves = realtime
+    use_queue(min_gap=0.01, hold=0.05)
+
+    move_servos((6, ), (400, ), 500, wait=False)
+    move_servos((5, ), (450, ), 300, wait=False)
+    wait_idle()
+
+    assert moves == [((6, ), (400, ), 500), ((5, ), (450, ), 300)]
+
+
+def test_min_gap_between_frames(realtime, monkeypatch):
+
+    transport, moves = realtime
+    queue = use_queue(min_gap=0.05, hold=0.0)
+
+    times = list()
+    write = transport.write
+    monkeypatch.setattr(transport, "write", lambda buf: times.append(transport.now()) or write(buf))
+
+    for position in (400, 410, 420):
+        move_servos((6, ), (position, ), 100 + position, wait=False)
+    queue.close()
+
+    assert len(times) == 3
+    assert min(b - a for a, b in zip(times, times[1:])) >= 0.05 - 1e-3
+
+
+def test_wait_writes_at_once(realtime):
+
+    transport, moves = realtime
+    use_queue(min_gap=0.01, hold=10)
+
+    move_servos((6, ), (400, ), 100)
+
+    assert moves == [((6, ), (400, ), 100)]
+    assert transport.servos[6].position(transport.now()) == 400
+
+
+def test_idle_queue(hardware_like):
+
+    # Nothing was ever written, nothing to wait for (the atexit hook of every program that ends idle)
+    queue = use_queue()
+    queue.wait_idle()
+    wait_idle()
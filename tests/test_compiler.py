@@ -0,0 +1,93 @@
+from lib import compiler
+from lib.compiler import CompileError, Program, cached, compile_enabled, compile_program, execute, trace
+from lib.protocol import FrameEncoder
+
+import textwrap
+
+import pytest
+
+
+def _app(tmp_path, source: str) -> str:
+
+    path = tmp_path / "main.py"
+    path.write_text(textwrap.dedent(source))
+
+    return str(path)
+
+
+MOVES = """\
+    # xarm: compile
+    from lib.arm import movej
+
+    print("side effect")
+    movej((500, 400, 600, 500, 500), 1000)
+    movej((500, 500, 500, 500, 500), 500)
+"""
+
+
+def test_opt_in(tmp_path):
+
+    assert compile_enabled(_app(tmp_path, MOVES))
+    assert not compile_enabled(_app(tmp_path, "from lib.arm import movej\n"))
+
+
+def test_trace(tmp_path, capsys):
+
+    program = trace(_app(tmp_path, MOVES))
+
+    assert len(program) == 2
+    assert program.frames[1][0] == pytest.approx(1.05)
+    assert program.duration == pytest.approx(1.6)
+    assert program.reads == 0
+
+    # Nothing printed by the app while it is compiled
+    assert capsys.readouterr().out == ""
+
+
+def test_endless_app_is_rejected(tmp_path):
+
+    path = _app(tmp_path, """\
+        from lib.arm import movej
+
+        while True:
+            movej((500, 500, 500, 500, 500), 1000)
+    """)
+
+    with pytest.raises(CompileError):
+        trace(path, max_duration=10)
+
+
+def test_cache(tmp_path):
+
+    path = _app(tmp_path, MOVES)
+    assert cached(path) is None
+
+    program = compile_program(path)
+    loaded = cached(path)
+
+    assert [(t, bytes(f)) for t, f in loaded.frames] == [(t, bytes(f)) for t, f in program.frames]
+
+
+def test_apps_that_read_run_from_source_in_a_fresh_process(tmp_path, monkeypatch):
+
+    path = _app(tmp_path, """\
+        # xarm: compile
+        from lib.arm import motors_on
+
+        motors_on()
+    """)
+
+    calls = list()
+    monkeypatch.setattr(compiler.subprocess, "call", lambda args: calls.append(args) or 3)
+
+    assert compiler.run(path) == 3
+    assert calls[0][1] == path
+
+
+def test_execute_running_late(hardware_like):
+
+    # The first deadline is already past when the first frame is written
+    frame = bytes(FrameEncoder().move((3, ), (600, ), 10))
+    execute(Program([(0.0, frame), (0.001, frame)], 0.002))
+
+    assert hardware_like.servos[3].target == 600
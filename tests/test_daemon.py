@@ -0,0 +1,136 @@
+from lib import daemon
+from lib.daemon import ArmDaemon, CoalescedReader, DaemonTransport
+from lib import servo_controller
+
+import os
+import stat
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def slow_device(monkeypatch):
+
+    """get_servos_position that blocks until released, each read returns its own number"""
+
+    state = {"reads": 0}
+    started = threading.Event()
+    release = threading.Event()
+
+    def read(servos_id, timeout=0.5):
+        state["reads"] += 1
+        number = state["reads"]
+        started.set()
+        release.wait(5)
+        return (number, ) * len(servos_id)
+
+    monkeypatch.setattr(daemon.servo_controller, "get_servos_position", read)
+
+    return started, release
+
+
+def _read_in_thread(reader: CoalescedReader, after: int, results: list) -> threading.Thread:
+
+    thread = threading.Thread(target=lambda: results.append(reader.read((1, ), after)))
+    thread.start()
+
+    return thread
+
+
+def _wait_requests(reader: CoalescedReader, count: int) -> None:
+
+    while reader.requests < count:
+        threading.Event().wait(0.001)
+
+
+def test_reads_in_flight_are_shared(slow_device):
+
+    started, release = slow_device
+    reader = CoalescedReader(threading.Lock())
+    results = list()
+
+    first = _read_in_thread(reader, 0, results)
+    started.wait(5)
+    second = _read_in_thread(reader, 0, results)
+    _wait_requests(reader, 2)
+
+    release.set()
+    first.join()
+    second.join()
+
+    assert results == [(1, ), (1, )]
+    assert reader.reads == 1
+
+
+def test_read_after_a_write_is_not_shared_with_an_older_read(slow_device):
+
+    started, release = slow_device
+    reader = CoalescedReader(threading.Lock())
+    results = list()
+
+    first = _read_in_thread(reader, 0, results)
+    started.wait(5)
+
+    # Another client writes a move while the read is in flight, then reads
+    after = reader.written()
+    second = _read_in_thread(reader, after, results)
+    _wait_requests(reader, 2)
+
+    release.set()
+    first.join()
+    second.join()
+
+    assert sorted(results) == [(1, ), (2, )]
+    assert reader.reads == 2
+
+
+def test_live_socket_is_kept(sim, tmp_path):
+
+    path = str(tmp_path / "xarm.sock")
+    server = ArmDaemon(path, sim)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    try:
+        with pytest.raises(OSError):
+            ArmDaemon(path, sim)
+
+        # Still served
+        client = DaemonTransport(path)
+        client.write(servo_controller._encoder().read_positions((3, )))
+        assert client.read(64)
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_stale_socket_is_replaced(sim, tmp_path):
+
+    path = str(tmp_path / "xarm.sock")
+    open(path, "w").close()
+
+    server = ArmDaemon(path, sim)
+    server.server_close()
+
+    assert os.path.exists(path)
+
+
+def test_socket_is_private(sim, tmp_path):
+
+    path = str(tmp_path / "xarm.sock")
+    umask = os.umask(0o022)
+
+    try:
+        server = ArmDaemon(path, sim)
+    finally:
+        os.umask(umask)
+
+    try:
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+        # The umask of the process is left as it was
+        assert os.umask(umask) == umask
+    finally:
+        server.server_close()
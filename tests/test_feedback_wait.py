@@ -0,0 +1,68 @@
+from lib import servo_controller
+from lib.servo_controller import FEEDBACK_LEAD, FEEDBACK_TIMEOUT, MotionTimeoutError, move_servos, use_queue
+
+import pytest
+
+
+def _stall(transport, servo_id: int) -> None:
+    transport.servos[servo_id].move = lambda *args, **kwargs: None
+
+
+def test_returns_before_the_fixed_wait(sim):
+
+    move_servos((5, 6), (400, 600), 1000, wait="feedback")
+
+    # Within the tolerance before the move ends, the fixed wait would end at 1.05 s
+    assert 1 - FEEDBACK_LEAD <= sim.now() < 1.05
+    assert sim.servos[5].position(sim.now()) == pytest.approx(400, abs=servo_controller.FEEDBACK_TOLERANCE)
+
+
+def test_stalled_servo_raises_with_residuals(sim):
+
+    _stall(sim, 5)
+
+    with pytest.raises(MotionTimeoutError) as error:
+        move_servos((5, 6), (300, 600), 500, wait="feedback")
+
+    assert isinstance(error.value, TimeoutError)
+    assert error.value.residuals == {5: -200, 6: 0}
+    assert sim.now() >= 0.5 + FEEDBACK_TIMEOUT
+
+
+def test_short_move(hardware_like):
+
+    # Shorter than FEEDBACK_LEAD
+    move_servos((6, ), (505, ), 10, wait="feedback")
+    assert hardware_like.servos[6].target == 505
+
+
+def test_slow_read(hardware_like):
+
+    # Every read takes longer than FEEDBACK_PERIOD
+    hardware_like.read_latency = servo_controller.FEEDBACK_PERIOD * 2
+    _stall(hardware_like, 6)
+
+    with pytest.raises(MotionTimeoutError):
+        move_servos((6, ), (600, ), 100, wait="feedback")
+
+
+def test_slow_read_arrives(hardware_like):
+
+    hardware_like.read_latency = servo_controller.FEEDBACK_PERIOD * 2
+    move_servos((6, ), (600, ), 100, wait="feedback")
+
+    assert hardware_like.servos[6].position(hardware_like.now()) == 600
+
+
+def test_through_the_queue(sim):
+
+    use_queue()
+    move_servos((4, ), (700, ), 300, wait="feedback")
+
+    assert 0.3 - FEEDBACK_LEAD <= sim.now() < 0.35
+
+
+def test_invalid_wait(sim):
+
+    with pytest.raises(ValueError):
+        move_servos((4, ), (700, ), 300, wait="yes")
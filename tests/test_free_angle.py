@@ -0,0 +1,95 @@
+from lib.inverse_kinematics import InverseK, DEGREE_STEP, DOUBLE_PI, PI, _base, _upperarm, _forearm, _hand
+
+import math
+import random
+
+import pytest
+
+
+def _sweep(ik: InverseK, x: float, y: float):
+
+    # The original search: lowest phi every DEGREE_STEP
+    phi = -DOUBLE_PI
+    while phi < DOUBLE_PI:
+        if ik._solve(x, y, phi):
+            return phi
+        phi += DEGREE_STEP
+
+    return None
+
+
+def _planar_targets(count: int):
+
+    rng = random.Random(0)
+    return [(rng.uniform(-300, 300), rng.uniform(-100, 350)) for _ in range(count)]
+
+
+def _wrapped(a: float, b: float) -> float:
+    return abs((a - b + PI) % DOUBLE_PI - PI)
+
+
+def test_same_targets_as_sweep():
+
+    ik = InverseK(_base, _upperarm, _forearm, _hand)
+    probe = InverseK(_base, _upperarm, _forearm, _hand)
+
+    for x, y in _planar_targets(500):
+        ik._currentPhi = -DOUBLE_PI
+        solved, _ = ik._search_free_angle(x, y)
+
+        assert solved == (_sweep(probe, x, y) is not None)
+
+
+def test_cold_reachable_targets_need_few_solves():
+
+    ik = InverseK(_base, _upperarm, _forearm, _hand)
+    probe = InverseK(_base, _upperarm, _forearm, _hand)
+
+    targets = [(x, y) for x, y in _planar_targets(2000) if _sweep(probe, x, y) is not None]
+    sweep = 0
+    search = 0
+    for x, y in targets:
+        sweep += round((_sweep(probe, x, y) + DOUBLE_PI) / DEGREE_STEP) + 1
+
+        ik._currentPhi = -DOUBLE_PI
+        search += ik._search_free_angle(x, y)[1]
+
+    # Solves are the bulk of the cost
+    assert search * 10 < sweep
+
+
+def test_warm_start():
+
+    ik = InverseK(_base, _upperarm, _forearm, _hand)
+
+    # The last phi is tried first
+    ik.solve(200, 0, 100)
+    assert ik._search_free_angle(200, 100) == (True, 1)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_closest_phi(seed):
+
+    ik = InverseK(_base, _upperarm, _forearm, _hand, closest_phi=True)
+    probe = InverseK(_base, _upperarm, _forearm, _hand)
+
+    rng = random.Random(seed)
+    x, z = 180, 100
+    ik._search_free_angle(x, z)
+
+    for _ in range(150):
+        nx, nz = x + rng.uniform(-15, 15), z + rng.uniform(-15, 15)
+        before = ik._currentPhi
+
+        solved, _ = ik._search_free_angle(nx, nz)
+        if not solved:
+            continue
+        x, z = nx, nz
+
+        # No phi on the DEGREE_STEP grid is closer than the chosen one by more than a step
+        closest = min(_wrapped(phi, before) for phi in _grid() if probe._solve(nx, nz, phi))
+        assert _wrapped(ik._currentPhi, before) <= closest + DEGREE_STEP
+
+
+def _grid():
+    return [-DOUBLE_PI + i * DEGREE_STEP for i in range(int(2 * DOUBLE_PI / DEGREE_STEP))]
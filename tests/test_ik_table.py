@@ -0,0 +1,123 @@
+from lib import cartesian
+from lib.cartesian import compute_ik, compute_ik_many, compute_fk
+from lib.ik_table import IKTable, build_table
+from lib.inverse_kinematics import FREE_ANGLE
+
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+
+LOW = (100, -60, 0)
+HIGH = (220, 60, 120)
+STEP = 10
+ANGLE = math.radians(-45)
+
+
+@pytest.fixture
+def table(tmp_path):
+
+    path = str(tmp_path / "table.bin")
+    build_table(path, LOW, HIGH, STEP, (FREE_ANGLE, ANGLE))
+
+    table = IKTable(path)
+    yield table
+    table.close()
+
+
+def _targets(count=200):
+    return [tuple(t) for t in np.random.default_rng(0).uniform(LOW, HIGH, size=(count, 3))]
+
+
+def _corners_reachable(target: tuple, approach_angle: float) -> bool:
+
+    cell = [math.floor((t - o) / STEP) for t, o in zip(target, LOW)]
+    corners = np.array([[o + (i + d) * STEP for o, i, d in zip(LOW, cell, offset)] for offset in itertools.product((0, 1), repeat=3)])
+
+    return bool(compute_ik_many(corners, approach_angle=approach_angle)[1].all())
+
+
+def test_fixed_angle_matches_compute_ik(table):
+
+    hits = 0
+    for target in _targets():
+        pos = table.lookup(target, 400, ANGLE)
+        if pos is None:
+            continue
+
+        hits += 1
+        expected = compute_ik(target, 400, ANGLE)
+
+        assert max(abs(p - e) for p, e in zip(pos, expected)) <= 20
+        assert pos[4] == pos[0] + 100
+        assert max(abs(f - t) for f, t in zip(compute_fk(pos), target)) <= table.tolerance + 1
+
+    assert hits > 50
+    assert table.hits == hits
+
+
+def test_free_angle_within_tolerance(table):
+
+    hits = 0
+    for target in _targets():
+        pos = table.lookup(target, 300, FREE_ANGLE)
+        if pos is None:
+            continue
+
+        hits += 1
+        assert pos[4] == 300
+        assert max(abs(f - t) for f, t in zip(compute_fk(pos), target)) <= table.tolerance + 1
+
+    assert hits > 100
+
+
+def test_outside_of_the_grid(table):
+
+    assert table.lookup((0, 0, 500)) is None
+    assert table.lookup((HIGH[0] + 1, 0, 50)) is None
+    assert table.lookup((LOW[0] - 1, 0, 50), approach_angle=ANGLE) is None
+
+    # Approach angle that was not precomputed
+    assert table.lookup((150, 0, 50), approach_angle=0.0) is None
+    assert table.misses == 4
+
+
+def test_near_joint_limits(table):
+
+    # Cells with an unreachable corner are left to the exact solver
+    partial = [t for t in _targets(400) if not _corners_reachable(t, ANGLE)]
+
+    assert partial
+    assert all(table.lookup(target, 500, ANGLE) is None for target in partial)
+
+
+def test_spread(tmp_path):
+
+    path = str(tmp_path / "table.bin")
+    build_table(path, LOW, HIGH, STEP, (ANGLE, ))
+
+    table = IKTable(path, max_spread=0)
+    assert all(table.lookup(target, 500, ANGLE) is None for target in _targets(50))
+    table.close()
+
+
+def test_compute_ik_falls_back(tmp_path):
+
+    path = str(tmp_path / "table.bin")
+    build_table(path, LOW, HIGH, STEP, (ANGLE, ))
+
+    target = (150.0, 0.0, 400.0)
+    try:
+        cartesian.use_ik_table(path)
+        with pytest.raises(ValueError):
+            compute_ik(target, 500, ANGLE)
+
+        table = cartesian.ik_table
+        assert table.misses == 1
+    finally:
+        cartesian.use_ik_table(None)
+
+    assert cartesian.ik_table is None
+    assert table._map.closed
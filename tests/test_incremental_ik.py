@@ -0,0 +1,73 @@
+from lib.cartesian import compute_fk, compute_ik, compute_ik_incremental
+from lib.inverse_kinematics import FREE_ANGLE
+
+import math
+
+import numpy as np
+import pytest
+
+
+START = (150, 0, 100)
+
+# Start of the jogs for each approach angle, away from the edge of its workspace
+STARTS = {FREE_ANGLE: START, math.radians(-45): (160, 0, 40), 0.0: (160, 0, 160)}
+
+
+def _hand_angle(pos: tuple) -> float:
+
+    # Servo units, see lib.workspace for the conversion to the approach angle
+    return (pos[1] - 500) - (pos[2] - 500) + (pos[3] - 500)
+
+
+def _jogs(count=50, step=5.0):
+
+    rng = np.random.default_rng(0)
+    for direction in rng.normal(size=(count, 3)):
+        yield tuple(direction / np.linalg.norm(direction) * step)
+
+
+@pytest.mark.parametrize("approach_angle", list(STARTS))
+def test_small_jogs(approach_angle):
+
+    start = STARTS[approach_angle]
+    current = compute_ik(start, 500, approach_angle)
+    max_error = 1.0
+
+    for jog in _jogs():
+        target = tuple(s + j for s, j in zip(start, jog))
+        pos = compute_ik_incremental(target, current, 500, approach_angle, max_error)
+
+        # Within max_error before rounding to servo units
+        assert math.dist(compute_fk(pos, rounded=False), target) <= max_error + 1.5
+
+        # Same branch as the start, a few units away
+        assert max(abs(p - c) for p, c in zip(pos, current)) < 60
+
+        if approach_angle != FREE_ANGLE:
+            assert abs(_hand_angle(pos) - _hand_angle(current)) <= 3
+            assert pos[4] == pos[0]
+
+
+def test_chained_jogs():
+
+    approach_angle = math.radians(-45)
+    target = STARTS[approach_angle]
+    current = compute_ik(target, 500, approach_angle)
+
+    # 20 steps of 2 mm along y, each from the previous result
+    for _ in range(20):
+        target = (target[0], target[1] + 2, target[2])
+        current = compute_ik_incremental(target, current, 500, approach_angle)
+
+    assert math.dist(compute_fk(current, rounded=False), target) <= 2.5
+
+
+def test_far_target():
+
+    current = compute_ik(START)
+
+    with pytest.raises(ValueError):
+        compute_ik_incremental((-150, 0, 100), current)
+
+    with pytest.raises(ValueError):
+        compute_ik_incremental((0, 0, 1000), current)
@@ -0,0 +1,131 @@
+from lib import instrumentation
+from lib.servo_controller import get_servos_position, move_servos
+
+import json
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def toggled(monkeypatch):
+
+    monkeypatch.setattr(instrumentation, "enabled", False)
+    yield
+    instrumentation.reset()
+
+
+def test_enabled_during_a_read(sim, toggled, monkeypatch):
+
+    read = sim.read
+
+    def enabling(size, timeout_ms=0):
+        instrumentation.enabled = True
+        return read(size, timeout_ms)
+
+    monkeypatch.setattr(sim, "read", enabling)
+
+    assert get_servos_position((3, )) == (500, )
+    assert "get_servos_position" not in instrumentation.histograms
+
+
+def test_enabled_during_a_move(sim, toggled, monkeypatch):
+
+    write = sim.write
+
+    def enabling(buf):
+        instrumentation.enabled = True
+        return write(buf)
+
+    monkeypatch.setattr(sim, "write", enabling)
+    move_servos((3, ), (600, ), 100)
+
+    # The next call is measured
+    move_servos((3, ), (500, ), 100)
+    assert instrumentation.histograms["move_servos.write"].count == 1
+
+
+def test_histogram_buckets_and_percentiles():
+
+    histogram = instrumentation.Histogram()
+    for value in [0.5] + [3] * 89 + [100] * 10:
+        histogram.add(value)
+
+    # Bucket i counts [2^(i-1), 2^i)
+    assert histogram.buckets[0] == 1
+    assert histogram.buckets[2] == 89
+    assert histogram.buckets[7] == 10
+    assert sum(histogram.buckets) == histogram.count == 100
+
+    assert histogram.percentile(0.5) == 4.0
+    assert histogram.percentile(0.9) == 4.0
+    assert histogram.percentile(0.99) == 128.0
+    assert histogram.percentile(0.01) == 1.0
+
+    assert histogram.min == 0.5
+    assert histogram.max == 100
+    assert instrumentation.Histogram().percentile(0.5) == 0.0
+
+    # Too large values go to the last bucket
+    histogram.add(2.0 ** 40)
+    assert histogram.buckets[-1] == 1
+
+
+def test_to_json(toggled, tmp_path):
+
+    for value in (10, 20, 30, 1000):
+        instrumentation.record("read", value)
+
+    path = tmp_path / "histograms.json"
+    data = instrumentation.to_json(str(path))
+
+    assert json.loads(path.read_text()) == data
+
+    read = data["read"]
+    assert read["count"] == 4
+    assert read["mean"] == 265
+    assert (read["min"], read["max"]) == (10, 1000)
+    assert read["p50"] == 32.0
+    assert read["p99"] == 1024.0
+    assert read["buckets"][4] == 1 and read["buckets"][5] == 2 and read["buckets"][10] == 1
+
+
+def test_chrome_trace(toggled, tmp_path, monkeypatch):
+
+    times = iter((instrumentation._origin + 1.0, instrumentation._origin + 1.25))
+    monkeypatch.setattr(instrumentation, "clock", lambda: next(times))
+
+    seen = list()
+    instrumentation.add_callback(lambda *args: seen.append(args))
+    try:
+        instrumentation.span("compute_ik", instrumentation.clock())
+        instrumentation.record("plain", 5)
+    finally:
+        instrumentation.callbacks.clear()
+
+    assert seen == [("compute_ik", pytest.approx(250000), instrumentation._origin + 1.0), ("plain", 5, None)]
+
+    path = tmp_path / "trace.json"
+    instrumentation.to_chrome_trace(str(path))
+    trace = json.loads(path.read_text())
+
+    # Plain values are not spans
+    event, = trace["traceEvents"]
+    assert event["name"] == "compute_ik"
+    assert event["ph"] == "X"
+    assert event["ts"] == pytest.approx(1e6)
+    assert event["dur"] == pytest.approx(250000)
+    assert event["pid"] == 0
+    assert event["tid"] == threading.get_ident()
+    assert trace["displayTimeUnit"] == "ms"
+
+
+def test_trace_size(toggled, monkeypatch):
+
+    monkeypatch.setattr(instrumentation, "trace", instrumentation.trace)
+    instrumentation.enable(trace_size=3)
+    for i in range(5):
+        instrumentation.record("span", i, float(i))
+
+    assert [start for _, start, _, _ in instrumentation.trace] == [2.0, 3.0, 4.0]
+    assert instrumentation.histograms["span"].count == 5
@@ -0,0 +1,70 @@
+from lib.multi_arm import Arm, move_all, read_all
+from lib.transport import SimulatedTransport
+
+import math
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def arms():
+
+    arms = [Arm(transport=SimulatedTransport(math.inf)) for _ in range(3)]
+    yield arms
+
+    for a in arms:
+        a.close()
+
+
+def _bounded(function, *args, **kwargs):
+
+    # Fails instead of hanging the test suite on a deadlock
+    result = dict()
+
+    def target():
+        try:
+            result["value"] = function(*args, **kwargs)
+        except BaseException as error:
+            result["error"] = error
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive(), "deadlock"
+
+    return result
+
+
+def test_move_all(arms):
+
+    joints = [(500, 400 + i * 10, 600, 500, 500) for i in range(3)]
+    move_all(arms, joints, 1000)
+
+    assert read_all(arms, (5, )) == [(400, ), (410, ), (420, )]
+
+
+def test_failing_arm_releases_the_others(arms):
+
+    result = _bounded(move_all, arms, [(500, 500, 500, 500, 500), None, (500, 500, 500, 500, 500)], 1000)
+    assert isinstance(result["error"], TypeError)
+
+
+def test_closed_arm_releases_the_others(arms):
+
+    arms[2].executor.shutdown()
+
+    result = _bounded(move_all, arms, [(500, 500, 500, 500, 500)] * 3, 1000)
+    assert isinstance(result["error"], RuntimeError)
+
+
+def test_barrier_timeout(arms):
+
+    # An arm still busy with a queued command long after the others gave up
+    release = threading.Event()
+    arms[1].submit(release.wait)
+    threading.Timer(0.5, release.set).start()
+
+    result = _bounded(move_all, arms, [(500, 500, 500, 500, 500)] * 3, 1000, timeout=0.1)
+
+    assert isinstance(result["error"], threading.BrokenBarrierError)
@@ -0,0 +1,108 @@
+from lib import paths
+from lib.cartesian import compute_fk, compute_ik
+
+import math
+
+import pytest
+
+
+START = (150, -100, 50)
+VIA = (220, 0, 50)
+END = (150, 100, 50)
+
+# Fixed so the solver can't switch branches along the path
+ANGLE = math.radians(-30)
+
+
+def _distance(a: tuple, b: tuple) -> float:
+    return math.sqrt(sum((x - y) ** 2 for x, y in zip(a, b)))
+
+
+def test_arc_through_via():
+
+    point = paths.arc(START, VIA, END)
+
+    assert point(0) == pytest.approx(START)
+    assert point(1) == pytest.approx(END)
+
+    samples = [point(i / 1000) for i in range(1001)]
+    assert min(_distance(p, VIA) for p in samples) < 0.5
+
+    # Constant speed along the arc
+    distances = [_distance(samples[i], samples[i + 1]) for i in range(1000)]
+    assert max(distances) == pytest.approx(min(distances), rel=1e-6)
+
+
+def test_arc_in_3d():
+
+    start, via, end = (100, 0, 0), (0, 100, 50), (-100, 0, 100)
+    point = paths.arc(start, via, end)
+
+    assert point(1) == pytest.approx(end)
+    assert min(_distance(point(i / 1000), via) for i in range(1001)) < 0.5
+
+
+def test_aligned_points():
+
+    with pytest.raises(ValueError):
+        paths.arc(START, (150, 0, 50), END)
+
+    with pytest.raises(ValueError):
+        paths.arc(START, START, END)
+
+
+def test_line():
+
+    point = paths.line(START, END)
+
+    assert point(0) == START
+    assert point(0.25) == pytest.approx((150, -50, 50))
+    assert point(1) == END
+
+
+def test_segments_grow_as_tolerance_shrinks():
+
+    start = compute_ik(START, 500, ANGLE)
+    counts = [len(paths.segment(paths.line(START, END), start, tolerance, 500, ANGLE)) for tolerance in (5, 1, 0.5, 0.2)]
+
+    assert counts == sorted(counts)
+    assert counts[-1] > counts[0]
+
+
+@pytest.mark.parametrize("path", [paths.line(START, END), paths.arc(START, VIA, END)])
+def test_segments_within_tolerance(path):
+
+    tolerance = 1.0
+    segments = paths.segment(path, compute_ik(START, 500, ANGLE), tolerance, 500, ANGLE)
+
+    assert segments[-1][0] == 1.0
+    assert _distance(compute_fk(segments[-1][1], rounded=False), END) <= 2
+    assert [t for t, _ in segments] == sorted(t for t, _ in segments)
+
+    # The joint midpoint of each segment is on the path
+    previous = (0.0, compute_ik(START, 500, ANGLE))
+    for t, joint in segments:
+        middle = tuple((a + b) / 2 for a, b in zip(previous[1], joint))
+        assert _distance(compute_fk(middle, rounded=False), path((previous[0] + t) / 2)) <= tolerance
+        previous = (t, joint)
+
+
+def test_max_depth():
+
+    segments = paths.segment(paths.arc(START, VIA, END), compute_ik(START, 500, ANGLE), 0.01, 500, ANGLE, max_depth=3)
+    assert len(segments) <= 2 ** 3
+
+
+def test_invalid_tolerance():
+
+    with pytest.raises(ValueError):
+        paths.segment(paths.line(START, END), compute_ik(START, 500, ANGLE), 0, 500, ANGLE)
+
+
+def test_timed():
+
+    joints, durations = paths.timed([(0.3, "a"), (0.5, "b"), (1.0, "c")], 1001)
+
+    assert joints == ["a", "b", "c"]
+    assert durations == [300, 200, 501]
+    assert sum(durations) == 1001
@@ -0,0 +1,104 @@
+from lib.cartesian import compute_ik
+from lib.planner import plan, travel_times, _nearest_neighbour
+
+import math
+
+import numpy as np
+import pytest
+
+
+def _targets(count: int, seed=0) -> list:
+
+    # Reachable area in front of the arm
+    rng = np.random.default_rng(seed)
+    return [tuple(t) for t in rng.uniform((100, -120, 20), (200, 120, 150), size=(count, 3))]
+
+
+def _duration(order: list, cost) -> float:
+
+    tour = [0] + [index + 1 for index in order]
+    return float(sum(cost[a, b] for a, b in zip(tour, tour[1:])))
+
+
+def test_visits_every_target_once():
+
+    targets = _targets(40)
+    result = plan(targets)
+
+    assert sorted(result.order) == list(range(40))
+    assert result.joints.shape == (40, 5)
+    assert result.duration > 0
+
+
+def test_precedence_respected():
+
+    targets = _targets(60, seed=1)
+    rng = np.random.default_rng(2)
+    precedence = [tuple(rng.choice(60, 2, replace=False)) for _ in range(25)]
+
+    # Make the constraints acyclic: always from the lower index to the higher one
+    precedence = [(min(a, b), max(a, b)) for a, b in precedence]
+
+    result = plan(targets, precedence)
+    position = {target: i for i, target in enumerate(result.order)}
+
+    assert all(position[a] < position[b] for a, b in precedence)
+
+
+def test_cycle():
+
+    with pytest.raises(ValueError):
+        plan(_targets(5), precedence=[(0, 1), (1, 2), (2, 0)])
+
+
+def test_unreachable_targets():
+
+    targets = _targets(6)
+    targets[2] = (0, 0, 1000)
+    targets[4] = (1000, 0, 0)
+
+    with pytest.raises(ValueError, match=r"\[2, 4\]"):
+        plan(targets)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_not_worse_than_nearest_neighbour(seed):
+
+    targets = _targets(50, seed)
+    start = (500, 500, 500, 500, 500)
+    precedence = [(0, 1), (3, 2), (10, 40)]
+    result = plan(targets, precedence, start=start)
+
+    nodes = np.vstack((np.asarray(start, dtype=float).reshape(1, 5), result.joints))
+    cost = travel_times(nodes)
+
+    before = [set() for _ in range(51)]
+    for a, b in precedence:
+        before[b + 1].add(a + 1)
+    greedy = [node - 1 for node in _nearest_neighbour(cost, before)[1:]]
+
+    assert result.duration == pytest.approx(_duration(result.order, cost))
+    assert result.duration <= _duration(greedy, cost) + 1e-9
+
+
+def test_approach_angle_in_degrees():
+
+    targets = [(150, -50, 50), (150, 50, 50)]
+    result = plan(targets, approach_angle=-30)
+
+    assert tuple(result.joints[0]) == compute_ik(targets[0], 500, math.radians(-30))
+
+
+def test_travel_times():
+
+    # 800 units at 800 units/s and 3000 units/s²: max velocity reached
+    times = travel_times([(0, 0, 0, 0, 0), (800, 10, 0, 0, 0)])
+
+    assert times[0, 1] == pytest.approx(1 + 800 / 3000)
+    assert times[1, 0] == times[0, 1]
+    assert times[0, 0] == 0
+
+
+def test_no_targets():
+
+    assert plan([]).order == list()
@@ -0,0 +1,47 @@
+from lib import servo_controller
+from lib.servo_controller import get_servos_position, poll_servos_position, move_servos
+
+import itertools
+
+import pytest
+
+
+def test_returns_the_reply(sim):
+
+    move_servos((3, 4), (200, 800), 100)
+    assert get_servos_position((3, 4)) == (200, 800)
+
+
+def test_no_reply_times_out_on_a_virtual_clock(sim, monkeypatch):
+
+    # The virtual clock never moves while reading
+    monkeypatch.setattr(sim, "read", lambda size, timeout_ms=0: list())
+
+    with pytest.raises(TimeoutError):
+        get_servos_position((3, 4))
+
+
+def test_garbage_replies_time_out(sim, monkeypatch):
+
+    monkeypatch.setattr(sim, "read", lambda size, timeout_ms=0: [0x55, 0x00] * 32)
+
+    with pytest.raises(TimeoutError):
+        get_servos_position((3, 4))
+
+
+def test_stale_reply_is_skipped(sim):
+
+    # A reply to an earlier read of other servos is still queued
+    sim.write(servo_controller._encoder().read_positions((1, )))
+
+    assert get_servos_position((3, 4)) == (500, 500)
+
+
+def test_poll_keeps_going_when_reads_are_late(hardware_like):
+
+    # Each read takes longer than the period, the next sample is due at once
+    hardware_like.read_latency = 0.1
+    samples = list(itertools.islice(poll_servos_position((3, 4), rate=20), 5))
+
+    assert [positions for _, positions in samples] == [(500, 500)] * 5
+    assert samples[-1][0] - samples[0][0] >= 0.4
@@ -0,0 +1,73 @@
+from lib import servo_controller
+from lib.protocol import FrameBatch, FrameEncoder, decode_frame, decode_move, parse_positions, encode_positions_into
+
+import pytest
+
+
+# Captured from the original servo_controller and the LOBOT bus servo controller protocol documentation
+# (CMD_SERVO_MOVE length = servo count * 3 + 5)
+CAPTURES = [
+    # move_servo(1, 1000, 1000)
+    ("move", ((1, ), (1000, ), 1000), "00 55 55 08 03 01 e8 03 01 e8 03"),
+    # Servo 2 to 1200 and servo 9 to 2300 within 800 ms, the documentation example
+    ("move", ((2, 9), (1200, 2300), 800), "00 55 55 0b 03 02 20 03 02 b0 04 09 fc 08"),
+    ("unload", ((1, 2, 3, 4, 5, 6), ), "00 55 55 09 14 06 01 02 03 04 05 06"),
+    ("read_positions", ((6, 5, 4, 3, 2), ), "00 55 55 08 15 05 06 05 04 03 02"),
+]
+
+
+@pytest.mark.parametrize("method, args, capture", CAPTURES)
+def test_frame_bytes(method, args, capture):
+
+    assert bytes(getattr(FrameEncoder(), method)(*args)) == bytes.fromhex(capture)
+
+
+def test_move_servos_writes_the_captured_frame(sim, monkeypatch):
+
+    written = list()
+    monkeypatch.setattr(sim, "write", lambda buf: written.append(bytes(buf)) or len(buf))
+
+    servo_controller.move_servos((2, 9), (1200, 2300), 800, wait=False)
+
+    assert written == [bytes.fromhex("00 55 55 0b 03 02 20 03 02 b0 04 09 fc 08")]
+
+
+def test_batch_matches_encoder():
+
+    moves = [((6, 5, 4), (100, 200, 300), 20), ((3, ), (999, ), 65535), ((2, 3, 4, 5, 6), (0, 1, 2, 3, 4), 1)]
+    batch = FrameBatch(moves)
+
+    assert len(batch) == len(moves)
+    for frame, move in zip(batch, moves):
+        assert bytes(frame) == bytes(FrameEncoder().move(*move))
+
+        command, params = decode_frame(frame)
+        assert decode_move(params) == move
+
+
+def test_parse_positions_resynchronises():
+
+    reply = bytearray(64)
+    encode_positions_into(reply, 3, (6, 5), (123, 877))
+    reply[0:2] = b"\x55\x55"
+
+    assert parse_positions(reply, (6, 5)) == (123, 877)
+    assert parse_positions(reply, (5, 6)) is None
+
+
+def test_write_batch_uses_the_frame_durations(sim):
+
+    batch = FrameBatch([((3, ), (600, ), 100), ((3, ), (700, ), 250)])
+    servo_controller.write_batch(batch)
+
+    assert sim.now() == pytest.approx(0.35)
+    assert sim.servos[3].target == 700
+
+
+def test_write_batch_running_late(hardware_like):
+
+    # Each clock read takes longer than a frame
+    hardware_like.tick = 0.002
+    servo_controller.write_batch(FrameBatch([((3, ), (500 + i, ), 1) for i in range(10)]))
+
+    assert hardware_like.servos[3].target == 509
@@ -0,0 +1,92 @@
+from lib import arm
+from lib.servo_controller import get_servos_position, get_shadow, move_servos, unload_servos
+from lib.shadow_state import ShadowState
+
+import pytest
+
+
+JOINTS = (6, 5, 4, 3, 2)
+
+
+def test_estimate_during_and_after_a_move(sim):
+
+    move_servos(JOINTS, (500, 500, 500, 500, 500), 1, wait=False)
+    sim.sleep(0.1)
+    move_servos(JOINTS, (700, 300, 500, 500, 500), 1000, wait=False)
+
+    sim.sleep(0.5)
+    assert get_shadow().estimate(JOINTS, sim.now()) == (600, 400, 500, 500, 500)
+    assert get_shadow().estimate(JOINTS, sim.now()) == get_servos_position(JOINTS)
+
+    sim.sleep(1)
+    assert get_shadow().estimate(JOINTS, sim.now()) == (700, 300, 500, 500, 500)
+
+
+def test_unknown_servos(sim):
+
+    state = get_shadow()
+    assert state.estimate(JOINTS, sim.now()) is None
+
+    move_servos(JOINTS, (500, 500, 500, 500, 500), 100)
+    assert state.estimate(JOINTS, sim.now()) is not None
+
+    # Unloaded servos can be moved by hand
+    unload_servos((5, ))
+    assert state.estimate(JOINTS, sim.now()) is None
+
+    with pytest.raises(ValueError):
+        arm.get_position(source="estimate")
+
+
+def test_auto_reads_unknown_servos(sim):
+
+    sim.servos[6].target = sim.servos[6].start = 650
+
+    # Read from the hardware, then estimated until the reconcile interval has passed
+    assert arm.get_position(source="auto")[0] == 650
+    frames = sim.frames
+
+    assert arm.get_position(source="auto")[0] == 650
+    assert sim.frames == frames
+
+    sim.sleep(get_shadow().reconcile_interval + 1)
+    arm.get_position(source="auto")
+    assert sim.frames == frames + 1
+
+
+def test_reconcile_with_a_disagreeing_read(sim):
+
+    move_servos(JOINTS, (500, 500, 500, 500, 500), 1, wait=False)
+    sim.sleep(0.1)
+
+    # Servo 5 is blocked at 500
+    sim.servos[5].move = lambda *args, **kwargs: None
+    move_servos(JOINTS, (500, 800, 500, 500, 500), 1000, wait=False)
+    sim.sleep(0.5)
+
+    state = get_shadow()
+    assert state.estimate((5, ), sim.now()) == (650, )
+
+    assert get_servos_position((5, )) == (500, )
+    assert state.divergence[5] == 150
+    assert state.last_reconcile == sim.now()
+
+    # Still moving: restarts from the measured position towards the commanded target
+    assert state.estimate((5, ), sim.now()) == (500, )
+    sim.sleep(0.25)
+    assert state.estimate((5, ), sim.now()) == (650, )
+    sim.sleep(1)
+    assert state.estimate((5, ), sim.now()) == (800, )
+
+
+def test_reconcile_after_the_move():
+
+    state = ShadowState(reconcile_interval=2)
+    state.commanded((2, ), (600, ), 100, 0.0)
+
+    assert state.reconcile((2, 3), (580, 420), 1.0) == {2: 20}
+    assert state.estimate((2, 3), 1.0) == (580, 420)
+
+    assert not state.needs_reconcile(2.5)
+    assert state.needs_reconcile(3.5)
+    assert ShadowState().needs_reconcile(0.0)
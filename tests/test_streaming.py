@@ -0,0 +1,53 @@
+from lib.streaming import stream
+
+import pytest
+
+
+TARGETS = [(500 + 10 * i, 500, 500 - 10 * i, 500, 500) for i in range(1, 5)]
+
+
+def test_fixed_schedule(sim):
+
+    report = stream(TARGETS, 100)
+
+    assert len(report.segments) == 4
+    assert report.planned == pytest.approx(0.4)
+    assert report.actual == pytest.approx(0.4)
+    assert report.max_lateness == pytest.approx(0)
+
+    # Servos are sent in (6, 5, 4, 3, 2) order
+    assert sim.servos[6].target == 540
+    assert sim.servos[4].target == 460
+    assert sim.now() == pytest.approx(0.45)
+
+
+def test_per_segment_durations(sim):
+
+    report = stream(iter(TARGETS), [100, 200, 300, 400])
+
+    assert [segment.planned for segment in report.segments] == pytest.approx([0.1, 0.2, 0.3, 0.4])
+    assert report.actual == pytest.approx(1.0)
+
+
+def test_mismatched_durations(sim):
+
+    with pytest.raises(ValueError):
+        stream(TARGETS, [100, 200])
+
+    # Nothing was sent
+    assert sim.frames == 0
+
+    # Only known once the durations run out for a generator
+    with pytest.raises(ValueError):
+        stream(iter(TARGETS), [100, 200])
+
+
+def test_invalid_time(sim):
+
+    with pytest.raises(ValueError):
+        stream(TARGETS, 0)
+
+
+def test_no_targets(sim):
+
+    assert stream([], 100).segments == list()
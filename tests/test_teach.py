@@ -0,0 +1,84 @@
+from lib import teach
+from lib.teach import Recording, record, replay
+
+import pytest
+
+
+def _move_by_hand(sim, servo_id: int, position) -> None:
+
+    # Unloaded servos follow position(now) as if moved by hand
+    sim.servos[servo_id].position = position
+
+
+def _ramp(now: float) -> float:
+
+    # Up from 500 to 800 in 1.5 s, then still
+    return 500 + 200 * min(now, 1.5)
+
+
+@pytest.fixture
+def path(sim, tmp_path):
+
+    path = str(tmp_path / "path.rec")
+    _move_by_hand(sim, 3, _ramp)
+
+    assert record(path, rate=20, duration=2.0, servos_id=(2, 3, 4)) == 40
+    return path
+
+
+def test_header_and_samples(path):
+
+    with Recording(path) as recording:
+        assert recording.servos_id == (2, 3, 4)
+        assert recording.rate == 20
+        assert len(recording) == 40
+
+        samples = list(recording.samples())
+
+    assert [t for t, _ in samples] == [i * 50 for i in range(40)]
+    # record waits 0.1 s before unloading the servos
+    assert samples[0][1] == (500, 520, 500)
+    assert samples[-1][1] == (500, 800, 500)
+
+
+@pytest.mark.parametrize("tolerance", [0.5, 2, 50])
+def test_keyframes_within_tolerance(path, tolerance):
+
+    with Recording(path) as recording:
+        samples = list(recording.samples())
+        keyframes = recording.keyframes(tolerance)
+
+    assert keyframes[0] == samples[0]
+    assert keyframes[-1] == samples[-1]
+    assert len(keyframes) < len(samples)
+
+    # Linear interpolation between keyframes reproduces every sample
+    for t, positions in samples:
+        (t0, p0), (t1, p1) = next((a, b) for a, b in zip(keyframes, keyframes[1:]) if a[0] <= t <= b[0])
+        ratio = (t - t0) / (t1 - t0)
+        assert max(abs(a + (b - a) * ratio - c) for a, b, c in zip(p0, p1, positions)) <= tolerance
+
+
+def test_replay(sim, path):
+
+    start = sim.now()
+    frames = replay(path, tolerance=2, approach_time=500)
+
+    with Recording(path) as recording:
+        assert frames == len(recording.keyframes(2))
+
+    assert sim.servos[2].target == 500
+    assert sim.servos[3].target == 800
+    assert sim.servos[4].target == 500
+
+    # Approach, then the recording with its timing
+    assert sim.now() - start == pytest.approx(0.55 + 1.95, abs=0.06)
+
+
+def test_not_a_recording(tmp_path):
+
+    path = tmp_path / "path.rec"
+    path.write_bytes(teach.HEADER.pack(b"NOPE", teach.VERSION, 1, 20.0) + b"\x02")
+
+    with pytest.raises(ValueError):
+        Recording(str(path))
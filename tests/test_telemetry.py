@@ -0,0 +1,96 @@
+from lib.telemetry import RingBuffer, TelemetryPoller
+from lib.transport import SimulatedTransport
+
+import time
+
+import pytest
+
+
+class SilentTransport(SimulatedTransport):
+
+    """Simulated xArm that never answers position reads"""
+
+    def read(self, size: int, timeout_ms=0) -> list:
+        return list()
+
+
+def test_ring_buffer_wraparound():
+
+    buffer = RingBuffer(4)
+    assert buffer.latest() is None
+    assert buffer.last(3) == list()
+
+    for item in range(10):
+        buffer.append(item)
+
+    assert buffer.count == 10
+    assert buffer.latest() == 9
+
+    # The oldest slot may be overwritten while it is read, at most size - 1 items are returned
+    assert buffer.last(2) == [8, 9]
+    assert buffer.last(4) == [7, 8, 9]
+    assert buffer.last(100) == [7, 8, 9]
+
+
+def test_ring_buffer_before_wraparound():
+
+    buffer = RingBuffer(8)
+    for item in range(3):
+        buffer.append(item)
+
+    assert buffer.last(5) == [0, 1, 2]
+
+    with pytest.raises(ValueError):
+        RingBuffer(0)
+
+
+def _wait(condition, timeout=2.0) -> None:
+
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_velocities_during_a_move():
+
+    transport = SimulatedTransport()
+    poller = TelemetryPoller(servos_id=(6, 5), rate=50, transport=transport)
+    poller.start()
+
+    try:
+        _wait(lambda: poller.buffer.count >= 3)
+
+        # No velocity without a previous sample
+        first, *others = poller.buffer.last(3)
+        assert first.velocities is None
+        assert all(sample.velocities == (0, 0) for sample in others)
+
+        # 400 units in 1 s on servo 6
+        transport.servos[6].move(900, 1.0, transport.now())
+        start = poller.buffer.count
+        _wait(lambda: poller.buffer.count >= start + 20)
+
+        sample = poller.buffer.latest()
+        assert 500 < sample.positions[0] < 900
+        assert sample.velocities[0] == pytest.approx(400, rel=0.15)
+        assert sample.velocities[1] == 0
+    finally:
+        poller.stop()
+
+    assert not poller.running
+    assert poller.errors == 0
+
+
+def test_errors_on_timeouts():
+
+    poller = TelemetryPoller(rate=None, timeout=0.01, transport=SilentTransport())
+    poller.start()
+
+    try:
+        _wait(lambda: poller.errors >= 3)
+    finally:
+        poller.stop()
+
+    assert poller.errors >= 3
+    assert isinstance(poller.last_error, TimeoutError)
+    assert poller.buffer.count == 0
@@ -0,0 +1,78 @@
+from lib.trajectory import JointProfile, Trajectory
+
+import random
+
+import pytest
+
+
+def _random_points(rng, count: int) -> list:
+    return [tuple(rng.randint(0, 1000) for _ in range(5)) for _ in range(count)]
+
+
+@pytest.mark.parametrize("count", [2, 3, 5])
+def test_ends_on_the_last_point(count):
+
+    rng = random.Random(count)
+
+    for _ in range(50):
+        points = _random_points(rng, count)
+        trajectory = Trajectory(points)
+
+        assert trajectory.position(0) == pytest.approx(points[0])
+        assert trajectory.position(trajectory.duration) == pytest.approx(points[-1])
+        assert trajectory.position(trajectory.duration + 1) == pytest.approx(points[-1])
+
+
+def test_movep_single_target_reaches_it():
+
+    trajectory = Trajectory([(500, 500, 500, 500, 500), (900, 900, 100, 500, 500)])
+    samples, _ = trajectory.sample(0.04)
+
+    assert samples[-1] == (900, 900, 100, 500, 500)
+
+
+@pytest.mark.parametrize("count", [2, 4])
+def test_limits_hold(count):
+
+    rng = random.Random(10 + count)
+    velocity, acceleration = 600, 2000
+
+    for _ in range(20):
+        trajectory = Trajectory(_random_points(rng, count), velocity, acceleration)
+
+        for profile in trajectory.profiles:
+            for (t0, v0), (t1, v1) in zip(profile.knots, profile.knots[1:]):
+                assert abs(v1) <= velocity + 1e-6
+                if t1 > t0:
+                    assert abs(v1 - v0) / (t1 - t0) <= acceleration + 1e-6
+
+
+def test_per_joint_limits():
+
+    trajectory = Trajectory([(0, 0), (1000, 1000)], max_velocity=(1000, 100), max_acceleration=5000)
+
+    # The slow joint sets the duration
+    assert trajectory.duration >= 10
+    assert max(abs(v) for _, v in trajectory.profiles[0].knots) < 1000
+
+
+def test_too_short_segments_are_invalid():
+
+    # 1000 units in 0.1 s needs far more than 3000 units/s²
+    assert JointProfile([0, 1000], [0.1], 800, 3000).invalid == {0}
+    assert 1 in JointProfile([0, 10, 1000, 1000], [1.0, 0.1, 1.0], 800, 3000).invalid
+    assert JointProfile([0, 1000, 1000], [0.1, 1.0], 800, 3000).invalid == {0}
+
+    # Reachable within acceleration but over the velocity limit
+    assert JointProfile([0, 1000], [1.2], 800, 1e6).invalid == {0}
+
+    assert not JointProfile([0, 1000], [2.0], 800, 3000).invalid
+
+
+def test_needs_two_points():
+
+    with pytest.raises(ValueError):
+        Trajectory([(500, 500, 500, 500, 500)])
+
+    with pytest.raises(ValueError):
+        Trajectory([(0, ), (10, )], max_velocity=0)
@@ -0,0 +1,15 @@
+from lib.daemon import DaemonTransport
+from lib.transport import HIDTransport, SimulatedTransport
+
+import math
+
+import pytest
+
+
+@pytest.mark.parametrize("sleep", [HIDTransport.sleep, DaemonTransport.sleep, SimulatedTransport().sleep,
+                                   SimulatedTransport(math.inf).sleep])
+def test_late_deadlines_do_not_sleep(sleep):
+
+    # Schedulers pass deadline - now, negative when they run late
+    sleep(-0.5)
+    sleep(-math.inf)
@@ -0,0 +1,76 @@
+from lib import compiler
+from lib import worker
+
+import io
+import os
+import sys
+import textwrap
+import time
+
+import pytest
+
+
+APP = """\
+    # xarm: compile
+    from lib.arm import movej
+
+    print("from source")
+    movej((500, 400, 600, 500, 500), 1000)
+"""
+
+
+def _run(monkeypatch, path: str) -> int:
+
+    monkeypatch.setattr(sys, "stdin", io.StringIO(f"{path}\n"))
+    monkeypatch.setattr(sys, "argv", list(sys.argv))
+    monkeypatch.setattr(sys, "path", list(sys.path))
+
+    return worker.main()
+
+
+@pytest.fixture
+def app(tmp_path):
+
+    path = tmp_path / "main.py"
+    path.write_text(textwrap.dedent(APP))
+
+    return str(path)
+
+
+def test_cache_miss_runs_the_source_without_compiling(sim, app, monkeypatch, capsys):
+
+    assert _run(monkeypatch, app) == 0
+
+    assert "from source" in capsys.readouterr().out
+    assert not compiler.is_compiled(app)
+    assert sim.servos[5].target == 400
+
+
+def test_cached_program_is_streamed(sim, app, monkeypatch, capsys):
+
+    compiler.compile_program(app)
+    capsys.readouterr()
+
+    assert _run(monkeypatch, app) == 0
+
+    assert "from source" not in capsys.readouterr().out
+    assert sim.servos[5].target == 400
+
+
+def test_spare_worker_is_dismissed(monkeypatch):
+
+    monkeypatch.setenv("XARM_TRANSPORT", "sim")
+    spare = worker.spawn()
+    start = time.monotonic()
+
+    worker.dismiss(spare)
+
+    assert spare.returncode == 0
+    assert time.monotonic() - start < 5
+
+
+def test_precompile(app):
+
+    process = worker.precompile(app)
+    assert process.wait(30) == 0
+    assert compiler.is_compiled(app)
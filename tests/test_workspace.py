@@ -0,0 +1,81 @@
+from lib import cartesian
+from lib.cartesian import compute_ik
+from lib.inverse_kinematics import FREE_ANGLE
+from lib.workspace import WorkspaceMap, build_map
+
+import math
+
+import numpy as np
+import pytest
+
+
+ANGLES = (FREE_ANGLE, math.radians(-90), math.radians(-45), 0.0, math.radians(30))
+
+
+@pytest.fixture(scope="module")
+def map_path(tmp_path_factory):
+
+    # Coarse so it builds quickly, still conservative thanks to the one voxel growth
+    path = str(tmp_path_factory.mktemp("workspace") / "workspace.bin")
+    build_map(path, voxel=20, step=12)
+
+    return path
+
+
+@pytest.fixture
+def workspace(map_path):
+
+    workspace = WorkspaceMap(map_path)
+    yield workspace
+    workspace.close()
+
+
+def test_solved_targets_are_accepted(workspace):
+
+    solved = 0
+    for target in np.random.default_rng(0).uniform(-350, 350, size=(1500, 3)):
+        target = tuple(target)
+
+        for angle in ANGLES:
+            try:
+                compute_ik(target, 500, angle)
+            except ValueError:
+                continue
+
+            solved += 1
+            assert workspace.reachable(target, angle), (target, angle)
+
+    assert solved > 500
+
+
+def test_far_targets_are_rejected(workspace):
+
+    for target in ((0, 0, 1000), (600, 0, 0), (-400, -400, 100), (0, 500, 200)):
+        assert workspace.mask(target) == 0
+        assert not workspace.reachable(target)
+        assert not workspace.reachable(target, 0.0)
+
+
+def test_rejects_most_unreachable_targets(workspace):
+
+    rejected = unreachable = 0
+    for target in np.random.default_rng(1).uniform(-350, 350, size=(500, 3)):
+        try:
+            compute_ik(tuple(target))
+        except ValueError:
+            unreachable += 1
+            rejected += not workspace.reachable(tuple(target))
+
+    assert rejected > unreachable / 2
+
+
+def test_compute_ik_rejects_before_solving(map_path):
+
+    try:
+        cartesian.use_workspace_map(map_path)
+        with pytest.raises(ValueError):
+            compute_ik((0, 0, 1000))
+
+        assert compute_ik((150, 0, 100)) is not None
+    finally:
+        cartesian.use_workspace_map(None)